@@ -0,0 +1,60 @@
+import os
+from typing import Dict, Iterable, List
+
+from metrics import REGISTRY
+
+AGENT_INDEX_KEY = "agent_index"
+AGENT_LOOKUPS_KEY = "agent_index_lookups"  # {id: name, or None for agents that no longer exist}
+AGENT_INDEX_TTL = float(os.environ.get("LEGALSPHERE_AGENT_INDEX_TTL", "30"))
+
+
+class AgentNameIndex:
+    """Id and name of every agent, shared by all sessions and processes.
+
+    The index is built from the paged id/name listing and kept in the state
+    store's cache for `ttl` seconds, so dropdowns and name lookups do not fetch
+    full agent records. Lookups of ids missing from the index (e.g. agents
+    created by another process since the index was built) fetch just those
+    agents by id; those results, including ids that no longer exist, are cached
+    for `ttl` seconds as well, so a case that still references a deleted agent
+    does not fetch it on every rerun. Call invalidate() after creating or
+    deleting agents.
+    """
+
+    def __init__(self, client, state_store, ttl: float = AGENT_INDEX_TTL):
+        self.client = client
+        self.state_store = state_store
+        self.ttl = ttl
+
+    def all(self) -> List[dict]:
+        """[{"id", "name"}] for every agent, in server order"""
+        agents = self.state_store.cache_get(AGENT_INDEX_KEY)
+        if agents is not None:
+            REGISTRY.increment("agent_index_lookups_total", 1, {"result": "hit"})
+            return agents
+        REGISTRY.increment("agent_index_lookups_total", 1, {"result": "miss"})
+        agents = self.client.list_agent_summaries()
+        self.state_store.cache_set(AGENT_INDEX_KEY, agents, ttl=self.ttl)
+        return agents
+
+    def names(self, agent_ids: Iterable[str]) -> Dict[str, str]:
+        """Name of each agent id that still exists"""
+        agent_ids = list(agent_ids)
+        if not agent_ids:
+            return {}
+        known = {agent['id']: agent['name'] for agent in self.all()}
+        missing = [agent_id for agent_id in agent_ids if agent_id not in known]
+        if missing:
+            lookups = self.state_store.cache_get(AGENT_LOOKUPS_KEY) or {}
+            unknown = [agent_id for agent_id in missing if agent_id not in lookups]
+            if unknown:
+                agents = self.client.get_agents(unknown)
+                lookups.update({agent_id: (agents[agent_id].get('name') if agent_id in agents else None)
+                                for agent_id in unknown})
+                self.state_store.cache_set(AGENT_LOOKUPS_KEY, lookups, ttl=self.ttl)
+            known.update(lookups)
+        return {agent_id: known[agent_id] for agent_id in agent_ids if known.get(agent_id) is not None}
+
+    def invalidate(self):
+        self.state_store.cache_delete(AGENT_INDEX_KEY)
+        self.state_store.cache_delete(AGENT_LOOKUPS_KEY)
@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+import threading
+from typing import Dict, Optional
+
+from metrics import REGISTRY, timed
+from pool_store import PoolStore
+from provisioning import POOL_AGENT_PREFIX
+
+# "template=size" pairs, e.g. "default=3,arbitration=1". The default template is
+# config/agent_config.json, any other is config/agent_config_<template>.json.
+# Empty by default: the pool creates real agents on the server, so deployments opt in.
+DEFAULT_POOL_SPEC = os.environ.get("LEGALSPHERE_AGENT_POOL", "")
+POOL_IDLE_SECONDS = float(os.environ.get("LEGALSPHERE_AGENT_POOL_IDLE_SECONDS", "3600"))
+POOL_REFILL_INTERVAL = float(os.environ.get("LEGALSPHERE_AGENT_POOL_REFILL_SECONDS", "30"))
+REFILL_LEASE = "agent_pool_refill"
+REFILL_LEASE_SECONDS = 300  # Longer than a refill takes, so a process that died mid-refill only blocks others briefly
+
+
+def parse_pool_spec(spec: str) -> Dict[str, int]:
+    targets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            template, size = item.split("=", 1)
+            targets[template.strip()] = int(size)
+    return targets
+
+
+def template_config_file(template: str) -> str:
+    return "agent_config.json" if template == "default" else f"agent_config_{template}.json"
+
+
+class AgentPool:
+    """Warm pool of pre-provisioned agents per persona template.
+
+    Pooled agents are created from the template config with the default tool
+    attached, under a placeholder name that list_agents hides. Taking one only
+    costs the rename and the persona block, which run concurrently. The pool
+    itself lives in the shared state store, so each agent is handed out exactly
+    once across processes. A background thread tops the pools up after every
+    acquisition and deletes surplus agents idle for longer than `idle_seconds`;
+    only the process holding the refill lease provisions, so processes started
+    together do not each fill the same gap.
+    """
+
+    def __init__(self, client, state_store, targets: Optional[Dict[str, int]] = None,
+                 idle_seconds: float = POOL_IDLE_SECONDS, refill_interval: float = POOL_REFILL_INTERVAL):
+        self.client = client
+        self.pool_store = PoolStore(state_store)
+        self.targets = parse_pool_spec(DEFAULT_POOL_SPEC) if targets is None else targets
+        self.idle_seconds = idle_seconds
+        self.refill_interval = refill_interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._holder = uuid.uuid4().hex
+
+    def start(self):
+        """Start the background refill thread (a no-op when every pool size is 0)"""
+        if self._thread is None and any(size > 0 for size in self.targets.values()):
+            self._thread = threading.Thread(target=self._run, name="agent-pool", daemon=True)
+            self._thread.start()
+
+    def request_refill(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refill()
+                self.reap()
+            except Exception as e:
+                print(f"Error maintaining agent pool: {str(e)}")
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+
+    def refill(self) -> int:
+        """Provision agents until each template's pool reaches its target size.
+
+        Skipped (returning 0) while another process holds the refill lease.
+        """
+        if not self.pool_store.acquire_lease(REFILL_LEASE, self._holder, REFILL_LEASE_SECONDS):
+            return 0
+        try:
+            counts = self.pool_store.get_pool_counts()
+            created = 0
+            for template, target in self.targets.items():
+                missing = target - counts.get(template, 0)
+                if missing <= 0:
+                    continue
+                names = [f"{POOL_AGENT_PREFIX}{template}-{uuid.uuid4().hex[:8]}" for _ in range(missing)]
+                agents = self.client.provisioner.create_pool_agents(names, template_config_file(template))
+                self.pool_store.add_pool_agents(template, [agent['id'] for agent in agents])
+                created += len(agents)
+            return created
+        finally:
+            self.pool_store.release_lease(REFILL_LEASE, self._holder)
+
+    def reap(self) -> int:
+        """Delete pooled agents beyond the target size that have been idle too long"""
+        idle_before = time.time() - self.idle_seconds
+        reaped = 0
+        for template in self.pool_store.get_pool_counts():
+            for agent_id in self.pool_store.claim_surplus_pool_agents(template, self.targets.get(template, 0),
+                                                                       idle_before):
+                try:
+                    self.client.delete_agent(agent_id)
+                    reaped += 1
+                except Exception as e:
+                    print(f"Error deleting idle pooled agent {agent_id}: {str(e)}")
+        if reaped:
+            REGISTRY.increment("agent_pool_reaped_total", reaped)
+        return reaped
+
+    @timed("agent_pool_acquire")
+    def acquire(self, name: str, block_value: str, template: str = "default") -> dict:
+        """Get an agent with this name and persona, from the pool if one is ready"""
+        agent_id = self.pool_store.claim_pool_agent(template)
+        self.request_refill()
+        if agent_id is not None:
+            try:
+                agent = self.client.provisioner.assign_agent(agent_id, name, block_value)
+                REGISTRY.increment("agent_pool_acquisitions_total", 1, {"template": template, "result": "hit"})
+                return agent
+            except Exception as e:
+                # The pooled agent is unusable (e.g. deleted on the server); provision a fresh one instead
+                print(f"Error assigning pooled agent {agent_id}: {str(e)}")
+                try:
+                    self.client.delete_agent(agent_id)
+                except Exception:
+                    pass
+        REGISTRY.increment("agent_pool_acquisitions_total", 1, {"template": template, "result": "miss"})
+        return self.client.provisioner.create_agent(name, block_value, template_config_file(template))
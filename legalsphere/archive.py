@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+from metrics import REGISTRY, timed
+from storage import read_compressed_json, write_compressed_json
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get("LEGALSPHERE_ARCHIVE_AFTER_DAYS", "90"))  # 0 disables archival
+ARCHIVE_SWEEP_HOURS = float(os.environ.get("LEGALSPHERE_ARCHIVE_SWEEP_HOURS", "24"))
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+CONVERSATIONS = "conversations"
+CASES = "cases"
+# Fields an archived item keeps in its live store: what the conversation and case lists show
+STUB_FIELDS = {
+    CONVERSATIONS: ("id", "title", "created_at", "agent_id", "mode"),
+    CASES: ("id", "title", "created_at", "creator", "agents"),
+}
+
+
+def is_archived(item) -> bool:
+    """Whether a stored conversation or case is a stub whose contents are in the archive"""
+    return bool(item.get("archived"))
+
+
+def last_activity(item) -> str:
+    """Newest timestamp in a conversation or case: messages, documents, workflow stages and nested conversations"""
+    timestamps = [item.get("created_at") or "", item.get("restored_at") or ""]
+    timestamps += [message.get("timestamp") or "" for message in item.get("messages", [])]
+    timestamps += [last_activity(conversation) for conversation in (item.get("conversations") or {}).values()]
+    timestamps += [document.get("uploaded_at") or "" for document in item.get("documents") or []]
+    workflow = item.get("workflow")
+    if workflow:
+        timestamps.append(workflow.get("assigned_at") or "")
+        for stage in workflow.get("stages", []):
+            timestamps += [stage.get("start_date") or "", stage.get("completion_date") or ""]
+    return max(timestamps)
+
+
+def keep_restored(stored: Optional[dict], items: dict) -> dict:
+    """`items` to write over `stored`, keeping any item restored in the store since `items` were loaded.
+
+    A session can still hold the stub of an item another session restored; writing its
+    copy back must not turn the full item into a stub again. `items` is updated in place,
+    so the session's copy matches what is written.
+    """
+    restored = {item_id: stored[item_id] for item_id, item in items.items()
+                if is_archived(item) and item_id in (stored or {}) and not is_archived(stored[item_id])}
+    items.update(restored)
+    return items
+
+
+def make_stub(kind: str, item: dict, archived_at: str) -> dict:
+    """The live-store stand-in for an archived item"""
+    stub = {field: item[field] for field in STUB_FIELDS[kind] if field in item}
+    stub["archived"] = {"archived_at": archived_at, "last_activity": last_activity(item)}
+    if kind == CONVERSATIONS:
+        stub["archived"]["message_count"] = len(item.get("messages", []))
+    else:
+        stub["archived"]["conversation_count"] = len(item.get("conversations") or {})
+    return stub
+
+
+class ItemArchive:
+    """Compressed cold storage for conversations and cases untouched for `after_days`.
+
+    Each archived item is written to its own compressed file under
+    `directory/<kind>/<owner>/` and replaced in the owner's live store by a stub
+    with the fields the lists show, so the live stores only grow with active
+    work. Restoring puts the full item back into the live store but keeps its
+    file until a later sweep finds the live item still restored, so a writer
+    that saves the stub back in between loses nothing (see also keep_restored).
+    `update_store(kind, owner, mutate)` applies `mutate(items)` to an
+    owner's conversation or case store under its lock, where `mutate` returns
+    the items it changed, and returns them. A background thread sweeps the
+    stores of every owner from `list_owners()` every `sweep_hours`.
+    """
+
+    def __init__(self, directory: str, update_store: Callable, list_owners: Callable[[], Iterable[str]],
+                 after_days: float = ARCHIVE_AFTER_DAYS, sweep_hours: float = ARCHIVE_SWEEP_HOURS):
+        self.directory = directory
+        self.update_store = update_store
+        self.list_owners = list_owners
+        self.after_days = after_days
+        self.sweep_interval = sweep_hours * 3600
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.after_days > 0:
+            self._thread = threading.Thread(target=self._run, name="item-archive", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error archiving old conversations and cases: {str(e)}")
+            time.sleep(self.sweep_interval)
+
+    def path(self, kind: str, owner: str, item_id: str) -> str:
+        safe_owner = owner.replace('/', '_').replace('\\', '_')
+        return os.path.join(self.directory, kind, safe_owner, f"{item_id}.json.z")
+
+    @timed("archive_sweep")
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Archive every owner's stale conversations and cases and return how many were archived"""
+        archived = 0
+        for owner in self.list_owners():
+            for kind in (CONVERSATIONS, CASES):
+                try:
+                    archived += len(self.archive_stale(kind, owner, now))
+                except Exception as e:
+                    print(f"Error archiving {kind} of {owner}: {str(e)}")
+        return archived
+
+    def archive_stale(self, kind: str, owner: str, now: Optional[float] = None) -> Dict[str, dict]:
+        """Move an owner's items untouched for `after_days` into the archive and return their stubs.
+
+        Archive copies of items restored more than a sweep interval ago are removed.
+        """
+        now = time.time() if now is None else now
+        cutoff = time.strftime(TIMESTAMP_FORMAT, time.localtime(now - self.after_days * 86400))
+        archived_at = time.strftime(TIMESTAMP_FORMAT, time.localtime(now))
+        # Sessions refresh long before a sweep interval passes, so none still holds the stub of an item restored earlier
+        restored_before = time.strftime(TIMESTAMP_FORMAT, time.localtime(now - self.sweep_interval))
+
+        def archive(items):
+            stubs = {}
+            for item_id, item in items.items():
+                if is_archived(item):
+                    continue
+                path = self.path(kind, owner, item_id)
+                if last_activity(item) >= cutoff:
+                    if (item.get("restored_at") or "") < restored_before and os.path.exists(path):
+                        os.remove(path)
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                size = write_compressed_json(path, item)
+                stubs[item_id] = make_stub(kind, item, archived_at)
+                REGISTRY.increment("archived_items_total", 1, {"kind": kind})
+                REGISTRY.increment("archived_bytes_total", size, {"kind": kind})
+            items.update(stubs)
+            return stubs
+
+        return self.update_store(kind, owner, archive)
+
+    def load(self, kind: str, owner: str, item_id: str) -> Optional[dict]:
+        """An archived item's full contents, or None if it is not in the archive"""
+        return read_compressed_json(self.path(kind, owner, item_id))
+
+    def restore(self, kind: str, owner: str, item_id: str) -> Optional[dict]:
+        """Put an archived item back into its owner's live store and return it, or None if it was not archived"""
+        def unarchive(items):
+            item = items.get(item_id)
+            if item is None or not is_archived(item):
+                return {}
+            archived = self.load(kind, owner, item_id)
+            if archived is None:
+                print(f"Archive file for {kind} {item_id} of {owner} is missing")
+                return {}
+            # Opening an item counts as activity, so the next sweep does not archive it again right away
+            archived["restored_at"] = time.strftime(TIMESTAMP_FORMAT)
+            items[item_id] = archived
+            return {item_id: archived}
+
+        restored = self.update_store(kind, owner, unarchive).get(item_id)
+        if restored is not None:
+            REGISTRY.increment("restored_items_total", 1, {"kind": kind})
+        return restored
+
+    def expand(self, kind: str, owner: str, items: Dict[str, dict]) -> Dict[str, dict]:
+        """`items` with archived stubs replaced by their archived contents, leaving the live store as it is"""
+        expanded = {}
+        for item_id, item in items.items():
+            if is_archived(item):
+                item = self.load(kind, owner, item_id) or item
+            expanded[item_id] = item
+        return expanded
+
+    def discard(self, kind: str, owner: str, item_id: str):
+        """Remove an item's archive file, e.g. after it was deleted"""
+        try:
+            os.remove(self.path(kind, owner, item_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1 @@
+"""Benchmark suite and mock Letta server (see benchmarks/run.py)"""
@@ -0,0 +1,346 @@
+"""Synthetic LegalSphere data in the app's own store formats, for scale testing.
+
+Writes user_data/<user>_conversations.json, cases/<user>_cases.json (with
+workflows, documents and summaries), shared_cases/shared_cases.json and audit
+events in the state database. `--scale` multiplies the per-user volumes of the
+bundled sample data (conversations, cases, audit entries):
+
+    python -m benchmarks.datagen --target /tmp/legalsphere_big --scale 100
+"""
+import os
+import ast
+import math
+import uuid
+import random
+import argparse
+import datetime
+from typing import Dict, List, Optional
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROLE_PREFIXES = {"admin": "admin", "legal_advisor": "advisor", "client": "client", "guest": "guest"}
+AUDIT_ACTIONS = ["login", "logout", "create_conversation", "delete_conversation", "send_message",
+                 "upload_document", "create_case", "assign_workflow", "update_workflow_stage",
+                 "export_conversations", "failed_login"]
+VOCABULARY = ["tariff", "dispute", "panel", "safeguard", "ruling", "clause", "appeal", "treaty", "member",
+              "measure", "obligation", "remedy", "evidence", "counsel", "hearing", "dumping", "subsidy",
+              "quota", "jurisdiction", "precedent", "GATT", "WTO", "arbitration", "compliance", "annex"]
+START_DATE = datetime.datetime(2025, 1, 1)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+AUDIT_INSERT_BATCH = 10000
+
+
+class DatasetSpec:
+    """Volumes and size distributions of a generated dataset.
+
+    Message and conversation lengths are log-normal: `*_median` is the typical
+    value and `*_sigma` the spread, so a few conversations and messages are much
+    longer than the rest, as in real chat histories.
+    """
+
+    def __init__(self, users_per_role: Optional[Dict[str, int]] = None, conversations_per_user: int = 5,
+                 cases_per_user: int = 3, conversations_per_case: int = 2, messages_median: float = 6,
+                 messages_sigma: float = 0.8, message_words_median: float = 60, message_words_sigma: float = 0.9,
+                 max_message_words: int = 3000, workflow_fraction: float = 0.6, documents_per_case: int = 1,
+                 document_kb_median: float = 200, summary_fraction: float = 0.3, audit_entries_per_user: int = 150,
+                 scale: float = 1.0):
+        self.users_per_role = users_per_role or {"admin": 1, "legal_advisor": 1, "client": 1, "guest": 1}
+        self.conversations_per_user = conversations_per_user
+        self.cases_per_user = cases_per_user
+        self.conversations_per_case = conversations_per_case
+        self.messages_median = messages_median
+        self.messages_sigma = messages_sigma
+        self.message_words_median = message_words_median
+        self.message_words_sigma = message_words_sigma
+        self.max_message_words = max_message_words
+        self.workflow_fraction = workflow_fraction
+        self.documents_per_case = documents_per_case
+        self.document_kb_median = document_kb_median
+        self.summary_fraction = summary_fraction
+        self.audit_entries_per_user = audit_entries_per_user
+        self.scale = scale
+
+    def scaled(self, value: int) -> int:
+        return int(round(value * self.scale))
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def lognormal_int(median: float, sigma: float, minimum: int = 1, maximum: Optional[int] = None) -> int:
+    value = max(minimum, int(round(random.lognormvariate(math.log(median), sigma))))
+    return min(value, maximum) if maximum else value
+
+
+def words(count: int) -> str:
+    return " ".join(random.choices(VOCABULARY, k=count))
+
+
+def random_timestamp(span_days: int = 365) -> datetime.datetime:
+    return START_DATE + datetime.timedelta(seconds=random.randint(0, span_days * 24 * 3600))
+
+
+def load_default_workflows(app_script: str = os.path.join(APP_DIR, "lit.py")) -> Dict[str, dict]:
+    """Read DEFAULT_WORKFLOWS from lit.py without running the app"""
+    with open(app_script, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "DEFAULT_WORKFLOWS" for t in node.targets):
+            return ast.literal_eval(node.value)
+    return {}
+
+
+def make_usernames(spec: DatasetSpec) -> Dict[str, str]:
+    """username -> role; the first user of each role matches the demo accounts (admin1, advisor1, ...)"""
+    return {
+        f"{ROLE_PREFIXES[role]}{i}": role
+        for role, count in spec.users_per_role.items()
+        for i in range(1, count + 1)
+    }
+
+
+def make_conversation(spec: DatasetSpec, agent_ids: List[str]) -> dict:
+    conversation_id = str(uuid.uuid4())
+    started = random_timestamp()
+    messages = []
+    for i in range(lognormal_int(spec.messages_median, spec.messages_sigma)):
+        role = "user" if i % 2 == 0 else "assistant"
+        content_words = lognormal_int(spec.message_words_median / (3 if role == "user" else 1),
+                                      spec.message_words_sigma, maximum=spec.max_message_words)
+        message = {
+            "role": role,
+            "content": words(content_words),
+            "timestamp": (started + datetime.timedelta(seconds=45 * i)).strftime(TIMESTAMP_FORMAT)
+        }
+        if role == "assistant":
+            message["reasoning"] = words(lognormal_int(25, 0.4, maximum=50))
+        messages.append(message)
+    return {
+        "id": conversation_id,
+        "title": f"{random.choice(VOCABULARY).capitalize()} consultation",
+        "created_at": started.strftime(TIMESTAMP_FORMAT),
+        "messages": messages,
+        "agent_id": random.choice(agent_ids)
+    }
+
+
+def make_workflow(templates: Dict[str, dict], assigned: datetime.datetime) -> dict:
+    """A workflow in the shape assign_workflow_to_case builds, advanced to a random stage"""
+    template_id = random.choice(list(templates))
+    template = templates[template_id]
+    current = random.randint(0, len(template["stages"]) - 1)
+    stage_time = assigned
+    stages = []
+    for index, stage in enumerate(template["stages"]):
+        status = "completed" if index < current else "in_progress" if index == current else "not_started"
+        start_date = completion_date = None
+        if status != "not_started":
+            start_date = stage_time.strftime(TIMESTAMP_FORMAT)
+        if status == "completed":
+            stage_time += datetime.timedelta(days=random.uniform(0.5, 20))
+            completion_date = stage_time.strftime(TIMESTAMP_FORMAT)
+        stages.append({
+            "id": stage["id"],
+            "name": stage["name"],
+            "description": stage["description"],
+            "status": status,
+            "start_date": start_date,
+            "completion_date": completion_date,
+            "notes": words(random.randint(0, 30))
+        })
+    return {
+        "template_id": template_id,
+        "name": template["name"],
+        "description": template["description"],
+        "assigned_at": assigned.strftime(TIMESTAMP_FORMAT),
+        "current_stage_index": current,
+        "stages": stages
+    }
+
+
+def make_case(spec: DatasetSpec, username: str, agent_ids: List[str], templates: Dict[str, dict],
+              documents_dir: str, write_documents: bool) -> dict:
+    case_id = str(uuid.uuid4())
+    created = random_timestamp()
+    conversations = {}
+    for _ in range(spec.conversations_per_case):
+        conversation = make_conversation(spec, agent_ids)
+        conversations[conversation["id"]] = conversation
+
+    documents = []
+    for _ in range(spec.documents_per_case):
+        name = f"{random.choice(VOCABULARY)}_{random.randint(1, 999)}.pdf"
+        filename = f"{created.strftime('%Y%m%d_%H%M%S')}_{name}"
+        file_path = os.path.join(documents_dir, case_id, filename)
+        size = lognormal_int(spec.document_kb_median, 1.0) * 1024
+        if write_documents:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as f:
+                f.write(os.urandom(size))
+        documents.append({
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "filename": filename,
+            "uploaded_at": created.strftime(TIMESTAMP_FORMAT),
+            "uploaded_by": username,
+            "file_path": file_path,
+            "size": size,
+            "type": "application/pdf"
+        })
+
+    case = {
+        "id": case_id,
+        "title": f"{random.choice(VOCABULARY).capitalize()} {random.choice(VOCABULARY)} matter",
+        "created_at": created.strftime(TIMESTAMP_FORMAT),
+        "conversations": conversations,
+        "agents": random.sample(agent_ids, k=min(len(agent_ids), random.randint(1, 2))),
+        "creator": username,
+        "workflow": make_workflow(templates, created) if templates and random.random() < spec.workflow_fraction else None,
+        "documents": documents
+    }
+    if random.random() < spec.summary_fraction:
+        case["summary"] = {
+            "content": words(lognormal_int(spec.message_words_median * 4, 0.5, maximum=spec.max_message_words)),
+            "generated_at": (created + datetime.timedelta(days=7)).strftime(TIMESTAMP_FORMAT),
+            "generated_by": random.choice(agent_ids)
+        }
+    return case
+
+
+def iter_audit_entries(users: Dict[str, str], count: int):
+    """Audit entries in timestamp order, as log_user_action appends them"""
+    timestamp = START_DATE
+    usernames = list(users)
+    for i in range(count):
+        timestamp += datetime.timedelta(seconds=random.expovariate(1 / 60))
+        username = random.choice(usernames)
+        yield {
+            "timestamp": timestamp.strftime(TIMESTAMP_FORMAT),
+            "username": username,
+            "role": users[username],
+            "action": random.choice(AUDIT_ACTIONS),
+            "details": {"sequence": i},
+            "ip_address": f"10.0.{random.randint(0, 255)}.{random.randint(1, 254)}"
+        }
+
+
+def generate(target: str, spec: DatasetSpec, agent_ids: Optional[List[str]] = None,
+             templates: Optional[Dict[str, dict]] = None, state_store=None, write_documents: bool = False,
+             seed: Optional[int] = None) -> Dict[str, int]:
+    """Write a synthetic dataset under `target` (an app directory) and return what was generated.
+
+    Existing store files for the generated users are replaced. Audit events go to
+    `state_store` (a state_store.StateStore) when given.
+    """
+    from storage import write_json
+
+    if seed is not None:
+        random.seed(seed)
+    agent_ids = agent_ids or [f"agent-{uuid.uuid4()}" for _ in range(3)]
+    templates = load_default_workflows() if templates is None else templates
+    users = make_usernames(spec)
+    data_dir = os.path.join(target, "user_data")
+    cases_dir = os.path.join(target, "cases")
+    shared_dir = os.path.join(target, "shared_cases")
+    for directory in (data_dir, cases_dir, shared_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    totals = {"users": len(users), "conversations": 0, "cases": 0, "messages": 0, "documents": 0,
+              "audit_entries": 0, "bytes": 0}
+    shared_cases = {}
+    for username, role in users.items():
+        conversations = {}
+        for _ in range(spec.scaled(spec.conversations_per_user)):
+            conversation = make_conversation(spec, agent_ids)
+            conversations[conversation["id"]] = conversation
+            totals["messages"] += len(conversation["messages"])
+        conversations_path = os.path.join(data_dir, f"{username}_conversations.json")
+        write_json(conversations_path, conversations)
+
+        cases = {}
+        for _ in range(spec.scaled(spec.cases_per_user)):
+            case = make_case(spec, username, agent_ids, templates, os.path.join(cases_dir, "documents"),
+                             write_documents)
+            cases[case["id"]] = case
+            totals["messages"] += sum(len(c["messages"]) for c in case["conversations"].values())
+            totals["documents"] += len(case["documents"])
+        cases_path = os.path.join(cases_dir, f"{username}_cases.json")
+        write_json(cases_path, cases)
+        if role == "legal_advisor":
+            shared_cases.update(cases)
+
+        totals["conversations"] += len(conversations) + sum(len(c["conversations"]) for c in cases.values())
+        totals["cases"] += len(cases)
+        totals["bytes"] += os.path.getsize(conversations_path) + os.path.getsize(cases_path)
+
+    shared_path = os.path.join(shared_dir, "shared_cases.json")
+    write_json(shared_path, shared_cases)
+    totals["bytes"] += os.path.getsize(shared_path)
+
+    if state_store is not None:
+        batch = []
+        for entry in iter_audit_entries(users, spec.scaled(spec.audit_entries_per_user) * len(users)):
+            batch.append(entry)
+            if len(batch) >= AUDIT_INSERT_BATCH:
+                totals["audit_entries"] += state_store.append_audit_events(batch)
+                batch = []
+        if batch:
+            totals["audit_entries"] += state_store.append_audit_events(batch)
+    return totals
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    """Command-line options for a DatasetSpec, shared with benchmarks.run"""
+    defaults = DatasetSpec()
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply per-user conversations, cases and audit entries (e.g. 10, 100, 1000)")
+    parser.add_argument("--admins", type=int, default=defaults.users_per_role["admin"])
+    parser.add_argument("--advisors", type=int, default=defaults.users_per_role["legal_advisor"])
+    parser.add_argument("--clients", type=int, default=defaults.users_per_role["client"])
+    parser.add_argument("--guests", type=int, default=defaults.users_per_role["guest"])
+    parser.add_argument("--conversations-per-user", type=int, default=defaults.conversations_per_user)
+    parser.add_argument("--cases-per-user", type=int, default=defaults.cases_per_user)
+    parser.add_argument("--conversations-per-case", type=int, default=defaults.conversations_per_case)
+    parser.add_argument("--messages-median", type=float, default=defaults.messages_median,
+                        help="typical messages per conversation")
+    parser.add_argument("--message-words-median", type=float, default=defaults.message_words_median,
+                        help="typical words per assistant message")
+    parser.add_argument("--workflow-fraction", type=float, default=defaults.workflow_fraction)
+    parser.add_argument("--documents-per-case", type=int, default=defaults.documents_per_case)
+    parser.add_argument("--audit-entries-per-user", type=int, default=defaults.audit_entries_per_user)
+
+
+def spec_from_args(args) -> DatasetSpec:
+    return DatasetSpec(
+        users_per_role={"admin": args.admins, "legal_advisor": args.advisors,
+                        "client": args.clients, "guest": args.guests},
+        conversations_per_user=args.conversations_per_user,
+        cases_per_user=args.cases_per_user,
+        conversations_per_case=args.conversations_per_case,
+        messages_median=args.messages_median,
+        message_words_median=args.message_words_median,
+        workflow_fraction=args.workflow_fraction,
+        documents_per_case=args.documents_per_case,
+        audit_entries_per_user=args.audit_entries_per_user,
+        scale=args.scale
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic LegalSphere dataset")
+    parser.add_argument("--target", required=True, help="app directory to write user_data/, cases/, ... into")
+    parser.add_argument("--state-db", help="state database for audit events (default <target>/state/legalsphere.db)")
+    parser.add_argument("--write-documents", action="store_true", help="also write document files of the listed sizes")
+    parser.add_argument("--seed", type=int, default=1)
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    from state_store import StateStore
+
+    state_store = StateStore(args.state_db or os.path.join(args.target, "state", "legalsphere.db"))
+    totals = generate(args.target, spec_from_args(args), state_store=state_store,
+                      write_documents=args.write_documents, seed=args.seed)
+    print(", ".join(f"{value} {name}" for name, value in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
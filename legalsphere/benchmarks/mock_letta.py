@@ -0,0 +1,316 @@
+"""In-process stand-in for the Letta REST API used by LettaClient.
+
+Serves the agent, message, source upload, block and tool endpoints from memory
+with a configurable artificial latency, so the app and the benchmarks can run
+without a Letta container or an OpenAI key:
+
+    python -m benchmarks.mock_letta --port 8283 --latency-ms 200
+"""
+import re
+import json
+import time
+import uuid
+import random
+import datetime
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_AGENT_NAMES = ["Trade Law Expert", "WTO Dispute Expert", "Contract Review Expert"]
+
+
+class MockLettaState:
+    """Agents, blocks, tools, sources and message histories held in memory"""
+
+    def __init__(self, agent_names=DEFAULT_AGENT_NAMES, reply_words: int = 120):
+        self.lock = threading.Lock()
+        self.agents: Dict[str, dict] = {}
+        self.blocks: Dict[str, dict] = {}
+        self.tools: Dict[str, dict] = {}
+        self.sources: Dict[str, dict] = {"source-1": {"id": "source-1", "name": "Case Documents", "files": []}}
+        self.messages: Dict[str, list] = {}
+        self.reply_words = reply_words
+        for name in agent_names:
+            self.create_agent({"name": name})
+
+    def create_agent(self, config: dict) -> dict:
+        agent_id = f"agent-{uuid.uuid4()}"
+        agent = {
+            "id": agent_id,
+            "name": config.get("name", agent_id),
+            "blocks": [],
+            "tools": [],
+            "sources": []
+        }
+        with self.lock:
+            self.agents[agent_id] = agent
+            self.messages[agent_id] = []
+        return agent
+
+    def reply(self, agent_id: str, payload: dict) -> dict:
+        user_messages = payload.get("messages", [])
+        content = user_messages[-1]["content"] if user_messages else ""
+        words = " ".join(random.choice(["trade", "tariff", "dispute", "panel", "ruling", "clause", "party"])
+                         for _ in range(self.reply_words))
+        date = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        messages = [
+            {"id": f"message-{uuid.uuid4()}", "date": date, "message_type": "reasoning_message",
+             "reasoning": f"The user asked about {content[:40]!r}; answer from the case material."},
+            {"id": f"message-{uuid.uuid4()}", "date": date, "message_type": "assistant_message", "content": words}
+        ]
+        with self.lock:
+            history = self.messages.setdefault(agent_id, [])
+            history.extend({"id": f"message-{uuid.uuid4()}", "date": date, "message_type": "user_message",
+                            "content": m.get("content", "")} for m in user_messages)
+            history.extend(messages)
+        return {"messages": messages, "usage": {"step_count": 1}}
+
+
+class MockLettaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLetta/1.0"
+
+    # Routes are matched against the path without the query string or a trailing slash
+    ROUTES = [
+        ("GET", r"/v1/agents", "list_agents"),
+        ("POST", r"/v1/agents", "create_agent"),
+        ("GET", r"/v1/agents/(?P<agent_id>[^/]+)", "get_agent"),
+        ("PATCH", r"/v1/agents/(?P<agent_id>[^/]+)", "update_agent"),
+        ("DELETE", r"/v1/agents/(?P<agent_id>[^/]+)", "delete_agent"),
+        ("GET", r"/v1/agents/(?P<agent_id>[^/]+)/messages", "get_messages"),
+        ("POST", r"/v1/agents/(?P<agent_id>[^/]+)/messages", "send_message"),
+        ("GET", r"/v1/agents/(?P<agent_id>[^/]+)/sources", "get_agent_sources"),
+        ("PATCH", r"/v1/agents/(?P<agent_id>[^/]+)/sources/attach/(?P<source_id>[^/]+)", "attach_source"),
+        ("PATCH", r"/v1/agents/(?P<agent_id>[^/]+)/core-memory/blocks/attach/(?P<block_id>[^/]+)", "attach_block"),
+        ("PATCH", r"/v1/agents/(?P<agent_id>[^/]+)/tools/attach/(?P<tool_id>[^/]+)", "attach_tool"),
+        ("GET", r"/v1/sources", "list_sources"),
+        ("POST", r"/v1/sources/(?P<source_id>[^/]+)/upload", "upload_file"),
+        ("POST", r"/v1/blocks", "create_block"),
+        ("DELETE", r"/v1/blocks/(?P<block_id>[^/]+)", "delete_block"),
+        ("POST", r"/v1/tools", "create_tool"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> MockLettaState:
+        return self.server.state
+
+    def _route(self, method: str):
+        path = urlparse(self.path).path.rstrip("/")
+        for route_method, pattern, action in self.ROUTES:
+            if route_method == method:
+                match = re.fullmatch(pattern, path)
+                if match:
+                    return action, match.groupdict()
+        return None, {}
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, payload, status: int = 200):
+        encoded = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _handle(self, method: str):
+        action, params = self._route(method)
+        body = self._body()
+        self.server.delay(action or "unknown")
+        if action is None:
+            return self._send({"detail": f"No route for {method} {self.path}"}, 404)
+        agent_id = params.get("agent_id")
+        if agent_id and agent_id not in self.state.agents:
+            return self._send({"detail": f"Agent {agent_id} not found"}, 404)
+        return getattr(self, f"do_{action}")(body=body, **params)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    # Endpoint implementations
+    def _page(self, items: list) -> list:
+        # Letta pages by cursor: `after` is the id of the last item of the previous page
+        query = parse_qs(urlparse(self.path).query)
+        if query.get("order") == ["desc"]:
+            items = items[::-1]
+        if "after" in query:
+            ids = [item["id"] for item in items]
+            after = query["after"][0]
+            items = items[ids.index(after) + 1:] if after in ids else []
+        if "limit" in query:
+            items = items[:int(query["limit"][0])]
+        return items
+
+    def do_list_agents(self, body):
+        self._send(self._page(list(self.state.agents.values())))
+
+    def do_create_agent(self, body):
+        self._send(self.state.create_agent(json.loads(body or b"{}")))
+
+    def do_get_agent(self, body, agent_id):
+        self._send(self.state.agents[agent_id])
+
+    def do_update_agent(self, body, agent_id):
+        fields = json.loads(body or b"{}")
+        with self.state.lock:
+            self.state.agents[agent_id].update({key: value for key, value in fields.items() if key != "id"})
+        self._send(self.state.agents[agent_id])
+
+    def do_delete_agent(self, body, agent_id):
+        with self.state.lock:
+            agent = self.state.agents.pop(agent_id)
+            self.state.messages.pop(agent_id, None)
+        self._send(agent)
+
+    def do_get_messages(self, body, agent_id):
+        self._send(self._page(list(self.state.messages.get(agent_id, []))))
+
+    def do_send_message(self, body, agent_id):
+        self._send(self.state.reply(agent_id, json.loads(body or b"{}")))
+
+    def do_get_agent_sources(self, body, agent_id):
+        sources = self.state.agents[agent_id]["sources"]
+        self._send([self.state.sources[source_id] for source_id in sources if source_id in self.state.sources])
+
+    def do_attach_source(self, body, agent_id, source_id):
+        self.state.agents[agent_id]["sources"].append(source_id)
+        self._send(self.state.agents[agent_id])
+
+    def do_attach_block(self, body, agent_id, block_id):
+        self.state.agents[agent_id]["blocks"].append(block_id)
+        self._send(self.state.agents[agent_id])
+
+    def do_attach_tool(self, body, agent_id, tool_id):
+        self.state.agents[agent_id]["tools"].append(tool_id)
+        self._send(self.state.agents[agent_id])
+
+    def do_list_sources(self, body):
+        self._send(list(self.state.sources.values()))
+
+    def do_upload_file(self, body, source_id):
+        source = self.state.sources.setdefault(source_id, {"id": source_id, "name": source_id, "files": []})
+        job = {"id": f"job-{uuid.uuid4()}", "status": "completed", "source_id": source_id, "bytes": len(body)}
+        with self.state.lock:
+            source["files"].append(job["id"])
+        self._send(job)
+
+    def do_create_block(self, body):
+        block = json.loads(body or b"{}")
+        block["id"] = f"block-{uuid.uuid4()}"
+        with self.state.lock:
+            self.state.blocks[block["id"]] = block
+        self._send(block)
+
+    def do_delete_block(self, body, block_id):
+        with self.state.lock:
+            block = self.state.blocks.pop(block_id, None)
+        if block is None:
+            return self._send({"detail": f"Block {block_id} not found"}, 404)
+        self._send(block)
+
+    def do_create_tool(self, body):
+        tool = json.loads(body or b"{}")
+        tool["id"] = f"tool-{uuid.uuid4()}"
+        with self.state.lock:
+            self.state.tools[tool["id"]] = tool
+        self._send(tool)
+
+
+class MockLettaServer(ThreadingHTTPServer):
+    """Mock Letta server with artificial latency.
+
+    `latency` is the base delay in seconds for every request, `jitter` adds a
+    uniformly random extra delay, and `endpoint_latency` overrides the base
+    delay per route action (e.g. {"send_message": 1.5}).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 endpoint_latency: Optional[Dict[str, float]] = None, state: Optional[MockLettaState] = None):
+        super().__init__((host, port), MockLettaHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.endpoint_latency = endpoint_latency or {}
+        self.state = state or MockLettaState()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, action: str):
+        seconds = self.endpoint_latency.get(action, self.latency)
+        if self.jitter:
+            seconds += random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def start(self) -> "MockLettaServer":
+        """Serve on a background daemon thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-letta", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def parse_endpoint_latency(spec: str) -> Dict[str, float]:
+    """Parse "send_message=1500,upload_file=300" (milliseconds) into seconds per route action"""
+    latency = {}
+    for item in spec.split(","):
+        if "=" in item:
+            action, millis = item.split("=", 1)
+            latency[action.strip()] = float(millis) / 1000
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Letta server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8283)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="base delay for every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra delay per request")
+    parser.add_argument("--endpoint-latency", default="", help='per-route delays, e.g. "send_message=1500"')
+    args = parser.parse_args()
+
+    server = MockLettaServer(args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000,
+                             parse_endpoint_latency(args.endpoint_latency))
+    print(f"Mock Letta server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
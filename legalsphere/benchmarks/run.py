@@ -0,0 +1,407 @@
+"""LegalSphere benchmark runner.
+
+Copies the app into a scratch directory, seeds it with a large history, starts
+the mock Letta server and drives realistic workloads through the real code
+paths (LettaClient and the lit.py store/export/audit functions, plus full
+Streamlit logins through AppTest). Throughput and latency percentiles are
+written to a JSON baseline; pass --compare with an earlier baseline to see
+regressions. Run from the legalsphere directory:
+
+    python -m benchmarks.run --output benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import logging
+import time
+import random
+import shutil
+import argparse
+import subprocess
+import datetime
+import platform
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks.datagen import add_spec_arguments, generate, spec_from_args, words
+from benchmarks.mock_letta import MockLettaServer, parse_endpoint_latency
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = "lit.py"
+DEFINITIONS_END_MARKER = "# Initialize session state"  # lit.py's helper definitions end here
+# Runtime output and local state that must not leak into the scratch copy
+IGNORED_APP_FILES = shutil.ignore_patterns("__pycache__", "benchmarks", "state", "metrics", "exports",
+                                           "archive", "*.lock", "*.db*", "*.prom")
+BENCH_USER = "advisor1"
+BENCH_PASSWORD = "legal123"
+REGRESSION_THRESHOLD = 0.20  # relative p95 increase reported as a regression
+
+
+# Scratch app setup
+def prepare_workdir(workdir: str, server_url: str):
+    """Copy the app into `workdir` and point its settings at scratch state and the mock server"""
+    shutil.copytree(APP_DIR, workdir, ignore=IGNORED_APP_FILES, dirs_exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    os.environ["LETTA_API_URL"] = server_url
+    os.environ["LEGALSPHERE_STATE_DB"] = os.path.join(workdir, "state", "legalsphere.db")
+    os.environ["LEGALSPHERE_METRICS_DIR"] = os.path.join(workdir, "metrics")
+    os.environ.setdefault("LEGALSPHERE_TRACING", "off")
+    os.environ.setdefault("LEGALSPHERE_ARCHIVE_AFTER_DAYS", "0")  # Keep the seeded history live; its dates are old
+
+
+def load_app_definitions() -> dict:
+    """Execute the definition part of lit.py (constants and store/export/audit functions) without its UI"""
+    import streamlit as st
+
+    # Outside `streamlit run` every st.* call warns about the missing script context
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+    with open(APP_SCRIPT, "r", encoding="utf-8") as f:
+        source = f.read().split(DEFINITIONS_END_MARKER)[0]
+    app = {"__name__": "lit"}
+    exec(compile(source, APP_SCRIPT, "exec"), app)
+    st.session_state.username = BENCH_USER
+    st.session_state.user_role = app["USERS"][BENCH_USER]["role"]
+    st.session_state.store_versions = {}
+    st.session_state.case_feed_seq = 0
+    return app
+
+
+def seed_history(app: dict, args, agent_ids):
+    """Generate a synthetic dataset in the scratch app and return the benchmark user's conversations and cases"""
+    totals = generate(".", spec_from_args(args), agent_ids=agent_ids, templates=app["DEFAULT_WORKFLOWS"],
+                      state_store=app["STATE_STORE"], seed=args.seed)
+    print("Seeded " + ", ".join(f"{value} {name}" for name, value in totals.items()))
+    return app["load_conversations"](BENCH_USER), app["load_cases"](BENCH_USER)
+
+
+# Measurement
+def measure(name: str, operation: Callable[[int], object], iterations: int, concurrency: int = 1) -> dict:
+    """Run `operation(i)` `iterations` times on `concurrency` threads and summarize the latencies"""
+    from metrics import percentile
+
+    latencies = []
+    errors = 0
+
+    def run_one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as e:
+            errors += 1
+            print(f"  {name} iteration {i} failed: {str(e)}")
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(run_one, range(iterations)))
+    else:
+        for i in range(iterations):
+            run_one(i)
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    result = {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": errors,
+        "total_seconds": round(elapsed, 4),
+        "throughput_per_second": round(iterations / elapsed, 3) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0
+    }
+    print(f"  {name:<28} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+          f"{result['throughput_per_second']:>8.2f}/s")
+    return result
+
+
+def store_formats(stores: dict, iterations: int) -> dict:
+    """Size and p50 encode/decode time of the benchmark user's stores in each serialization format"""
+    import storage
+    from metrics import percentile
+
+    formats = {
+        "json_indent": (lambda data: json.dumps(data, indent=2).encode("utf-8"),
+                        json.loads),
+        "json_stdlib": (lambda data: json.dumps(data).encode("utf-8"), json.loads),
+        "json_" + ("orjson" if storage.orjson else "compact"): (storage.encode_json, storage.decode_json),
+    }
+    if storage.msgpack is not None and storage.zstandard is not None:
+        def encode_snapshot(data):
+            packed = storage.msgpack.packb(data)
+            return storage.zstandard.ZstdCompressor(level=storage.SNAPSHOT_LEVEL).compress(packed)
+        formats["msgpack_zstd"] = (encode_snapshot, storage.decode_store)
+
+    results = {}
+    for name, (encode, decode) in formats.items():
+        encode_times, decode_times = [], []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            encoded = [encode(data) for data in stores.values()]
+            encode_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            for content in encoded:
+                decode(content)
+            decode_times.append(time.perf_counter() - started)
+        results[name] = {
+            "bytes": sum(len(content) for content in encoded),
+            "encode_p50_ms": round(percentile(sorted(encode_times), 0.50) * 1000, 3),
+            "decode_p50_ms": round(percentile(sorted(decode_times), 0.50) * 1000, 3)
+        }
+        print(f"  {'store_formats ' + name:<28} {results[name]['bytes'] / 1024:>9.0f} KB  "
+              f"encode {results[name]['encode_p50_ms']:>8.2f} ms  decode {results[name]['decode_p50_ms']:>8.2f} ms")
+    return {"formats": results}
+
+
+# Workloads
+def login_with_history(iterations: int, timeout: float):
+    """Full Streamlit login as the benchmark user, which loads the seeded history and the agent list"""
+    from streamlit.testing.v1 import AppTest
+
+    def operation(i):
+        at = AppTest.from_file(os.path.abspath(APP_SCRIPT), default_timeout=timeout)
+        at.run()
+        at.text_input[0].input(BENCH_USER)
+        at.text_input[1].input(BENCH_PASSWORD)
+        at.button[0].click()
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+    return operation
+
+
+# A fresh interpreter that renders the login page once, as a new container or worker process does
+COLD_START_SCRIPT = """
+import os
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.abspath({script!r}), default_timeout={timeout!r})
+at.run()
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+"""
+
+
+def cold_start(timeout: float):
+    """Start a new Python process, import the app and render the login page (first paint)"""
+    env = {**os.environ, "PYTHONPATH": os.getcwd()}
+
+    def operation(i):
+        subprocess.run([sys.executable, "-c", COLD_START_SCRIPT.format(script=APP_SCRIPT, timeout=timeout)],
+                       env=env, check=True, capture_output=True, timeout=timeout)
+
+    return operation
+
+
+def warm_rerun(timeout: float):
+    """Rerun the logged-in main page of an already running session, as every widget interaction does"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.abspath(APP_SCRIPT), default_timeout=timeout)
+    at.run()
+    at.text_input[0].input(BENCH_USER)
+    at.text_input[1].input(BENCH_PASSWORD)
+    at.button[0].click()
+    at.run()
+
+    def operation(i):
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+    return operation
+
+
+def build_workloads(app: dict, client, args, agent_id: str, conversations: dict, cases: dict) -> Dict[str, Callable]:
+    """Name -> zero-argument callable returning a measurement"""
+    upload_dir = tempfile.mkdtemp(prefix="uploads_", dir=".")
+    upload_paths = []
+    for i in range(args.upload_files):
+        path = os.path.join(upload_dir, f"exhibit_{i}.txt")
+        with open(path, "w") as f:
+            f.write(words(args.upload_words))
+        upload_paths.append(path)
+
+    case = next(iter(cases.values()), None)
+
+    def send_message(i):
+        client.send_message(agent_id, f"Question {i}: {words(40)}")
+
+    def bulk_upload(i):
+        for path in upload_paths:
+            client.upload_file_to_source("source-1", path)
+
+    def case_summary(i):
+        # Same prompt shape as the "Generate Case Summary" button
+        text = f"# Case Summary Request: {case['title']}\n\n"
+        for conversation in case["conversations"].values():
+            text += f"## Conversation: {conversation['title']}\n\n"
+            for message in conversation["messages"]:
+                text += f"**{message['role'].capitalize()}**: {message['content']}\n\n"
+        client.send_message(agent_id, text)
+
+    def panel_consultation(i):
+        # Same fan-out as a panel conversation: one prompt to several agents at once
+        from panel import PanelConsultation
+        panel_agents = [agent['id'] for agent in client.list_agents()[:args.team_size]]
+        PanelConsultation(client).ask_all(panel_agents, f"Question {i}: {words(40)}")
+
+    def save_and_load(i):
+        app["save_conversations"](BENCH_USER, conversations)
+        app["load_conversations"](BENCH_USER)
+
+    def audit_query(i):
+        app["get_audit_logs"](action="send_message")
+        app["get_audit_logs"](username_filter="advisor")
+
+    def audit_append(i):
+        app["log_user_action"](BENCH_USER, "benchmark", {"iteration": i})
+
+    iterations = args.iterations
+    return {
+        "login_large_history": lambda: measure("login_large_history", login_with_history(args.login_iterations, args.app_timeout),
+                                               args.login_iterations),
+        "cold_start": lambda: measure("cold_start", cold_start(args.app_timeout), args.login_iterations),
+        "warm_rerun": lambda: measure("warm_rerun", warm_rerun(args.app_timeout), iterations),
+        "list_agents": lambda: measure("list_agents", lambda i: client.list_agents(), iterations),
+        "list_agent_summaries": lambda: measure("list_agent_summaries", lambda i: client.list_agent_summaries(),
+                                                iterations),
+        "send_message": lambda: measure("send_message", send_message, iterations),
+        "send_message_concurrent": lambda: measure("send_message_concurrent", send_message, iterations * args.concurrency,
+                                                   args.concurrency),
+        "bulk_upload": lambda: measure("bulk_upload", bulk_upload, max(1, iterations // 5)),
+        "create_agent": lambda: measure("create_agent", lambda i: client.create_agent(f"bench-agent-{i}", "persona"),
+                                        max(1, iterations // 5)),
+        "create_agent_team": lambda: measure("create_agent_team", lambda i: client.create_agents(
+            [{"name": f"bench-team-{i}-{n}", "persona": words(60)} for n in range(args.team_size)]),
+            max(1, iterations // 5)),
+        "panel_consultation": lambda: measure("panel_consultation", panel_consultation, max(1, iterations // 5)),
+        "case_summary": lambda: measure("case_summary", case_summary, max(1, iterations // 5)) if case else None,
+        "save_load_conversations": lambda: measure("save_load_conversations", save_and_load, iterations),
+        "load_cases": lambda: measure("load_cases", lambda i: app["load_cases"](BENCH_USER), iterations),
+        "store_formats": lambda: store_formats({"conversations": conversations, "cases": cases},
+                                               max(1, iterations // 5)),
+        "export_txt": lambda: measure("export_txt", lambda i: app["export_conversations_to_txt"](BENCH_USER, conversations),
+                                      max(1, iterations // 5)),
+        "export_csv": lambda: measure("export_csv", lambda i: app["export_conversations_to_csv"](BENCH_USER, conversations),
+                                      max(1, iterations // 5)),
+        "export_parquet": lambda: measure("export_parquet", lambda i: app["export_conversations_to_columnar"](
+            BENCH_USER, conversations, cases, "parquet"), max(1, iterations // 5)),
+        "audit_query": lambda: measure("audit_query", audit_query, iterations),
+        "audit_append": lambda: measure("audit_append", audit_append, iterations),
+    }
+
+
+# Baselines
+def compare_baselines(previous: dict, current: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Workloads whose p95 latency grew by more than `threshold` relative to `previous`"""
+    regressions = []
+    for name, result in current["workloads"].items():
+        before = previous.get("workloads", {}).get(name)
+        if not before or not before.get("p95_ms"):
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"  {name:<28} p95 {before['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms ({change:+.0%}) {marker}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the LegalSphere benchmark suite against a mock Letta server")
+    parser.add_argument("--output", help="write results to this JSON baseline file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--workloads", help="comma-separated subset of workloads to run")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--login-iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="mock server base latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--endpoint-latency", default="", help='per-route mock latency, e.g. "send_message=200"')
+    parser.add_argument("--team-size", type=int, default=5, help="agents per create_agent_team call and per panel question")
+    parser.add_argument("--upload-files", type=int, default=10)
+    parser.add_argument("--upload-words", type=int, default=5000)
+    parser.add_argument("--app-timeout", type=float, default=120.0, help="seconds allowed per Streamlit run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-workdir", action="store_true", help="leave the scratch app copy on disk")
+    add_spec_arguments(parser)
+    parser.set_defaults(scale=10)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+    original_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="legalsphere_bench_")
+
+    server = MockLettaServer(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                             endpoint_latency=parse_endpoint_latency(args.endpoint_latency)).start()
+    try:
+        prepare_workdir(workdir, server.url)
+        app = load_app_definitions()
+        from main import LettaClient
+
+        client = LettaClient(server.url)
+        agent_ids = list(server.state.agents)
+        agent_id = agent_ids[0]
+        print(f"Benchmarking in {workdir}")
+        conversations, cases = seed_history(app, args, agent_ids)
+
+        workloads = build_workloads(app, client, args, agent_id, conversations, cases)
+        selected = args.workloads.split(",") if args.workloads else list(workloads)
+        unknown = [name for name in selected if name not in workloads]
+        if unknown:
+            raise SystemExit(f"Unknown workloads: {', '.join(unknown)} (available: {', '.join(workloads)})")
+
+        print("Running workloads:")
+        results = {}
+        for name in selected:
+            result = workloads[name]()
+            if result is not None:
+                results[name] = result
+    finally:
+        server.stop()
+        os.chdir(original_cwd)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "compare", "workloads", "keep_workdir")},
+        "workloads": results
+    }
+
+    regressions = []
+    if compare:
+        with open(compare, "r") as f:
+            previous = json.load(f)
+        print(f"Compared with {compare}:")
+        regressions = compare_baselines(previous, report)
+
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+    if regressions:
+        print(f"p95 regressions over {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
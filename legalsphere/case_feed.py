@@ -0,0 +1,73 @@
+import time
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from state_store import StateStore, json_text
+from storage import decode_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS case_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    payload TEXT,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_case_changes_case_id ON case_changes (case_id);
+"""
+
+
+class CaseFeed:
+    """Shared case change feed: the newest record of every changed shared case, in sequence order.
+
+    Sessions poll it for the cases changed since their last position instead of
+    re-reading the whole shared case store. Kept in the state store database.
+    """
+
+    def __init__(self, state_store: StateStore):
+        self.state_store = state_store
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.state_store.connection()
+
+    def record_case_changes(self, upserts: Optional[Dict[str, dict]] = None,
+                            deletes: Iterable[str] = ()) -> int:
+        """Append changed or deleted shared cases to the feed and return the latest sequence number.
+
+        Each entry carries the full case record, so only the newest entry per case
+        is kept: a session behind that point still receives the current record.
+        """
+        conn = self._connection()
+        now = time.time()
+        changes = [(case_id, "upsert", json_text(case)) for case_id, case in (upserts or {}).items()]
+        changes += [(case_id, "delete", None) for case_id in deletes]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for case_id, operation, payload in changes:
+                seq = conn.execute(
+                    "INSERT INTO case_changes (case_id, operation, payload, changed_at) VALUES (?, ?, ?, ?)",
+                    (case_id, operation, payload, now)
+                ).lastrowid
+                conn.execute("DELETE FROM case_changes WHERE case_id = ? AND seq < ?", (case_id, seq))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_case_feed_position()
+
+    def get_case_feed_position(self) -> int:
+        """Sequence number of the newest case change, 0 if none were recorded"""
+        row = self._connection().execute("SELECT MAX(seq) FROM case_changes").fetchone()
+        return row[0] or 0
+
+    def get_case_changes(self, since_seq: int) -> List[Tuple[int, str, str, Optional[dict]]]:
+        """(seq, case_id, operation, case) for every case changed after `since_seq`, oldest first"""
+        rows = self._connection().execute(
+            "SELECT seq, case_id, operation, payload FROM case_changes WHERE seq > ? ORDER BY seq",
+            (since_seq,)
+        ).fetchall()
+        return [
+            (seq, case_id, operation, decode_json(payload) if payload else None)
+            for seq, case_id, operation, payload in rows
+        ]
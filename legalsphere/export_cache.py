@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import hashlib
+import fnmatch
+from typing import Dict, List, Optional
+
+from storage import encode_json, read_json, update_json
+
+# Retention defaults, overridable through the environment
+DEFAULT_MAX_EXPORT_BYTES = int(float(os.environ.get("LEGALSPHERE_EXPORT_MAX_MB", "500")) * 1024 * 1024)
+DEFAULT_MAX_EXPORT_AGE_DAYS = float(os.environ.get("LEGALSPHERE_EXPORT_MAX_AGE_DAYS", "30"))
+
+
+def fingerprint_item(item) -> str:
+    """Content hash of a conversation or log entry, used as its last-modified version"""
+    return hashlib.sha1(encode_json(item, sort_keys=True)).hexdigest()
+
+
+class ExportCache:
+    """Deduplicating cache and retention policy for generated export files.
+
+    Each export is keyed by (user, selected item ids and their versions, format).
+    Only files matching `patterns` in the managed directories are ever evicted,
+    so watermark and index files living alongside exports are left alone.
+    """
+
+    def __init__(self, index_path: str, managed: Dict[str, List[str]],
+                 max_bytes: int = DEFAULT_MAX_EXPORT_BYTES,
+                 max_age_days: float = DEFAULT_MAX_EXPORT_AGE_DAYS):
+        self.index_path = index_path
+        self.managed = managed
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600
+
+    def make_key(self, username: str, items: Dict[str, dict], export_format: str) -> str:
+        """Build a cache key from the user, the selected items' ids and versions, and the format"""
+        versions = sorted((str(item_id), fingerprint_item(item)) for item_id, item in items.items())
+        payload = json.dumps([username, export_format, versions])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            return read_json(self.index_path, {})
+        except Exception as e:
+            print(f"Error loading export cache index: {str(e)}")
+        return {}
+
+    def _update_index(self, mutate):
+        try:
+            update_json(self.index_path, mutate)
+        except Exception as e:
+            print(f"Error saving export cache index: {str(e)}")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the existing export file for this key, or None if it was never built or has been evicted"""
+        entry = self._load_index().get(key)
+        if not entry:
+            return None
+        if not os.path.exists(entry["path"]):
+            self._update_index(lambda index: index.pop(key, None))
+            return None
+
+        def touch(index):
+            if key in index:
+                index[key]["last_used"] = time.time()
+
+        self._update_index(touch)
+        return entry["path"]
+
+    def put(self, key: str, path: str):
+        """Record a freshly generated export file under its key and apply the retention policy"""
+        now = time.time()
+        self._update_index(lambda index: index.update({key: {"path": path, "created_at": now, "last_used": now}}))
+        self.enforce_retention()
+
+    def _managed_files(self) -> List[str]:
+        files = []
+        for directory, patterns in self.managed.items():
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+                    files.append(os.path.join(directory, filename))
+        return files
+
+    def enforce_retention(self) -> List[str]:
+        """Evict export files older than the age limit, then least-recently-used files over the size limit"""
+        index = self._load_index()
+        last_used = {entry["path"]: entry.get("last_used", 0) for entry in index.values()}
+        now = time.time()
+        removed = []
+
+        files = []
+        for path in self._managed_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                removed.append(path)
+            else:
+                files.append((max(stat.st_mtime, last_used.get(path, 0)), stat.st_size, path))
+
+        # Oldest-used first, so eviction for size keeps the most recently requested exports
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total_bytes <= self.max_bytes:
+                break
+            removed.append(path)
+            total_bytes -= size
+
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing expired export {path}: {str(e)}")
+
+        if removed:
+            removed_set = set(removed)
+
+            def drop_removed(index):
+                for key in [key for key, entry in index.items() if entry["path"] in removed_set]:
+                    del index[key]
+
+            self._update_index(drop_removed)
+
+        return removed
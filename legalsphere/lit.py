@@ -4,16 +4,30 @@ import tempfile
 import os
 import json
 from main import LettaClient
+from resilience import get_breaker
+from agent_pool import AgentPool
+from agent_index import AgentNameIndex
+from message_sync import MessageSync
+from panel import PanelConsultation
+from workflow_registry import WorkflowTemplateRegistry
+from workflow_scheduler import WorkflowScheduler, set_stage_status, stage_transitions
+from export_cache import ExportCache
+from archive import CASES, CONVERSATIONS, ItemArchive, is_archived, keep_restored
+from models import intern_case, intern_cases, intern_conversation, intern_conversations
+from storage import encode_json, read_json, write_json, update_json, set_version_tracker, get_lock_metrics
+from state_store import StateStore
+from case_feed import CaseFeed
+from workflow_store import WorkflowStore
+from stage_analytics import StageAnalytics
+from metrics import REGISTRY, timed, begin_rerun, end_rerun, render_prometheus, write_prometheus_textfile
 import uuid
 import datetime
-import pathlib
-import pandas as pd
-import csv
-import io
-import shutil
 
 st.set_page_config(page_title="LegalSphere", page_icon="⚖️", layout="wide")
 
+# Time this script run and count the HTTP calls it makes
+begin_rerun(st.session_state)
+
 # Directory to store conversation data files
 DATA_DIR = 'user_data'
 LOGS_DIR = 'audit_logs'
@@ -22,13 +36,88 @@ CASES_DIR = 'cases'
 SHARED_CASES_DIR = 'shared_cases'  # New directory for shared cases
 CONFIG_DIR = 'config'
 WORKFLOWS_DIR = 'workflows'  # New directory for workflow templates
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(LOGS_DIR, exist_ok=True)
-os.makedirs(EXPORTS_DIR, exist_ok=True)
-os.makedirs(CASES_DIR, exist_ok=True)
-os.makedirs(SHARED_CASES_DIR, exist_ok=True)  # Create the shared cases directory
-os.makedirs(CONFIG_DIR, exist_ok=True)
-os.makedirs(WORKFLOWS_DIR, exist_ok=True)  # Create the workflows directory
+ARCHIVE_DIR = 'archive'  # Compressed conversations and cases untouched for a while
+STAGE_DUE_DAYS = float(os.environ.get("LEGALSPHERE_STAGE_DUE_DAYS", "14"))  # Default time allowed per workflow stage
+AGENT_SOURCES_TTL = float(os.environ.get("LEGALSPHERE_AGENT_SOURCES_TTL", "60"))  # Seconds agent source lists are reused
+
+# One-time filesystem setup runs once per process, not on every rerun
+@st.cache_resource
+def create_data_directories():
+    """Create the data directories the app writes to"""
+    for directory in (DATA_DIR, LOGS_DIR, EXPORTS_DIR, CASES_DIR, SHARED_CASES_DIR, CONFIG_DIR, WORKFLOWS_DIR,
+                      ARCHIVE_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+create_data_directories()
+
+# Deduplicating cache and retention policy for generated export files
+EXPORT_CACHE = ExportCache(
+    os.path.join(EXPORTS_DIR, "export_index.json"),
+    {
+        EXPORTS_DIR: ["*_conversations_*", "*_messages_*"],
+        LOGS_DIR: ["exported_logs_*"]
+    }
+)
+
+@st.cache_resource
+def get_state_store():
+    """Shared SQLite state (change versions, audit events, caches), opened once per process"""
+    store = StateStore()
+    # Migrate the legacy JSON audit log the first time the store is created
+    store.import_audit_log(os.path.join(LOGS_DIR, "user_activity.log"))
+    return store
+
+STATE_STORE = get_state_store()
+set_version_tracker(STATE_STORE)
+
+@st.cache_resource
+def get_case_feed():
+    """Change feed of shared cases that admin sessions poll, kept in the state store"""
+    return CaseFeed(STATE_STORE)
+
+CASE_FEED = get_case_feed()
+
+@st.cache_resource
+def get_workflow_store():
+    """Per-case workflow progress and automated stage runs, kept in the state store"""
+    return WorkflowStore(STATE_STORE)
+
+WORKFLOW_STORE = get_workflow_store()
+
+@st.cache_resource
+def get_stage_analytics():
+    """Workflow stage transitions and their duration and throughput rollups, kept in the state store"""
+    return StageAnalytics(STATE_STORE)
+
+STAGE_ANALYTICS = get_stage_analytics()
+
+@st.cache_resource
+def get_agent_pool():
+    """Warm pool of pre-provisioned agents shared by all sessions, refilled in the background"""
+    pool = AgentPool(LettaClient(), STATE_STORE)
+    pool.start()
+    return pool
+
+AGENT_POOL = get_agent_pool()
+
+@st.cache_resource
+def get_agent_index():
+    """Id/name index of all agents, shared by all sessions through the state store cache"""
+    return AgentNameIndex(LettaClient(), STATE_STORE)
+
+AGENT_INDEX = get_agent_index()
+
+@st.cache_resource
+def get_message_sync():
+    """Incremental pull of messages agents produced outside LegalSphere"""
+    return MessageSync(LettaClient(), STATE_STORE)
+
+MESSAGE_SYNC = get_message_sync()
+
+@st.cache_data(ttl=AGENT_SOURCES_TTL, show_spinner=False)
+def get_agent_sources(_client, agent_id):
+    """Sources attached to an agent, shared by all sessions; sources are attached in Letta, not here"""
+    return _client.get_agent_sources(agent_id)
 
 # Define default workflow templates
 DEFAULT_WORKFLOWS = {
@@ -76,6 +165,13 @@ DEFAULT_WORKFLOWS = {
     }
 }
 
+@st.cache_resource
+def get_workflow_registry():
+    """Built-in and custom workflow templates, reloaded only when a template file changes"""
+    return WorkflowTemplateRegistry(WORKFLOWS_DIR, DEFAULT_WORKFLOWS)
+
+WORKFLOW_REGISTRY = get_workflow_registry()
+
 # Create a default agent config if it doesn't exist
 DEFAULT_AGENT_CONFIG = {
     "name": "Default Agent",
@@ -85,10 +181,14 @@ DEFAULT_AGENT_CONFIG = {
     "tools": []
 }
 
-agent_config_path = os.path.join(CONFIG_DIR, 'agent_config.json')
-if not os.path.exists(agent_config_path):
-    with open(agent_config_path, 'w') as f:
-        json.dump(DEFAULT_AGENT_CONFIG, f, indent=2)
+@st.cache_resource
+def write_default_agent_config():
+    """Write the default agent config once per process if none exists"""
+    agent_config_path = os.path.join(CONFIG_DIR, 'agent_config.json')
+    if not os.path.exists(agent_config_path):
+        write_json(agent_config_path, DEFAULT_AGENT_CONFIG, indent=True)  # Kept readable for hand editing
+
+write_default_agent_config()
 
 # RBAC user database (in-memory)
 ROLES = {
@@ -120,24 +220,24 @@ def get_conversation_file_path(username):
     safe_username = username.replace('/', '_').replace('\\', '_')
     return os.path.join(DATA_DIR, f"{safe_username}_conversations.json")
 
+@timed("save_conversations")
 def save_conversations(username, conversations):
     """Save conversations to a JSON file"""
     try:
         file_path = get_conversation_file_path(username)
-        with open(file_path, 'w') as f:
-            json.dump(conversations, f)
+        # Never turn a conversation another session restored back into its archived stub
+        mark_store_fresh(file_path, write_json(file_path, conversations, merge=keep_restored))
     except Exception as e:
         st.error(f"Error saving conversations: {str(e)}")
 
+@timed("load_conversations")
 def load_conversations(username):
     """Load conversations from a JSON file"""
     file_path = get_conversation_file_path(username)
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading conversations: {str(e)}")
+    try:
+        return intern_conversations(read_json(file_path, {}))
+    except Exception as e:
+        st.error(f"Error loading conversations: {str(e)}")
     return {}
 
 # Case management functions
@@ -150,48 +250,47 @@ def get_shared_case_file_path():
     """Get the file path for shared cases between legal advisors and admin"""
     return os.path.join(SHARED_CASES_DIR, "shared_cases.json")
 
+@timed("save_cases")
 def save_cases(username, cases):
     """Save cases to a JSON file"""
     try:
         # Save to user's personal cases file
         file_path = get_case_file_path(username)
-        with open(file_path, 'w') as f:
-            json.dump(cases, f)
+        # Never turn a restored case back into its stub or put back an older workflow
+        mark_store_fresh(file_path, write_json(file_path, cases, merge=merge_session_cases))
         
         # If user is a legal advisor, also save to the shared cases file
         if st.session_state.user_role == "legal_advisor":
-            shared_file_path = get_shared_case_file_path()
-            shared_cases = {}
+            # Add this legal advisor's cases to the shared cases under the shared file's lock
+            changed_cases = {}
+            def merge_advisor_cases(shared_cases):
+                for case_id, case in cases.items():
+                    # Add creator information if it doesn't exist
+                    if "creator" not in case:
+                        case["creator"] = username
+                    if is_archived(case) and not is_archived(shared_cases.get(case_id) or case):
+                        continue  # Restored since this session loaded the stub
+                    keep_newer_workflow(shared_cases.get(case_id), case)
+                    if shared_cases.get(case_id) != case:
+                        changed_cases[case_id] = case
+                    shared_cases[case_id] = case
             
-            # Load existing shared cases if they exist
-            if os.path.exists(shared_file_path):
-                with open(shared_file_path, 'r') as f:
-                    shared_cases = json.load(f)
-            
-            # Add this legal advisor's cases to the shared cases
-            for case_id, case in cases.items():
-                # Add creator information if it doesn't exist
-                if "creator" not in case:
-                    case["creator"] = username
-                shared_cases[case_id] = case
-            
-            # Save the updated shared cases
-            with open(shared_file_path, 'w') as f:
-                json.dump(shared_cases, f)
+            # Publish only the changed cases to the change feed admins poll
+            update_json(get_shared_case_file_path(), merge_advisor_cases,
+                        after_write=publish_case_changes(changed_cases))
         
         # If user is an admin, check if any of the cases are from legal advisors and update the shared file
         elif st.session_state.user_role == "admin":
             shared_file_path = get_shared_case_file_path()
             if os.path.exists(shared_file_path):
-                try:
-                    # Load shared cases
-                    with open(shared_file_path, 'r') as f:
-                        shared_cases = json.load(f)
-                    
-                    # Check each case the admin has
+                # Check each case the admin has against the current shared cases
+                changed_cases = {}
+                def merge_admin_changes(shared_cases):
                     for case_id, case in cases.items():
                         # If this case exists in shared cases and has a creator that's not the admin
                         if case_id in shared_cases and "creator" in case and case["creator"] != username:
+                            if is_archived(case) and not is_archived(shared_cases[case_id]):
+                                continue  # Restored by its advisor since this session loaded the stub
                             # Update the shared case with admin's changes, but keep original title and creator
                             original_title = shared_cases[case_id]["title"] if "title" in shared_cases[case_id] else case["title"]
                             original_creator = shared_cases[case_id]["creator"] if "creator" in shared_cases[case_id] else case["creator"]
@@ -202,50 +301,105 @@ def save_cases(username, cases):
                                 updated_case["title"] = original_title
                             
                             updated_case["creator"] = original_creator
+                            keep_newer_workflow(shared_cases[case_id], updated_case)
+                            if shared_cases[case_id] != updated_case:
+                                changed_cases[case_id] = updated_case
                             shared_cases[case_id] = updated_case
-                    
-                    # Save the updated shared cases
-                    with open(shared_file_path, 'w') as f:
-                        json.dump(shared_cases, f)
+                
+                try:
+                    update_json(shared_file_path, merge_admin_changes, after_write=publish_case_changes(changed_cases))
                 except Exception as e:
                     st.error(f"Error updating shared cases as admin: {str(e)}")
     except Exception as e:
         st.error(f"Error saving cases: {str(e)}")
 
+@timed("load_cases")
 def load_cases(username):
     """Load cases from a JSON file"""
     # Start with the user's personal cases
     user_cases = {}
     file_path = get_case_file_path(username)
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r') as f:
-                user_cases = json.load(f)
-        except Exception as e:
-            st.error(f"Error loading user cases: {str(e)}")
+    try:
+        user_cases = intern_cases(read_json(file_path, {}))
+    except Exception as e:
+        st.error(f"Error loading user cases: {str(e)}")
     
     # If user is an admin, also load shared cases from legal advisors
     if st.session_state.user_role == "admin":
         shared_file_path = get_shared_case_file_path()
         if os.path.exists(shared_file_path):
             try:
-                with open(shared_file_path, 'r') as f:
-                    shared_cases = json.load(f)
+                shared_cases = read_json(shared_file_path, {})
                 
                 # Add shared cases to the admin's view, but mark them as from legal advisors
                 for case_id, case in shared_cases.items():
                     if case_id not in user_cases:  # Don't override admin's own cases with same ID
-                        # Add a label to show it's from a legal advisor
-                        if "creator" in case:
-                            case["title"] = f"{case['title']} (by {case['creator']})"
-                        else:
-                            case["title"] = f"{case['title']} (shared)"
-                        user_cases[case_id] = case
+                        user_cases[case_id] = label_shared_case(intern_case(case))
             except Exception as e:
                 st.error(f"Error loading shared cases: {str(e)}")
     
     return user_cases
 
+def publish_case_changes(upserts=None, deletes=()):
+    """`after_write` hook for shared case writes: appends the changes to the case change feed.
+    
+    It runs once the shared file is written and before its lock is released, so the feed
+    never announces unsaved changes and its order matches the order of the writes.
+    `upserts` may still be filled in by the mutate that precedes the write.
+    """
+    def publish(shared_cases):
+        if upserts or deletes:
+            CASE_FEED.record_case_changes(upserts, deletes)
+    return publish
+
+def label_shared_case(case):
+    """Add a label to a shared case's title to show it's from a legal advisor"""
+    if "creator" in case:
+        case["title"] = f"{case['title']} (by {case['creator']})"
+    else:
+        case["title"] = f"{case['title']} (shared)"
+    return case
+
+def apply_shared_case_changes(username):
+    """Merge shared cases changed since this admin session last polled the case change feed"""
+    for seq, case_id, operation, case in CASE_FEED.get_case_changes(st.session_state.case_feed_seq):
+        existing = st.session_state.cases.get(case_id)
+        # Never override the admin's own cases with the same ID
+        if not (existing and existing.get("creator") == username):
+            if operation == "delete":
+                st.session_state.cases.pop(case_id, None)
+            else:
+                st.session_state.cases[case_id] = label_shared_case(intern_case(case))
+        st.session_state.case_feed_seq = seq
+
+# Multi-process freshness: each store has a shared change version
+def get_session_store_paths(username):
+    """Paths of the JSON stores a user's session holds in memory (admins follow shared cases via the change feed)"""
+    return [get_conversation_file_path(username), get_case_file_path(username)]
+
+def mark_store_fresh(path, version):
+    """Record that this session's copy of a store matches `version`, unless another writer got in between"""
+    known = st.session_state.get("store_versions")
+    if version is not None and known is not None and known.get(path) == version - 1:
+        known[path] = version
+
+def refresh_session_stores(username):
+    """Reload only the stores another session or process changed since this session loaded them"""
+    conversations_path, cases_path = get_session_store_paths(username)
+    versions = STATE_STORE.get_versions([conversations_path, cases_path])
+    known = st.session_state.store_versions
+    
+    if versions[conversations_path] != known.get(conversations_path):
+        st.session_state.conversations = load_conversations(username)
+    if versions[cases_path] != known.get(cases_path):
+        feed_position = CASE_FEED.get_case_feed_position()
+        st.session_state.cases = load_cases(username)
+        st.session_state.case_feed_seq = feed_position
+    elif st.session_state.user_role == "admin":
+        apply_shared_case_changes(username)
+    
+    st.session_state.store_versions = versions
+
 # Create new case
 def create_new_case(title, agents=None):
     """Create a new legal case with the given title and optional pre-selected agents"""
@@ -275,33 +429,114 @@ def create_new_case(title, agents=None):
 # Workflow management functions
 def get_workflow_templates():
     """Get all available workflow templates"""
-    # Load default templates
-    templates = DEFAULT_WORKFLOWS.copy()
+    return WORKFLOW_REGISTRY.all()
+
+def compute_workflow_progress(workflow):
+    """Progress aggregates of a workflow: stage counts, percentage and current stage"""
+    stages = workflow["stages"]
+    completed_stages = sum(1 for stage in stages if stage["status"] == "completed")
+    current_stage = stages[workflow["current_stage_index"]] if stages else None
+    return {
+        "total_stages": len(stages),
+        "completed_stages": completed_stages,
+        "progress_pct": int((completed_stages / len(stages)) * 100) if stages else 0,
+        "current_stage": current_stage["name"] if current_stage else None,
+        "current_status": current_stage["status"] if current_stage else None
+    }
+
+def get_workflow_progress(workflow):
+    """Stored progress of a workflow, computed only for workflows saved before progress was stored"""
+    return workflow.get("progress") or compute_workflow_progress(workflow)
+
+def workflow_progress_row(case, progress):
+    """Portfolio dashboard row for a case's workflow progress"""
+    workflow = case["workflow"]
+    current_stage = workflow["stages"][workflow["current_stage_index"]] if workflow["stages"] else {}
+    started = parse_timestamp(current_stage.get("start_date"))
+    stage_started_at = started.timestamp() if started else None
+    due_days = current_stage.get("due_days", STAGE_DUE_DAYS)
+    return {
+        "title": case.get("title"),
+        "owner": case.get("creator"),
+        "workflow_name": workflow["name"],
+        "current_stage": progress["current_stage"],
+        "current_status": progress["current_status"],
+        "completed_stages": progress["completed_stages"],
+        "total_stages": progress["total_stages"],
+        "stage_started_at": stage_started_at,
+        "stage_due_at": stage_started_at + due_days * 86400 if stage_started_at is not None else None
+    }
+
+def refresh_workflow_progress(case_id, case):
+    """Recompute a case's workflow aggregates after a workflow change and publish them to the dashboard"""
+    progress = compute_workflow_progress(case["workflow"])
+    case["workflow"]["progress"] = progress
+    try:
+        WORKFLOW_STORE.upsert_workflow_progress(case_id, workflow_progress_row(case, progress))
+    except Exception as e:
+        print(f"Error publishing workflow progress: {str(e)}")
+
+def record_stage_transitions(case_id, case, changes, timestamp):
+    """Publish a case's stage status changes to the stage analytics"""
+    try:
+        STAGE_ANALYTICS.record_stage_transitions(
+            stage_transitions(case_id, case, changes, st.session_state.username, timestamp)
+        )
+    except Exception as e:
+        print(f"Error recording stage transitions: {str(e)}")
+
+def workflow_revision(workflow):
+    """How many times a workflow was changed in its owner's store (see update_stored_case)"""
+    return (workflow or {}).get("revision", 0)
+
+def keep_newer_workflow(stored_case, case):
+    """Replace `case`'s workflow with the stored one if the store has a newer revision of it.
     
-    # Check for custom templates in the WORKFLOWS_DIR
-    for filename in os.listdir(WORKFLOWS_DIR):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(WORKFLOWS_DIR, filename), 'r') as f:
-                    custom_template = json.load(f)
-                    template_id = os.path.splitext(filename)[0]
-                    templates[template_id] = custom_template
-            except Exception as e:
-                print(f"Error loading workflow template {filename}: {str(e)}")
+    Workflow changes are made in the owner's store (update_stored_case), by this session or by
+    the workflow scheduler, so a session that saves its cases never puts back an older workflow.
+    """
+    stored_workflow = (stored_case or {}).get("workflow")
+    if stored_workflow and workflow_revision(stored_workflow) > workflow_revision(case.get("workflow")):
+        case["workflow"] = stored_workflow
+
+def merge_session_cases(stored, cases):
+    """`write_json` merge for a session's cases: restored items and newer workflows in the store win"""
+    keep_restored(stored, cases)
+    for case_id, case in cases.items():
+        keep_newer_workflow((stored or {}).get(case_id), case)
+    return cases
+
+def change_case_workflow(case_id, change):
+    """Apply `change(case)` to a case in its owner's store and copy the resulting workflow into this session.
     
-    return templates
+    Returns the session's case, or None if `change` declined. Cases not saved yet are changed in
+    the session and saved.
+    """
+    case = st.session_state.cases[case_id]
+    owner = case.get("creator") or st.session_state.username
+    if owner and case_id in read_json(get_case_file_path(owner), {}):
+        updated = update_stored_case(owner, case_id, change)
+        if updated is None:
+            return None
+        case["workflow"] = updated["workflow"]
+        return case
+    if not change(case):
+        return None
+    refresh_workflow_progress(case_id, case)
+    if st.session_state.username:
+        save_cases(st.session_state.username, st.session_state.cases)
+    return case
 
-def assign_workflow_to_case(case_id, workflow_template_id):
-    """Assign a workflow template to a case"""
+def assign_workflow_to_case(case_id, workflow_template_id, automated=False):
+    """Assign a workflow template to a case; in automated mode stages with a prompt are run by the case's agents"""
     if case_id not in st.session_state.cases:
         return False
     
-    templates = get_workflow_templates()
-    if workflow_template_id not in templates:
+    # Create a copy of the template for this case
+    template = WORKFLOW_REGISTRY.get(workflow_template_id)
+    if template is None:
         return False
     
-    # Create a copy of the template for this case
-    template = templates[workflow_template_id]
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     # Initialize the workflow with stages from the template
@@ -311,6 +546,7 @@ def assign_workflow_to_case(case_id, workflow_template_id):
         "description": template["description"],
         "assigned_at": timestamp,
         "current_stage_index": 0,  # Start at the first stage
+        "automated": automated,
         "stages": []
     }
     
@@ -325,18 +561,23 @@ def assign_workflow_to_case(case_id, workflow_template_id):
             "completion_date": None,
             "notes": ""
         })
+        for optional_field in ("due_days", "prompt"):
+            if optional_field in stage:
+                workflow["stages"][-1][optional_field] = stage[optional_field]
     
     # Set the first stage to in_progress
     if workflow["stages"]:
         workflow["stages"][0]["status"] = "in_progress"
         workflow["stages"][0]["start_date"] = timestamp
     
-    # Assign the workflow to the case
-    st.session_state.cases[case_id]["workflow"] = workflow
-    
-    # Save the updated cases
-    if st.session_state.username:
-        save_cases(st.session_state.username, st.session_state.cases)
+    # Assign the workflow to the case, continuing the revisions of any workflow it replaces
+    def assign(stored_case):
+        workflow["revision"] = workflow_revision(stored_case.get("workflow"))
+        stored_case["workflow"] = workflow
+        return True
+    case = change_case_workflow(case_id, assign)
+    if workflow["stages"]:
+        record_stage_transitions(case_id, case, [(0, "not_started", "in_progress")], timestamp)
     
     # Log the action
     log_user_action(
@@ -345,10 +586,12 @@ def assign_workflow_to_case(case_id, workflow_template_id):
         {
             "case_id": case_id,
             "workflow_name": template["name"],
-            "template_id": workflow_template_id
+            "template_id": workflow_template_id,
+            "automated": automated
         }
     )
     
+    WORKFLOW_SCHEDULER.schedule_current_stage(case_id, case)
     return True
 
 def update_workflow_stage_status(case_id, stage_index, new_status):
@@ -356,36 +599,19 @@ def update_workflow_stage_status(case_id, stage_index, new_status):
     if case_id not in st.session_state.cases:
         return False
     
-    case = st.session_state.cases[case_id]
-    if not case.get("workflow") or "stages" not in case["workflow"]:
-        return False
-    
-    workflow = case["workflow"]
-    if stage_index < 0 or stage_index >= len(workflow["stages"]):
-        return False
-    
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    stage = workflow["stages"][stage_index]
-    old_status = stage["status"]
-    stage["status"] = new_status
-    
-    # Set appropriate dates
-    if new_status == "in_progress" and not stage["start_date"]:
-        stage["start_date"] = timestamp
-    elif new_status == "completed" and not stage["completion_date"]:
-        stage["completion_date"] = timestamp
-    
-    # If this stage is completed, move to the next stage
-    if new_status == "completed" and stage_index < len(workflow["stages"]) - 1:
-        workflow["current_stage_index"] = stage_index + 1
-        # Set the next stage to in_progress
-        next_stage = workflow["stages"][stage_index + 1]
-        next_stage["status"] = "in_progress"
-        next_stage["start_date"] = timestamp
+    changes = []
+    def change_status(stored_case):
+        workflow = stored_case.get("workflow")
+        if not workflow or not 0 <= stage_index < len(workflow.get("stages", [])):
+            return False
+        changes[:] = set_stage_status(workflow, stage_index, new_status, timestamp)
+        return True
+    case = change_case_workflow(case_id, change_status)
+    if case is None:
+        return False
     
-    # Save the updated cases
-    if st.session_state.username:
-        save_cases(st.session_state.username, st.session_state.cases)
+    record_stage_transitions(case_id, case, changes, timestamp)
     
     # Log the action
     log_user_action(
@@ -393,12 +619,16 @@ def update_workflow_stage_status(case_id, stage_index, new_status):
         "update_workflow_stage", 
         {
             "case_id": case_id,
-            "stage_name": stage["name"],
-            "old_status": old_status,
+            "stage_name": case["workflow"]["stages"][stage_index]["name"],
+            "old_status": changes[0][1],
             "new_status": new_status
         }
     )
     
+    # Completing a stage by hand hands the next one to the scheduler if it is automated
+    if new_status == "completed":
+        WORKFLOW_SCHEDULER.schedule_current_stage(case_id, case)
+    
     return True
 
 def update_workflow_stage_notes(case_id, stage_index, notes):
@@ -406,26 +636,21 @@ def update_workflow_stage_notes(case_id, stage_index, notes):
     if case_id not in st.session_state.cases:
         return False
     
-    case = st.session_state.cases[case_id]
-    if not case.get("workflow") or "stages" not in case["workflow"]:
-        return False
-    
-    workflow = case["workflow"]
-    if stage_index < 0 or stage_index >= len(workflow["stages"]):
-        return False
-    
-    stage = workflow["stages"][stage_index]
-    stage["notes"] = notes
-    
-    # Save the updated cases
-    if st.session_state.username:
-        save_cases(st.session_state.username, st.session_state.cases)
+    def change_notes(stored_case):
+        workflow = stored_case.get("workflow")
+        if not workflow or not 0 <= stage_index < len(workflow.get("stages", [])):
+            return False
+        if workflow["stages"][stage_index].get("notes") == notes:
+            return False
+        workflow["stages"][stage_index]["notes"] = notes
+        return True
+    change_case_workflow(case_id, change_notes)
     
     return True
 
 # Create new conversation within a case
-def create_case_conversation(case_id, title=None, agent_id=None):
-    """Create a new conversation within a case"""
+def create_case_conversation(case_id, title=None, agent_id=None, panel=False, aggregate=False):
+    """Create a new conversation within a case; a panel conversation asks all case agents at once"""
     conversation_id = str(uuid.uuid4())
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
@@ -440,6 +665,8 @@ def create_case_conversation(case_id, title=None, agent_id=None):
         "messages": [],
         "agent_id": agent_id
     }
+    if panel:
+        st.session_state.cases[case_id]["conversations"][conversation_id].update({"mode": "panel", "aggregate": aggregate})
     
     # Save the updated cases
     if st.session_state.username:
@@ -451,7 +678,40 @@ def create_case_conversation(case_id, title=None, agent_id=None):
     
     return conversation_id
 
+def show_panel_answers(answers):
+    """Show one column per panel agent with its answer and reasoning"""
+    for column, message in zip(st.columns(len(answers)), answers):
+        with column:
+            st.markdown(f"**{message.get('agent_name', 'Agent')}**")
+            st.markdown(message["content"])
+            if message.get("reasoning") and has_permission("view_reasoning"):
+                with st.expander("View Agent Reasoning"):
+                    st.markdown(message["reasoning"])
+
+def show_case_messages(messages):
+    """Show a case conversation, grouping consecutive panel answers into columns"""
+    panel_answers = []
+    for message in messages + [None]:
+        if message is not None and message.get("panel"):
+            panel_answers.append(message)
+            continue
+        if panel_answers:
+            with st.chat_message("assistant"):
+                show_panel_answers(panel_answers)
+            panel_answers = []
+        if message is None:
+            break
+        with st.chat_message(message["role"]):
+            if message.get("aggregate"):
+                st.markdown("**Panel summary**")
+            st.markdown(message["content"])
+            # Only show reasoning expander if reasoning exists and user has permission
+            if "reasoning" in message and message["reasoning"] and has_permission("view_reasoning"):
+                with st.expander("View Agent Reasoning"):
+                    st.markdown(message["reasoning"])
+
 # Audit logging functions
+@timed("log_user_action")
 def log_user_action(username, action, details=None):
     """Log a user action to the audit log file"""
     if not username:
@@ -467,40 +727,30 @@ def log_user_action(username, action, details=None):
         "ip_address": "127.0.0.1"  # In a real app, you'd get the actual IP
     }
     
-    log_file = os.path.join(LOGS_DIR, "user_activity.log")
-    
     try:
-        # Load existing logs
-        existing_logs = []
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                existing_logs = json.load(f)
-        
-        # Add new log entry
-        existing_logs.append(log_entry)
-        
-        # Save updated logs
-        with open(log_file, 'w') as f:
-            json.dump(existing_logs, f, indent=2)
+        STATE_STORE.append_audit_event(log_entry)
     except Exception as e:
         print(f"Error logging user action: {str(e)}")
 
-def get_audit_logs():
-    """Get all audit logs"""
-    log_file = os.path.join(LOGS_DIR, "user_activity.log")
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Error reading audit logs: {str(e)}")
+@timed("get_audit_logs")
+def get_audit_logs(username_filter=None, action=None, date=None):
+    """Get audit logs, optionally filtered by username substring, action and date (YYYY-MM-DD)"""
+    try:
+        return STATE_STORE.get_audit_events(username_filter, action, date)
+    except Exception as e:
+        st.error(f"Error reading audit logs: {str(e)}")
     return []
 
 # Export functions for conversation history
+def unique_export_name(prefix, extension):
+    """Timestamped export file name with a random suffix, so exports started in the same second never collide"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.{extension}"
+
+@timed("export_conversations_to_txt")
 def export_conversations_to_txt(username, conversations):
     """Export all conversations to a txt file"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    export_path = os.path.join(EXPORTS_DIR, f"{username}_conversations_{timestamp}.txt")
+    export_path = os.path.join(EXPORTS_DIR, unique_export_name(f"{username}_conversations", "txt"))
     
     try:
         with open(export_path, 'w', encoding='utf-8') as f:
@@ -523,10 +773,11 @@ def export_conversations_to_txt(username, conversations):
         print(f"Error exporting conversations to TXT: {str(e)}")
         return None
 
+@timed("export_conversations_to_csv")
 def export_conversations_to_csv(username, conversations):
     """Export all conversations to a CSV file"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    export_path = os.path.join(EXPORTS_DIR, f"{username}_conversations_{timestamp}.csv")
+    import csv
+    export_path = os.path.join(EXPORTS_DIR, unique_export_name(f"{username}_conversations", "csv"))
     
     try:
         with open(export_path, 'w', newline='', encoding='utf-8') as f:
@@ -549,12 +800,14 @@ def export_conversations_to_csv(username, conversations):
         print(f"Error exporting conversations to CSV: {str(e)}")
         return None
 
+@timed("export_conversations_to_pdf")
 def export_conversations_to_pdf(username, conversations):
     """Export all conversations to a PDF file"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    export_path = os.path.join(EXPORTS_DIR, f"{username}_conversations_{timestamp}.pdf")
+    export_path = os.path.join(EXPORTS_DIR, unique_export_name(f"{username}_conversations", "pdf"))
     
     try:
+        # Imported on first use so the PDF library is not loaded at startup
+        from fpdf import FPDF
         pdf = FPDF()
         pdf.set_auto_page_break(auto=True, margin=15)
         pdf.add_page()
@@ -611,6 +864,345 @@ def export_conversations_to_pdf(username, conversations):
         print(f"Error exporting conversations to PDF: {str(e)}")
         return None
 
+# Columnar (Parquet / Arrow IPC) export functions for analytics
+COLUMNAR_FORMATS = {"parquet": "parquet", "arrow": "arrow"}  # Format name -> file extension
+COLUMNAR_BATCH_SIZE = 5000  # Rows buffered in memory before a record batch is written
+EXPORT_WATERMARKS_FILE = os.path.join(EXPORTS_DIR, "columnar_watermarks.json")
+
+def parse_timestamp(value):
+    """Parse a stored "%Y-%m-%d %H:%M:%S" timestamp, returning None if missing or malformed"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+def load_export_watermarks():
+    """Load the position of the last exported row for each incremental columnar export"""
+    try:
+        return read_json(EXPORT_WATERMARKS_FILE, {})
+    except Exception as e:
+        print(f"Error loading export watermarks: {str(e)}")
+    return {}
+
+def save_export_watermarks(positions):
+    """Record the last row included in an incremental columnar export, per watermark key"""
+    try:
+        update_json(EXPORT_WATERMARKS_FILE, lambda watermarks: watermarks.update(positions))
+    except Exception as e:
+        print(f"Error saving export watermark: {str(e)}")
+
+def conversation_watermark_key(username, case_id, conversation_id):
+    """Incremental export watermark of one regular or case conversation: the index of its last exported message"""
+    return f"messages:{username}:{case_id or ''}:{conversation_id}"
+
+def load_user_cases(username):
+    """Load a user's own cases file, without merging in shared cases"""
+    file_path = get_case_file_path(username)
+    try:
+        return read_json(file_path, {})
+    except Exception as e:
+        print(f"Error loading cases for {username}: {str(e)}")
+    return {}
+
+def iter_conversation_message_rows(username, conversations, cases=None, since=None):
+    """Yield one row per message from regular and case conversations.
+    
+    `since` maps conversation watermark keys (see conversation_watermark_key) to the index
+    of the last message already exported; only later messages of those conversations are yielded.
+    Messages are only ever appended, so their index orders them even within one second.
+    """
+    def conversation_rows(conv, case):
+        conv_created = parse_timestamp(conv.get('created_at'))
+        conv_since = (since or {}).get(conversation_watermark_key(username, case["id"] if case else None, conv.get('id')), -1)
+        for index, msg in enumerate(conv.get('messages', [])):
+            if index <= conv_since:
+                continue
+            # Messages saved before per-message timestamps fall back to the conversation's creation time
+            timestamp = parse_timestamp(msg.get('timestamp')) or conv_created
+            yield {
+                "username": username,
+                "case_id": case["id"] if case else None,
+                "case_title": case.get("title") if case else None,
+                "conversation_id": conv.get('id'),
+                "conversation_title": conv.get('title'),
+                "agent_id": conv.get('agent_id'),
+                "message_index": index,
+                "role": msg.get('role'),
+                "content": msg.get('content', ''),
+                "reasoning": msg.get('reasoning', ''),
+                "timestamp": timestamp
+            }
+
+    for conv in conversations.values():
+        yield from conversation_rows(conv, None)
+    for case in (cases or {}).values():
+        for conv in case.get("conversations", {}).values():
+            yield from conversation_rows(conv, case)
+
+def iter_audit_log_rows(logs, since=None):
+    """Yield one typed row per audit log entry, after the entry with id `since` if given"""
+    for log in logs:
+        if since is not None and log["id"] <= since:
+            continue
+        timestamp = parse_timestamp(log.get("timestamp"))
+        yield {
+            "timestamp": timestamp,
+            "username": log.get("username"),
+            "role": log.get("role"),
+            "action": log.get("action"),
+            "details": json.dumps(log.get("details", {})),
+            "ip_address": log.get("ip_address")
+        }
+
+def write_columnar_rows(rows, schema, export_path, export_format, batch_size=COLUMNAR_BATCH_SIZE):
+    """Write rows to a Parquet or Arrow IPC file in record batches and return the row count"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(export_path, schema)
+        write_batch = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_file(export_path, schema)
+        write_batch = writer.write_batch
+
+    row_count = 0
+    buffer = []
+    try:
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= batch_size:
+                write_batch(pa.RecordBatch.from_pylist(buffer, schema=schema))
+                row_count += len(buffer)
+                buffer = []
+        if buffer:
+            write_batch(pa.RecordBatch.from_pylist(buffer, schema=schema))
+            row_count += len(buffer)
+    finally:
+        writer.close()
+
+    return row_count
+
+@timed("export_conversations_to_columnar")
+def export_conversations_to_columnar(username, conversations, cases=None, export_format="parquet", incremental=False):
+    """Export conversation messages to a Parquet or Arrow file, optionally only those since the last export"""
+    import pyarrow as pa
+
+    export_path = os.path.join(EXPORTS_DIR, unique_export_name(f"{username}_messages", COLUMNAR_FORMATS[export_format]))
+    # One watermark per conversation, so exporting some conversations never hides older messages of others
+    since = {}
+    if incremental:
+        since = {key: value for key, value in load_export_watermarks().items()
+                 if key.startswith(f"messages:{username}:")}
+
+    schema = pa.schema([
+        ("username", pa.string()),
+        ("case_id", pa.string()),
+        ("case_title", pa.string()),
+        ("conversation_id", pa.string()),
+        ("conversation_title", pa.string()),
+        ("agent_id", pa.string()),
+        ("message_index", pa.int32()),
+        ("role", pa.dictionary(pa.int8(), pa.string())),
+        ("content", pa.string()),
+        ("reasoning", pa.string()),
+        ("timestamp", pa.timestamp("s"))
+    ])
+
+    try:
+        last_exported = {}
+        def tracked(rows):
+            for row in rows:
+                key = conversation_watermark_key(username, row["case_id"], row["conversation_id"])
+                last_exported[key] = max(last_exported.get(key, -1), row["message_index"])
+                yield row
+
+        rows = iter_conversation_message_rows(username, conversations, cases, since)
+        row_count = write_columnar_rows(tracked(rows), schema, export_path, export_format)
+        if incremental and last_exported:
+            save_export_watermarks(last_exported)
+        return export_path, row_count
+    except Exception as e:
+        print(f"Error exporting conversations to {export_format}: {str(e)}")
+        return None, 0
+
+@timed("export_audit_logs_to_columnar")
+def export_audit_logs_to_columnar(logs, export_format="parquet", incremental=False):
+    """Export the full audit log to a Parquet or Arrow file, optionally only entries added since the last export"""
+    import pyarrow as pa
+
+    export_path = os.path.join(LOGS_DIR, unique_export_name("exported_logs", COLUMNAR_FORMATS[export_format]))
+    # The id of the last exported entry: entries logged in the same second are still told apart
+    watermark_key = "audit_log_id"
+    since = load_export_watermarks().get(watermark_key) if incremental else None
+
+    schema = pa.schema([
+        ("timestamp", pa.timestamp("s")),
+        ("username", pa.string()),
+        ("role", pa.dictionary(pa.int8(), pa.string())),
+        ("action", pa.dictionary(pa.int16(), pa.string())),
+        ("details", pa.string()),
+        ("ip_address", pa.string())
+    ])
+
+    try:
+        last_exported = {}
+        def tracked(logs):
+            for log in logs:
+                last_exported[watermark_key] = log["id"]  # Entries come in insertion order
+                yield log
+
+        row_count = write_columnar_rows(iter_audit_log_rows(tracked(logs), since), schema, export_path, export_format)
+        if incremental and last_exported:
+            save_export_watermarks(last_exported)
+        return export_path, row_count
+    except Exception as e:
+        print(f"Error exporting audit logs to {export_format}: {str(e)}")
+        return None, 0
+
+def stored_stage_transitions(case_id, case):
+    """Stage transitions reconstructed from the start and completion dates saved in a case's workflow"""
+    transitions = []
+    for index, stage in enumerate(case["workflow"]["stages"]):
+        if stage.get("start_date"):
+            transitions += stage_transitions(case_id, case, [(index, "not_started", "in_progress")], None,
+                                             stage["start_date"])
+        if stage.get("completion_date"):
+            transitions += stage_transitions(case_id, case, [(index, "in_progress", "completed")], None,
+                                             stage["completion_date"])
+    return transitions
+
+@st.cache_resource
+def backfill_workflow_progress():
+    """One-time import of the progress and stage history of workflows saved before they were maintained"""
+    progress, transitions = {}, {}
+    paths = [os.path.join(CASES_DIR, filename) for filename in os.listdir(CASES_DIR) if filename.endswith("_cases.json")]
+    paths.append(get_shared_case_file_path())
+    for path in paths:
+        try:
+            cases = read_json(path, {})
+        except Exception as e:
+            print(f"Error reading cases from {path}: {str(e)}")
+            continue
+        for case_id, case in cases.items():
+            if case.get("workflow"):
+                progress[case_id] = workflow_progress_row(case, get_workflow_progress(case["workflow"]))
+                transitions[case_id] = stored_stage_transitions(case_id, case)
+    STAGE_ANALYTICS.import_stage_transitions(
+        sorted((transition for case_transitions in transitions.values() for transition in case_transitions),
+               key=lambda transition: transition["occurred_at"])
+    )
+    return WORKFLOW_STORE.import_workflow_progress(progress)
+
+backfill_workflow_progress()
+
+# Stored case access for background work that runs outside any session
+def load_stored_case(owner, case_id):
+    """A case as stored in its owner's case file, or None"""
+    return read_json(get_case_file_path(owner), {}).get(case_id) if owner else None
+
+def update_stored_case(owner, case_id, mutate):
+    """Apply `mutate(case)` to a stored case and return the updated case, or None if it is gone or mutate declined.
+    
+    The change is mirrored into the shared cases and the workflow progress is republished.
+    """
+    if not owner:
+        return None
+    updated = {}
+    def apply(cases):
+        case = cases.get(case_id)
+        if case is None or not mutate(case):
+            return False
+        if case.get("workflow"):
+            # Sessions saving an older copy of the case keep this workflow (see keep_newer_workflow)
+            case["workflow"]["revision"] = workflow_revision(case["workflow"]) + 1
+            case["workflow"]["progress"] = compute_workflow_progress(case["workflow"])
+        updated["case"] = case
+    update_json(get_case_file_path(owner), apply)
+    case = updated.get("case")
+    if case is None:
+        return None
+    
+    shared_file_path = get_shared_case_file_path()
+    if os.path.exists(shared_file_path):
+        mirrored = {}
+        def mirror(shared_cases):
+            if case_id not in shared_cases:
+                return False
+            shared_cases[case_id] = mirrored[case_id] = case
+        update_json(shared_file_path, mirror, after_write=publish_case_changes(mirrored))
+    if case.get("workflow"):
+        WORKFLOW_STORE.upsert_workflow_progress(case_id, workflow_progress_row(case, case["workflow"]["progress"]))
+    return case
+
+def update_stored_items(kind, owner, mutate):
+    """Apply `mutate(items)` to an owner's conversation or case store and return the items it changed.
+    
+    The store is only rewritten if something changed. Changed cases are mirrored into the shared cases.
+    """
+    changed = {}
+    def apply(items):
+        changed.update(mutate(items))
+        return bool(changed)
+    path = get_conversation_file_path(owner) if kind == CONVERSATIONS else get_case_file_path(owner)
+    update_json(path, apply)
+    
+    shared_file_path = get_shared_case_file_path()
+    if kind == CASES and changed and os.path.exists(shared_file_path):
+        mirrored = {}
+        def mirror(shared_cases):
+            mirrored.update({case_id: case for case_id, case in changed.items() if case_id in shared_cases})
+            if not mirrored:
+                return False
+            shared_cases.update(mirrored)
+        update_json(shared_file_path, mirror, after_write=publish_case_changes(mirrored))
+    return changed
+
+def list_store_owners():
+    """Usernames with a conversation or case store"""
+    owners = {filename[:-len("_conversations.json")] for filename in os.listdir(DATA_DIR)
+              if filename.endswith("_conversations.json")}
+    owners.update(filename[:-len("_cases.json")] for filename in os.listdir(CASES_DIR) if filename.endswith("_cases.json"))
+    return sorted(owners)
+
+@st.cache_resource
+def get_item_archive():
+    """Cold storage for old conversations and cases, swept in the background and shared by all sessions"""
+    archive = ItemArchive(ARCHIVE_DIR, update_stored_items, list_store_owners)
+    archive.start()
+    return archive
+
+ITEM_ARCHIVE = get_item_archive()
+
+def restore_open_items(username):
+    """Bring the conversation or case this session has open back from the archive if it was archived"""
+    conv_id = st.session_state.get("active_conversation")
+    conversation = st.session_state.conversations.get(conv_id) if conv_id else None
+    if conversation is not None and is_archived(conversation):
+        restored = ITEM_ARCHIVE.restore(CONVERSATIONS, username, conv_id)
+        if restored is not None:
+            st.session_state.conversations[conv_id] = intern_conversation(restored)
+    
+    case_id = st.session_state.get("active_case")
+    case = st.session_state.cases.get(case_id) if case_id else None
+    if case is not None and is_archived(case):
+        owner = case.get("creator") or username
+        restored = ITEM_ARCHIVE.restore(CASES, owner, case_id)
+        if restored is not None:
+            intern_case(restored)
+            st.session_state.cases[case_id] = restored if owner == username else label_shared_case(restored)
+
+@st.cache_resource
+def get_workflow_scheduler():
+    """Background runner for automated workflow stages, shared by all sessions"""
+    scheduler = WorkflowScheduler(LettaClient(), STATE_STORE, load_stored_case, update_stored_case)
+    scheduler.start()
+    return scheduler
+
+WORKFLOW_SCHEDULER = get_workflow_scheduler()
+
 # Initialize session state
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
@@ -638,6 +1230,10 @@ if 'case_conversation' not in st.session_state:
     st.session_state.case_conversation = None
 if 'view_mode' not in st.session_state:
     st.session_state.view_mode = "normal"  # Options: "normal" or "case"
+if 'store_versions' not in st.session_state:
+    st.session_state.store_versions = {}  # Store path -> change version this session last loaded
+if 'case_feed_seq' not in st.session_state:
+    st.session_state.case_feed_seq = 0  # Last case change feed entry merged into this session
 
 # Authentication function
 def authenticate(username, password):
@@ -646,6 +1242,10 @@ def authenticate(username, password):
         st.session_state.user_role = USERS[username]["role"]
         st.session_state.username = username
         
+        # Record store versions before loading, so later changes are picked up on rerun
+        st.session_state.store_versions = STATE_STORE.get_versions(get_session_store_paths(username))
+        st.session_state.case_feed_seq = CASE_FEED.get_case_feed_position()
+        
         # Load user's conversations
         st.session_state.conversations = load_conversations(username)
         
@@ -691,1546 +1291,1993 @@ def create_new_conversation(title=None):
     
     return conversation_id
 
-# Login screen
-if not st.session_state.authenticated:
-    st.title("LegalSphere: Legal AI Assistant")
-    st.subheader("Login")
+# UI components. Each is a fragment, so interacting with one reruns only that component
+# (a full rerun still happens wherever the code calls st.rerun())
+@st.fragment
+@timed("render_audit_logs")
+def render_audit_logs():
+    """Admin Audit Logs tab: filtered audit events and their exports"""
+    # Add filtering options
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        username_filter = st.text_input("Filter by username:")
+    with col2:
+        action_options = ["All Actions", "login", "logout", "create_conversation", 
+                          "delete_conversation", "send_message", "upload_document", "failed_login"]
+        action_filter = st.selectbox("Filter by action:", action_options)
+    with col3:
+        date_filter = st.date_input("Filter by date:", datetime.datetime.now())
     
-    col1, col2 = st.columns([1, 1])
+    # Get the logs, filtered by the state store
+    filtered_logs = get_audit_logs(
+        username_filter,
+        action_filter if action_filter != "All Actions" else None,
+        date_filter.strftime("%Y-%m-%d")
+    )
     
-    with col1:
-        username = st.text_input("Username")
-        password = st.text_input("Password", type="password")
-        login_button = st.button("Login")
+    # Display the logs in a table
+    if filtered_logs:
+        st.write(f"Showing {len(filtered_logs)} log entries")
         
-        if login_button:
-            if authenticate(username, password):
-                st.success(f"Logged in as {username} with role: {st.session_state.user_role}")
-                st.rerun()
-            else:
-                st.error("Invalid username or password")
-                # Log failed login attempt
-                log_user_action(username, "failed_login", {"reason": "Invalid credentials"})
-    
+        # Create a dataframe for better display
+        log_data = []
+        for log in filtered_logs:
+            log_data.append({
+                "Timestamp": log["timestamp"],
+                "User": log["username"],
+                "Role": log["role"],
+                "Action": log["action"],
+                "Details": str(log["details"])
+            })
+        
+        st.table(log_data)
+        
+        # Export option
+        if st.button("Export Logs as JSON"):
+            # Reuse the previous export if the same log entries were already exported
+            cache_key = EXPORT_CACHE.make_key(
+                st.session_state.username,
+                {str(i): log for i, log in enumerate(filtered_logs)},
+                "JSON"
+            )
+            export_path = EXPORT_CACHE.get(cache_key)
+            if not export_path:
+                export_path = os.path.join(LOGS_DIR, unique_export_name("exported_logs", "json"))
+                with open(export_path, 'wb') as f:
+                    f.write(encode_json(filtered_logs))
+                EXPORT_CACHE.put(cache_key, export_path)
+            st.success(f"Logs exported to {export_path}")
+    else:
+        st.info("No logs match your filter criteria")
+
+    # Columnar export of the full audit log for analytics
+    st.divider()
+    st.subheader("Analytics Export")
+    col1, col2 = st.columns(2)
+    with col1:
+        log_export_format = st.selectbox("Columnar format:", ["Parquet", "Arrow"], key="log_columnar_format")
     with col2:
-        st.info("Demo Accounts:")
-        st.markdown("- Admin: admin1/admin123")
-        st.markdown("- Legal Advisor: advisor1/legal123")  
-        st.markdown("- Client: client1/client123")
-        st.markdown("- Guest: guest1/guest123")
+        log_export_incremental = st.checkbox("Only entries since the last columnar export", key="log_columnar_incremental")
+
+    if st.button("Export Full Audit Log"):
+        logs = get_audit_logs()
         
-        st.markdown("---")
-        st.markdown("**Role Permissions:**")
-        st.markdown("- **Admin**: All access + Audit Logs")
-        st.markdown("- **Legal Advisor**: Full system access")
-        st.markdown("- **Client**: View agents and chat")
-        st.markdown("- **Guest**: Chat only")
+        # Incremental exports depend on the stored watermark, so only full exports are cached
+        cache_key = None
+        if not log_export_incremental:
+            cache_key = EXPORT_CACHE.make_key(
+                st.session_state.username,
+                {str(i): log for i, log in enumerate(logs)},
+                log_export_format
+            )
+        export_path = EXPORT_CACHE.get(cache_key) if cache_key else None
+        row_count = len(logs)
 
-else:
-    # App header
-    st.title("LegalSphere: Legal AI Assistant")
-    st.subheader("International Trade Law & WTO Regulations")
+        if not export_path:
+            with st.spinner(f"Exporting audit log as {log_export_format}..."):
+                export_path, row_count = export_audit_logs_to_columnar(
+                    logs,
+                    log_export_format.lower(),
+                    incremental=log_export_incremental
+                )
+            if export_path and cache_key:
+                EXPORT_CACHE.put(cache_key, export_path)
+
+        if export_path:
+            st.success(f"Exported {row_count} log entries to {export_path}")
+            log_user_action(
+                st.session_state.username,
+                "export_audit_logs",
+                {"format": log_export_format, "row_count": row_count, "incremental": log_export_incremental}
+            )
+        else:
+            st.error("Failed to export audit logs. Check the logs for details.")
+
+@st.fragment
+@timed("render_conversation_export")
+def render_conversation_export():
+    """Admin Conversation Export tab"""
+    st.header("Export Conversation History")
     
-    # User info and logout in top right
-    col1, col2 = st.columns([3, 1])
-    with col2:
-        st.info(f"Logged in as: {st.session_state.user_role.upper()}")
+    # User selection
+    user_data_files = [f for f in os.listdir(DATA_DIR) if f.endswith('_conversations.json')]
+    available_users = [f.split('_conversations.json')[0] for f in user_data_files]
+    
+    if available_users:
+        selected_user = st.selectbox("Select user to export conversations:", available_users)
         
-        if st.button("Logout"):
-            # Log the logout action
-            log_user_action(st.session_state.username, "logout")
-            
-            # Save conversations before logout
-            if st.session_state.username:
-                save_conversations(st.session_state.username, st.session_state.conversations)
-                save_cases(st.session_state.username, st.session_state.cases)
+        if selected_user:
+            # Load the selected user's conversations
+            user_conversations = load_conversations(selected_user)
             
-            # Clear session state
-            st.session_state.authenticated = False
-            st.session_state.user_role = None
-            st.session_state.username = None
-            st.session_state.conversations = {}
-            st.session_state.active_conversation = None
-            st.session_state.cases = {}
-            st.session_state.active_case = None
-            st.session_state.case_conversation = None
-            st.session_state.view_mode = "normal"
-            st.session_state.show_logs = False
-            st.session_state.show_conversation_export = False
-            st.rerun()
-
-    # Admin-only section for logs
-    if has_permission("view_logs"):
-        st.sidebar.markdown("---")
-        st.sidebar.subheader("Admin Tools")
-        
-        if st.sidebar.checkbox("Show Audit Logs", value=st.session_state.show_logs):
-            st.session_state.show_logs = True
-        else:
-            st.session_state.show_logs = False
-    
-    # If admin wants to see logs, show them instead of the main interface
-    if st.session_state.show_logs and has_permission("view_logs"):
-        st.header("System Audit Logs")
-        
-        # Add tabs for Audit Logs and Conversation Export
-        tab1, tab2 = st.tabs(["Audit Logs", "Conversation Export"])
-        
-        with tab1:
-            # Add filtering options
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                username_filter = st.text_input("Filter by username:")
-            with col2:
-                action_options = ["All Actions", "login", "logout", "create_conversation", 
-                                  "delete_conversation", "send_message", "upload_document", "failed_login"]
-                action_filter = st.selectbox("Filter by action:", action_options)
-            with col3:
-                date_filter = st.date_input("Filter by date:", datetime.datetime.now())
-            
-            # Get the logs
-            logs = get_audit_logs()
-            
-            # Apply filters
-            filtered_logs = logs
-            if username_filter:
-                filtered_logs = [log for log in filtered_logs if username_filter.lower() in log["username"].lower()]
-            if action_filter != "All Actions":
-                filtered_logs = [log for log in filtered_logs if log["action"] == action_filter]
-            
-            date_str = date_filter.strftime("%Y-%m-%d")
-            filtered_logs = [log for log in filtered_logs if log["timestamp"].startswith(date_str)]
-            
-            # Display the logs in a table
-            if filtered_logs:
-                st.write(f"Showing {len(filtered_logs)} log entries")
-                
-                # Create a dataframe for better display
-                log_data = []
-                for log in filtered_logs:
-                    log_data.append({
-                        "Timestamp": log["timestamp"],
-                        "User": log["username"],
-                        "Role": log["role"],
-                        "Action": log["action"],
-                        "Details": str(log["details"])
-                    })
+            if user_conversations:
+                st.write(f"Found {len(user_conversations)} conversations for user {selected_user}")
                 
-                st.table(log_data)
+                # Show conversation list with checkboxes for selection
+                selected_convs = {}
+                st.write("Select conversations to export:")
+                select_all = st.checkbox("Select All")
                 
-                # Export option
-                if st.button("Export Logs as JSON"):
-                    export_path = os.path.join(LOGS_DIR, f"exported_logs_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-                    with open(export_path, 'w') as f:
-                        json.dump(filtered_logs, f, indent=2)
-                    st.success(f"Logs exported to {export_path}")
-            else:
-                st.info("No logs match your filter criteria")
-        
-        with tab2:
-            st.header("Export Conversation History")
-            
-            # User selection
-            user_data_files = [f for f in os.listdir(DATA_DIR) if f.endswith('_conversations.json')]
-            available_users = [f.split('_conversations.json')[0] for f in user_data_files]
-            
-            if available_users:
-                selected_user = st.selectbox("Select user to export conversations:", available_users)
+                for conv_id, conv in user_conversations.items():
+                    if is_archived(conv):
+                        conv_summary = f"{conv['archived']['message_count']} messages, archived"
+                    else:
+                        conv_summary = f"{len(conv['messages'])} messages"
+                    is_selected = select_all or st.checkbox(
+                        f"{conv['title']} ({conv_summary}, created {conv['created_at']})",
+                        key=f"export_{conv_id}"
+                    )
+                    if is_selected:
+                        selected_convs[conv_id] = conv
                 
-                if selected_user:
-                    # Load the selected user's conversations
-                    user_conversations = load_conversations(selected_user)
+                # Export format selection
+                export_format = st.radio(
+                    "Select export format:",
+                    ["TXT", "CSV", "PDF", "Parquet", "Arrow"]
+                )
+
+                # Columnar formats produce one row per message and can include case conversations
+                include_case_convs = False
+                incremental_export = False
+                if export_format in ["Parquet", "Arrow"]:
+                    include_case_convs = st.checkbox("Include case conversations", value=True)
+                    incremental_export = st.checkbox("Only messages since the last columnar export")
+
+                if st.button("Export Selected Conversations") and selected_convs:
+                    # Archived conversations and cases are exported from the archive without restoring them
+                    selected_convs = ITEM_ARCHIVE.expand(CONVERSATIONS, selected_user, selected_convs)
+                    export_cases = load_user_cases(selected_user) if include_case_convs else None
+                    if export_cases:
+                        export_cases = ITEM_ARCHIVE.expand(CASES, selected_user, export_cases)
+
+                    # Reuse the previous export if the same conversation versions were already exported
+                    cache_key = None
+                    if not incremental_export:
+                        export_items = dict(selected_convs)
+                        export_items.update({f"case_{case_id}": case for case_id, case in (export_cases or {}).items()})
+                        cache_key = EXPORT_CACHE.make_key(selected_user, export_items, export_format)
+                    export_path = EXPORT_CACHE.get(cache_key) if cache_key else None
+
+                    if export_path:
+                        st.info("These conversations are unchanged since the last export, reusing the existing file.")
+                    else:
+                        with st.spinner(f"Exporting {len(selected_convs)} conversations as {export_format}..."):
+                            if export_format == "TXT":
+                                export_path = export_conversations_to_txt(selected_user, selected_convs)
+                            elif export_format == "CSV":
+                                export_path = export_conversations_to_csv(selected_user, selected_convs)
+                            elif export_format == "PDF":
+                                export_path = export_conversations_to_pdf(selected_user, selected_convs)
+                            elif export_format in ["Parquet", "Arrow"]:
+                                export_path, row_count = export_conversations_to_columnar(
+                                    selected_user,
+                                    selected_convs,
+                                    export_cases,
+                                    export_format.lower(),
+                                    incremental=incremental_export
+                                )
+                        if export_path and cache_key:
+                            EXPORT_CACHE.put(cache_key, export_path)
                     
-                    if user_conversations:
-                        st.write(f"Found {len(user_conversations)} conversations for user {selected_user}")
+                    if export_path:
+                        st.success(f"Export successful! File saved to: {export_path}")
                         
-                        # Show conversation list with checkboxes for selection
-                        selected_convs = {}
-                        st.write("Select conversations to export:")
-                        select_all = st.checkbox("Select All")
-                        
-                        for conv_id, conv in user_conversations.items():
-                            is_selected = select_all or st.checkbox(
-                                f"{conv['title']} ({len(conv['messages'])} messages, created {conv['created_at']})",
-                                key=f"export_{conv_id}"
+                        # Create a download button
+                        with open(export_path, "rb") as file:
+                            st.download_button(
+                                label=f"Download {export_format} File",
+                                data=file,
+                                file_name=os.path.basename(export_path),
+                                mime="application/octet-stream"
                             )
-                            if is_selected:
-                                selected_convs[conv_id] = conv
                         
-                        # Export format selection
-                        export_format = st.radio(
-                            "Select export format:",
-                            ["TXT", "CSV", "PDF"]
+                        # Log the export action
+                        log_user_action(
+                            st.session_state.username,
+                            "export_conversations",
+                            {
+                                "target_user": selected_user,
+                                "format": export_format,
+                                "conversation_count": len(selected_convs)
+                            }
                         )
-                        
-                        if st.button("Export Selected Conversations") and selected_convs:
-                            export_path = None
-                            
-                            with st.spinner(f"Exporting {len(selected_convs)} conversations as {export_format}..."):
-                                if export_format == "TXT":
-                                    export_path = export_conversations_to_txt(selected_user, selected_convs)
-                                elif export_format == "CSV":
-                                    export_path = export_conversations_to_csv(selected_user, selected_convs)
-                                elif export_format == "PDF":
-                                    export_path = export_conversations_to_pdf(selected_user, selected_convs)
-                            
-                            if export_path:
-                                st.success(f"Export successful! File saved to: {export_path}")
-                                
-                                # Create a download button
-                                with open(export_path, "rb") as file:
-                                    btn = st.download_button(
-                                        label=f"Download {export_format} File",
-                                        data=file,
-                                        file_name=os.path.basename(export_path),
-                                        mime="application/octet-stream"
-                                    )
-                                
-                                # Log the export action
-                                log_user_action(
-                                    st.session_state.username,
-                                    "export_conversations",
-                                    {
-                                        "target_user": selected_user,
-                                        "format": export_format,
-                                        "conversation_count": len(selected_convs)
-                                    }
-                                )
-                            else:
-                                st.error("Failed to export conversations. Check the logs for details.")
                     else:
-                        st.info(f"No conversations found for user {selected_user}")
+                        st.error("Failed to export conversations. Check the logs for details.")
             else:
-                st.info("No user conversation data found in the system.")
+                st.info(f"No conversations found for user {selected_user}")
+    else:
+        st.info("No user conversation data found in the system.")
+
+@st.fragment
+@timed("render_performance")
+def render_performance():
+    """Admin Performance tab: latency, reruns, Letta connection health and storage I/O"""
+    st.header("Performance")
+    st.caption(f"Metrics for this server process (pid {os.getpid()}) since it started. Times in milliseconds.")
+    
+    histograms = REGISTRY.histograms()
+    
+    # Latency percentiles per operation (local functions, storage calls and HTTP calls)
+    operation_rows = []
+    for (name, labels), stats in sorted(histograms.items()):
+        if name not in ["operation_seconds", "http_request_seconds"]:
+            continue
+        label_values = dict(labels)
+        operation = label_values.pop("operation", None) or f"http {label_values.pop('method', '')}"
+        operation_rows.append({
+            "Operation": operation,
+            "Labels": ", ".join(f"{key}={value}" for key, value in label_values.items()),
+            "Calls": stats["count"],
+            "p50": round(stats["p50"] * 1000, 2),
+            "p95": round(stats["p95"] * 1000, 2),
+            "p99": round(stats["p99"] * 1000, 2),
+            "Max": round(stats["max"] * 1000, 2)
+        })
+    if operation_rows:
+        st.subheader("Operation Latency")
+        st.dataframe(operation_rows)
+    
+    # Script reruns and the HTTP calls each one makes
+    rerun_stats = histograms.get(("rerun_seconds", ()))
+    rerun_http_stats = histograms.get(("rerun_http_calls", ()))
+    if rerun_stats:
+        st.subheader("Streamlit Reruns")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Reruns", rerun_stats["count"])
+        col2.metric("p50 rerun (ms)", round(rerun_stats["p50"] * 1000, 1))
+        col3.metric("p99 rerun (ms)", round(rerun_stats["p99"] * 1000, 1))
+        if rerun_http_stats:
+            col4.metric("p95 HTTP calls per rerun", int(rerun_http_stats["p95"]))
+    
+    # Letta connection health: retries and the circuit breaker
+    counters = REGISTRY.counters()
+    breaker = get_breaker(st.session_state.client.base_url)
+    outage_stats = histograms.get(("circuit_open_seconds", (("circuit", breaker.name),)))
+    st.subheader("Letta Connection")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Circuit", breaker.state.replace("_", " "))
+    col2.metric("Retries", int(sum(value for (name, _), value in counters.items() if name == "http_retries_total")))
+    col3.metric("Fast failures", int(counters.get(("circuit_rejections_total", (("circuit", breaker.name),)), 0)))
+    col4.metric("Time circuit open (s)", round(outage_stats["sum"], 1) if outage_stats else 0)
+    
+    # Bytes moved by the JSON stores
+    storage_rows = []
+    for (name, labels), stats in sorted(histograms.items()):
+        if name == "storage_bytes":
+            label_values = dict(labels)
+            storage_rows.append({
+                "Store": label_values.get("store"),
+                "Operation": label_values.get("operation"),
+                "Calls": stats["count"],
+                "Total KB": round(stats["sum"] / 1024, 1),
+                "p95 KB": round(stats["p95"] / 1024, 1)
+            })
+    if storage_rows:
+        st.subheader("Storage I/O")
+        st.dataframe(storage_rows)
+    
+    lock_metrics = get_lock_metrics()
+    if lock_metrics:
+        st.subheader("Store Lock Waits")
+        st.dataframe([
+            {
+                "Store": path,
+                "Acquisitions": stats["acquisitions"],
+                "Timeouts": stats["timeouts"],
+                "Total wait": round(stats["total_wait"] * 1000, 2),
+                "Max wait": round(stats["max_wait"] * 1000, 2)
+            }
+            for path, stats in sorted(lock_metrics.items())
+        ])
+    
+    st.download_button(
+        label="Download Prometheus Metrics",
+        data=render_prometheus(),
+        file_name="legalsphere_metrics.prom",
+        mime="text/plain"
+    )
 
+@st.fragment
+@timed("render_portfolio")
+def render_portfolio():
+    """Admin Portfolio tab: workflow progress, overdue stages, stage durations and throughput"""
+    st.header("Case Portfolio")
+    st.caption("Workflow progress of every case, maintained whenever a workflow changes. "
+               f"Stages are overdue after {STAGE_DUE_DAYS:g} days unless their template sets due_days.")
+    
+    now = datetime.datetime.now().timestamp()
+    totals = WORKFLOW_STORE.get_portfolio_totals(now)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Cases with a workflow", totals["cases"])
+    col2.metric("Completed", totals["completed"])
+    col3.metric("Overdue stages", totals["overdue"])
+    
+    # Cases per stage with their mean time in that stage
+    stage_summary = WORKFLOW_STORE.get_stage_summary(now)
+    if stage_summary:
+        st.subheader("Cases per Stage")
+        st.dataframe([
+            {
+                "Workflow": row["workflow"],
+                "Stage": row["stage"],
+                "Cases": row["cases"],
+                "Mean days in stage": round(row["mean_seconds_in_stage"] / 86400, 1)
+                if row["mean_seconds_in_stage"] is not None else None,
+                "Overdue": row["overdue"]
+            }
+            for row in stage_summary
+        ])
     else:
-        # Regular app interface (when not viewing logs)
-        # Sidebar for agent selection, conversation management, and document upload
-        with st.sidebar:
-            st.header("Configuration")
+        st.info("No cases have a workflow yet.")
+    
+    overdue_stages = WORKFLOW_STORE.get_overdue_stages(now)
+    if overdue_stages:
+        st.subheader("Overdue Stages")
+        st.dataframe([
+            {
+                "Case": row["title"],
+                "Owner": row["owner"],
+                "Workflow": row["workflow"],
+                "Stage": row["stage"],
+                "Days in stage": round((now - row["stage_started_at"]) / 86400, 1),
+                "Days overdue": round((now - row["stage_due_at"]) / 86400, 1)
+            }
+            for row in overdue_stages
+        ])
+    
+    # Stage durations and throughput, rolled up as stages complete
+    st.subheader("Stage Durations")
+    duration_stats = STAGE_ANALYTICS.get_stage_duration_stats()
+    if duration_stats:
+        st.dataframe([
+            {
+                "Workflow": row["workflow"],
+                "Stage": row["stage"],
+                "Completed": row["completions"],
+                "Mean days": round(row["mean_seconds"] / 86400, 1),
+                "p90 days": round(row["p90_seconds"] / 86400, 1)
+            }
+            for row in sorted(duration_stats, key=lambda row: row["p90_seconds"], reverse=True)
+        ])
+        st.caption("Slowest stages first. p90 is accurate to within about 20%.")
+    else:
+        st.info("No workflow stages have been completed yet.")
+    
+    throughput_days = st.selectbox("Throughput period", [7, 30, 90], index=1,
+                                   format_func=lambda days: f"Last {days} days", key="throughput_days")
+    since = now - throughput_days * 86400
+    daily_completions = STAGE_ANALYTICS.get_daily_stage_completions(since)
+    if daily_completions:
+        st.bar_chart([{"Day": day, "Completed stages": count} for day, count in daily_completions.items()],
+                     x="Day", y="Completed stages")
+    advisor_throughput = STAGE_ANALYTICS.get_advisor_throughput(since)
+    if advisor_throughput:
+        st.dataframe([
+            {
+                "Advisor": row["owner"] or "Unknown",
+                "Stages completed": row["completions"],
+                "Mean days in stage": round(row["mean_seconds"] / 86400, 1)
+            }
+            for row in advisor_throughput
+        ])
+
+@st.fragment
+@timed("render_document_upload")
+def render_document_upload():
+    """Sidebar upload of documents to a source of the selected or case agent"""
+    st.subheader("Upload Documents")
+    uploaded_files = st.file_uploader("Choose documents", type=["pdf", "txt", "docx"], accept_multiple_files=True)
+
+    if uploaded_files and (st.session_state.selected_agent or (st.session_state.view_mode == "case" and st.session_state.active_case)):
+        # Get sources attached to the selected agent
+        try:
+            agent_id = st.session_state.selected_agent
+            if st.session_state.view_mode == "case" and st.session_state.active_case:
+                # If in case view and a case is active, get the case's first agent or the selected agent
+                case_agents = st.session_state.cases[st.session_state.active_case].get("agents", [])
+                if case_agents:
+                    agent_id = case_agents[0]  # Use the first agent in the case
             
-            # Tab-based sidebar for normal view and case management
-            sidebar_tabs = st.tabs(["Regular Chat", "Cases"])
+            agent_sources = get_agent_sources(st.session_state.client, agent_id)
             
-            with sidebar_tabs[0]:
-                # Agent Selection
-                if has_permission("view_agents"):
-                    st.subheader("Select Agent")
-                    
-                    # Agent Creation UI
-                    if has_permission("create_agents"):
-                        with st.expander("Create New Agent"):
-                            new_agent_name = st.text_input("Agent Name", key="new_agent_name_regular")
-                            new_agent_persona = st.text_area("Agent Persona", 
-                                placeholder="Enter a description of the agent's persona, expertise, and personality.", 
-                                key="new_agent_persona_regular", 
-                                height=150)
-                            if st.button("Create Agent", key="create_agent_regular"):
-                                try:
-                                    with st.spinner("Creating new agent..."):
-                                        # Create agent using the client
-                                        new_agent = st.session_state.client.create_agent(new_agent_name, new_agent_persona)
-                                        
-                                        # Log the action
-                                        log_user_action(
-                                            st.session_state.username, 
-                                            "create_agent", 
-                                            {"agent_name": new_agent_name, "agent_id": new_agent.get('id')}
-                                        )
-                                        
-                                        # Set as selected agent
-                                        st.session_state.selected_agent = new_agent.get('id')
-                                        
-                                        st.success(f"Created new agent: {new_agent_name}")
-                                        st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error creating agent: {str(e)}")
+            if not agent_sources:
+                st.warning("No sources are attached to this agent. Please attach sources through the Letta Server UI.")
+            else:
+                # Create a dropdown to select which source to upload to
+                source_options = {source.get('name', f"Source {i}"): source['id'] for i, source in enumerate(agent_sources)}
+                selected_source_name = st.selectbox("Select source to upload to:", list(source_options.keys()))
+                selected_source_id = source_options[selected_source_name]
+                
+                if st.button("Upload Documents", key="upload_doc_btn"):
+                    # Create a temporary directory for all files
+                    temp_dir = tempfile.mkdtemp()
                     
-                    # Agent Selection UI
                     try:
-                        agents = st.session_state.client.list_agents()
-                        if agents:
-                            agent_names = [f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})" for agent in agents]
-                            selected_agent_index = st.selectbox("Choose an agent:", range(len(agent_names)), format_func=lambda i: agent_names[i])
-                            st.session_state.selected_agent = agents[selected_agent_index]['id']
+                        # Process each file
+                        for uploaded_file in uploaded_files:
+                            st.write(f"Processing: {uploaded_file.name}")
                             
-                            # Show agent details and delete option
-                            col1, col2 = st.columns([3, 1])
-                            with col1:
-                                st.write(f"Selected: {agents[selected_agent_index].get('name', 'Unnamed Agent')}")
-                            with col2:
-                                if st.button("🗑️ Delete", key="delete_agent_btn"):
-                                    try:
-                                        with st.spinner("Deleting agent..."):
-                                            # Delete the agent
-                                            st.session_state.client.delete_agent(agents[selected_agent_index]['id'])
-                                            
-                                            # Log the action
-                                            log_user_action(
-                                                st.session_state.username, 
-                                                "delete_agent", 
-                                                {
-                                                    "agent_name": agents[selected_agent_index].get('name', 'Unnamed Agent'),
-                                                    "agent_id": agents[selected_agent_index]['id']
-                                                }
-                                            )
-                                            
-                                            # If this was the selected agent, clear the selection
-                                            if st.session_state.selected_agent == agents[selected_agent_index]['id']:
-                                                st.session_state.selected_agent = None
-                                            
-                                            st.success(f"Deleted agent: {agents[selected_agent_index].get('name', 'Unnamed Agent')}")
-                                            st.rerun()
-                                    except Exception as e:
-                                        st.error(f"Error deleting agent: {str(e)}")
-                        else:
-                            st.error("No agents found. Please create one.")
+                            # Create a temporary file with the original filename
+                            temp_path = os.path.join(temp_dir, uploaded_file.name)
+                            
+                            # Write the file content
+                            with open(temp_path, 'wb') as f:
+                                f.write(uploaded_file.getvalue())
+                            
+                            # Upload file to the selected source
+                            st.session_state.client.upload_file_to_source(selected_source_id, temp_path)
+                            
+                            # Log the document upload
+                            log_user_action(
+                                st.session_state.username, 
+                                "upload_document", 
+                                {
+                                    "filename": uploaded_file.name, 
+                                    "source_id": selected_source_id,
+                                    "source_name": selected_source_name
+                                }
+                            )
+                            
+                            st.success(f"Successfully uploaded: {uploaded_file.name}")
+                            
+                            # Clean up the individual temp file
+                            os.remove(temp_path)
+                        
+                        # Clean up the temp directory
+                        os.rmdir(temp_dir)
+                        
                     except Exception as e:
-                        st.error(f"Error loading agents: {str(e)}")
-                        st.session_state.selected_agent = None
-                else:
-                    # For users without agent selection permission, auto-select first agent if available
-                    try:
-                        agents = st.session_state.client.list_agents()
-                        if agents:
-                            st.session_state.selected_agent = agents[0]['id']
-                    except Exception:
-                        st.session_state.selected_agent = None
+                        st.error(f"Error processing documents: {str(e)}")
+                        # Clean up temp directory in case of error
+                        try:
+                            for file in os.listdir(temp_dir):
+                                os.remove(os.path.join(temp_dir, file))
+                            os.rmdir(temp_dir)
+                        except:
+                            pass
+        except Exception as e:
+            st.error(f"Error retrieving agent sources: {str(e)}")
 
-                # Conversation Management
-                st.subheader("Conversations")
-                
-                # Create new conversation button
-                if st.session_state.selected_agent:
-                    new_conv_title = st.text_input("New conversation title (optional)")
-                    if st.button("Start New Conversation", key="sidebar_new_conv_btn"):
-                        new_conv_id = create_new_conversation(new_conv_title)
-                        st.session_state.active_conversation = new_conv_id
-                        st.session_state.view_mode = "normal"
-                        st.rerun()
+@st.fragment
+@timed("render_conversation_pane")
+def render_conversation_pane():
+    """The active regular conversation and its chat input, or the welcome message"""
+    # Check if there's an active conversation, otherwise show welcome message
+    if st.session_state.active_conversation and st.session_state.active_conversation in st.session_state.conversations:
+        active_conv = st.session_state.conversations[st.session_state.active_conversation]
+        
+        # Show conversation title as header
+        st.header(f"Conversation: {active_conv['title']}")
+        
+        # Pull in messages the agent produced outside LegalSphere since the last sync
+        if active_conv.get('agent_id'):
+            try:
+                if MESSAGE_SYNC.sync(active_conv['agent_id'], st.session_state.active_conversation,
+                                     active_conv['messages']):
+                    save_conversations(st.session_state.username, st.session_state.conversations)
+            except Exception as e:
+                st.warning(f"Could not sync new messages from the agent: {str(e)}")
+        
+        # Display chat messages for the active conversation
+        for message in active_conv['messages']:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+                # Only show reasoning expander if reasoning exists and user has permission
+                if "reasoning" in message and message["reasoning"] and has_permission("view_reasoning"):
+                    with st.expander("View Agent Reasoning"):
+                        st.markdown(message["reasoning"])
+
+        # Chat input for active conversation
+        prompt = st.chat_input("What would you like to know about international trade law?")
+        
+        if prompt:
+            # Get the agent ID for this conversation
+            agent_id = active_conv.get('agent_id', st.session_state.selected_agent)
+            
+            if not agent_id:
+                st.error("No agent selected for this conversation.")
+            else:
+                # Add user message to conversation
+                active_conv['messages'].append({
+                    "role": "user",
+                    "content": prompt,
+                    "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                })
                 
-                # List all conversations for selection
-                if st.session_state.conversations:
-                    st.write("Your conversations:")
+                # Display user message
+                with st.chat_message("user"):
+                    st.markdown(prompt)
                     
-                    # Sort conversations by creation date (newest first)
-                    sorted_conversations = sorted(
-                        st.session_state.conversations.items(),
-                        key=lambda x: x[1].get('created_at', ''),
-                        reverse=True
+                # Log the message send action
+                log_user_action(
+                    st.session_state.username, 
+                    "send_message", 
+                    {
+                        "conversation_id": st.session_state.active_conversation,
+                        "conversation_title": active_conv["title"],
+                        "message": prompt[:50] + ("..." if len(prompt) > 50 else "")
+                    }
+                )
+                    
+                # Get agent response
+                with st.chat_message("assistant"):
+                    with st.spinner("Thinking..."):
+                        try:
+                            response = st.session_state.client.send_message(
+                                agent_id, 
+                                prompt
+                            )
+                            MESSAGE_SYNC.record_sent(agent_id, st.session_state.active_conversation, response)
+                            
+                            # Extract content and reasoning if available
+                            content = ""
+                            reasoning = ""
+                            
+                            # Parse the Letta API response format
+                            if isinstance(response, dict) and "messages" in response:
+                                for msg in response["messages"]:
+                                    if msg.get("message_type") == "reasoning_message":
+                                        reasoning = msg.get("reasoning", "")
+                                    elif msg.get("message_type") == "assistant_message":
+                                        content = msg.get("content", "")
+                            
+                            # Display response
+                            st.markdown(content)
+                            
+                            # Display reasoning in an expander if user has permission
+                            if reasoning and has_permission("view_reasoning"):
+                                with st.expander("View Agent Reasoning"):
+                                    st.markdown(reasoning)
+                            
+                            # Add to conversation history
+                            active_conv['messages'].append({
+                                "role": "assistant", 
+                                "content": content,
+                                "reasoning": reasoning,
+                                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            })
+                            
+                            # Save the updated conversations
+                            save_conversations(st.session_state.username, st.session_state.conversations)
+                            
+                        except Exception as e:
+                            st.error(f"Error getting response: {str(e)}")
+    else:
+        # Welcome message if no conversation is active
+        st.header("Welcome to LegalSphere")
+        st.write("Start a new conversation from the sidebar to begin chatting.")
+        
+        if not st.session_state.selected_agent:
+            st.warning("Please select an agent from the sidebar first.")
+        else:
+            # Offer a quick start button if an agent is selected
+            if st.button("Start New Conversation", key="main_new_conv_btn"):
+                new_conv_id = create_new_conversation("New Legal Consultation")
+                st.session_state.active_conversation = new_conv_id
+                st.rerun()
+
+@st.fragment
+@timed("render_case_conversations")
+def render_case_conversations(case_id):
+    """Conversations tab of a case: the conversation list and the active case conversation"""
+    active_case = st.session_state.cases[case_id]
+    # Top-level columns for case conversation management
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        st.subheader("Case Conversations")
+    
+    with col2:
+        # Create new conversation in the case
+        new_case_conv_title = st.text_input("New conversation title", key="new_case_conv_title")
+        new_case_conv_panel = st.checkbox("Panel: ask all case agents at once", key="new_case_conv_panel")
+        new_case_conv_aggregate = st.checkbox("Combine the panel's answers", key="new_case_conv_aggregate",
+                                              disabled=not new_case_conv_panel)
+    
+    # Button to create a new conversation
+    if st.button("New Case Conversation") and st.session_state.active_case:
+        # Select an agent for this conversation
+        agent_id = None
+        case_agents = active_case.get("agents", [])
+        
+        # Use the first agent in the case's agent list if available, otherwise use the selected agent
+        if case_agents:
+            agent_id = case_agents[0]
+        elif st.session_state.selected_agent:
+            agent_id = st.session_state.selected_agent
+        
+        if new_case_conv_panel and not case_agents:
+            st.error("Add agents to the case before starting a panel conversation.")
+        elif agent_id:
+            # Create conversation within the case
+            conv_id = create_case_conversation(
+                st.session_state.active_case, 
+                new_case_conv_title or "New Discussion",
+                agent_id,
+                panel=new_case_conv_panel,
+                aggregate=new_case_conv_aggregate
+            )
+            st.session_state.case_conversation = conv_id
+            st.success("Created new case conversation")
+            st.rerun()
+        else:
+            st.error("No agent available for this conversation. Please add agents to the case or select one.")
+    
+    # List all conversations in this case
+    case_conversations = active_case.get("conversations", {})
+    
+    if case_conversations:
+        # Sort conversations by creation date (newest first)
+        sorted_case_convs = sorted(
+            case_conversations.items(),
+            key=lambda x: x[1].get('created_at', ''),
+            reverse=True
+        )
+        
+        # Show the conversations list
+        for conv_id, conv in sorted_case_convs:
+            conv_col1, conv_col2 = st.columns([3, 1])
+            
+            with conv_col1:
+                conv_label = f"👥 {conv['title']}" if conv.get("mode") == "panel" else conv['title']
+                if st.button(conv_label, key=f"case_conv_{conv_id}"):
+                    st.session_state.case_conversation = conv_id
+                    st.rerun()
+            
+            with conv_col2:
+                if st.button("🗑️", key=f"delete_case_conv_{conv_id}"):
+                    # Log the deletion
+                    log_user_action(
+                        st.session_state.username, 
+                        "delete_case_conversation", 
+                        {
+                            "case_id": st.session_state.active_case,
+                            "conversation_id": conv_id, 
+                            "title": conv["title"]
+                        }
                     )
                     
-                    for conv_id, conv in sorted_conversations:
-                        col1, col2 = st.columns([3, 1])
-                        
-                        with col1:
-                            if st.button(f"{conv['title']}", key=f"select_{conv_id}"):
-                                st.session_state.active_conversation = conv_id
-                                st.session_state.view_mode = "normal"
-                                st.rerun()
-                        
-                        with col2:
-                            if st.button("🗑️", key=f"delete_{conv_id}"):
-                                # Log the deletion
-                                log_user_action(
-                                    st.session_state.username, 
-                                    "delete_conversation", 
-                                    {"conversation_id": conv_id, "title": conv["title"]}
-                                )
-                                
-                                # Delete the conversation
-                                del st.session_state.conversations[conv_id]
-                                
-                                # Save the updated conversations
-                                save_conversations(st.session_state.username, st.session_state.conversations)
-                                
-                                if st.session_state.active_conversation == conv_id:
-                                    st.session_state.active_conversation = None
-                                st.rerun()
-                else:
-                    st.info("No conversations yet. Start a new one!")
+                    # Delete the conversation from the case
+                    del active_case["conversations"][conv_id]
+                    
+                    # Save the updated cases
+                    save_cases(st.session_state.username, st.session_state.cases)
+                    
+                    if st.session_state.case_conversation == conv_id:
+                        st.session_state.case_conversation = None
+                    st.rerun()
+        
+        # Show active conversation if one is selected
+        if st.session_state.case_conversation and st.session_state.case_conversation in case_conversations:
+            active_conv = case_conversations[st.session_state.case_conversation]
             
-            with sidebar_tabs[1]:
-                if has_permission("manage_cases"):
-                    st.subheader("Case Management")
+            st.divider()
+            
+            # Show conversation title as header
+            st.subheader(f"Conversation: {active_conv['title']}")
+            
+            # Pull in messages the agent produced outside LegalSphere since the last sync
+            if active_conv.get('agent_id') and active_conv.get("mode") != "panel":
+                try:
+                    if MESSAGE_SYNC.sync(active_conv['agent_id'], st.session_state.case_conversation,
+                                         active_conv['messages']):
+                        save_cases(st.session_state.username, st.session_state.cases)
+                except Exception as e:
+                    st.warning(f"Could not sync new messages from the agent: {str(e)}")
+            
+            # Display chat messages for the active conversation
+            show_case_messages(active_conv['messages'])
+
+            # Chat input for active conversation
+            case_prompt = st.chat_input("Type your message here...")
+            
+            if case_prompt and active_conv.get("mode") == "panel":
+                panel_agents = active_case.get("agents", [])
+                if not panel_agents:
+                    st.error("This case has no agents to consult.")
+                else:
+                    active_conv['messages'].append({
+                        "role": "user",
+                        "content": case_prompt,
+                        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
+                    with st.chat_message("user"):
+                        st.markdown(case_prompt)
                     
-                    # Add a note for admins
-                    if st.session_state.user_role == "admin":
-                        st.info("As an admin, you can view and manage all cases, including those created by legal advisors.")
+                    log_user_action(
+                        st.session_state.username, 
+                        "send_panel_message", 
+                        {
+                            "case_id": st.session_state.active_case,
+                            "conversation_id": st.session_state.case_conversation,
+                            "conversation_title": active_conv["title"],
+                            "agents": panel_agents,
+                            "message": case_prompt[:50] + ("..." if len(case_prompt) > 50 else "")
+                        }
+                    )
                     
-                    # Create new case
-                    new_case_title = st.text_input("New case name", key="new_case_name")
+                    try:
+                        panel_agent_names = AGENT_INDEX.names(panel_agents)
+                    except Exception:
+                        panel_agent_names = {}
                     
-                    # Option to create a new agent specifically for this case
-                    create_new_case_agent = st.checkbox("Create new agent for this case", key="create_new_case_agent")
-                    new_case_agent_name = None
-                    new_case_agent_persona = None
+                    # Every agent answers concurrently; each column fills in as its answer arrives
+                    answers = {}
+                    with st.chat_message("assistant"):
+                        placeholders = {}
+                        for column, agent_id in zip(st.columns(len(panel_agents)), panel_agents):
+                            with column:
+                                st.markdown(f"**{panel_agent_names.get(agent_id) or f'Agent {agent_id}'}**")
+                                placeholders[agent_id] = st.empty()
+                                placeholders[agent_id].info("Thinking...")
+                        
+                        panel = PanelConsultation(st.session_state.client)
+                        for agent_id, reply, error in panel.ask(panel_agents, case_prompt):
+                            with placeholders[agent_id].container():
+                                if error is not None:
+                                    st.error(f"Error getting response: {str(error)}")
+                                    continue
+                                st.markdown(reply["content"])
+                                if reply["reasoning"] and has_permission("view_reasoning"):
+                                    with st.expander("View Agent Reasoning"):
+                                        st.markdown(reply["reasoning"])
+                            MESSAGE_SYNC.record_sent(agent_id, st.session_state.case_conversation, reply["response"])
+                            answers[agent_id] = reply
                     
-                    if create_new_case_agent and has_permission("create_agents"):
-                        new_case_agent_name = st.text_input("New agent name", key="new_case_agent_name")
-                        new_case_agent_persona = st.text_area("Agent Persona", 
-                            placeholder="Enter a description of the agent's persona, expertise, and personality.", 
-                            key="new_case_agent_persona", 
-                            height=150)
+                    # Store answers in panel order so the columns stay stable on later reruns
+                    for agent_id in panel_agents:
+                        if agent_id in answers:
+                            active_conv['messages'].append({
+                                "role": "assistant",
+                                "content": answers[agent_id]["content"],
+                                "reasoning": answers[agent_id]["reasoning"],
+                                "agent_id": agent_id,
+                                "agent_name": panel_agent_names.get(agent_id) or f"Agent {agent_id}",
+                                "panel": True,
+                                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            })
                     
-                    # Agent selection for case (optional)
-                    case_agents = []
-                    if has_permission("view_agents"):
-                        try:
-                            agents = st.session_state.client.list_agents()
-                            if agents:
-                                st.write("Preselect agents for this case (optional):")
-                                for agent in agents:
-                                    agent_name = agent.get('name', f"Agent {agent['id']}")
-                                    if st.checkbox(f"{agent_name}", key=f"case_agent_{agent['id']}"):
-                                        case_agents.append(agent['id'])
-                        except Exception as e:
-                            st.error(f"Error loading agents for case: {str(e)}")
+                    # Optional final pass combining the answers
+                    if active_conv.get("aggregate") and len(answers) > 1:
+                        aggregator_id = active_conv.get('agent_id') or panel_agents[0]
+                        with st.chat_message("assistant"):
+                            with st.spinner("Combining the panel's answers..."):
+                                try:
+                                    summary = panel.aggregate(aggregator_id, case_prompt, {
+                                        panel_agent_names.get(agent_id) or f"Agent {agent_id}": reply["content"]
+                                        for agent_id, reply in answers.items()
+                                    })
+                                    MESSAGE_SYNC.record_sent(aggregator_id, st.session_state.case_conversation,
+                                                             summary["response"])
+                                    st.markdown("**Panel summary**")
+                                    st.markdown(summary["content"])
+                                    active_conv['messages'].append({
+                                        "role": "assistant",
+                                        "content": summary["content"],
+                                        "reasoning": summary["reasoning"],
+                                        "agent_id": aggregator_id,
+                                        "aggregate": True,
+                                        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                                    })
+                                except Exception as e:
+                                    st.error(f"Error combining answers: {str(e)}")
                     
-                    # Document upload for case creation
-                    if has_permission("upload_documents"):
-                        st.write("Upload initial documents for this case (optional):")
-                        new_case_files = st.file_uploader(
-                            "Choose documents",
-                            type=["pdf", "txt", "docx", "doc", "rtf", "png", "jpg", "jpeg"],
-                            accept_multiple_files=True,
-                            key="new_case_document_uploader"
-                        )
+                    # Save the updated cases
+                    save_cases(st.session_state.username, st.session_state.cases)
+            elif case_prompt:
+                # Get the agent ID for this conversation
+                agent_id = active_conv.get('agent_id')
+                
+                if not agent_id:
+                    # If no agent specified for this conversation, try to use a case agent or the selected agent
+                    case_agents = active_case.get("agents", [])
+                    if case_agents:
+                        agent_id = case_agents[0]
                     else:
-                        new_case_files = []
+                        agent_id = st.session_state.selected_agent
+                
+                if not agent_id:
+                    st.error("No agent selected for this conversation.")
+                else:
+                    # Add user message to conversation
+                    active_conv['messages'].append({
+                        "role": "user",
+                        "content": case_prompt,
+                        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
                     
-                    if st.button("Create New Case") and new_case_title:
-                        # First create a new agent if requested
-                        if create_new_case_agent and new_case_agent_name and has_permission("create_agents"):
-                            try:
-                                with st.spinner("Creating new agent for case..."):
-                                    # Create agent using the client
-                                    new_agent = st.session_state.client.create_agent(new_case_agent_name, new_case_agent_persona)
-                                    new_agent_id = new_agent.get('id')
-                                    
-                                    # Add to the case agents
-                                    case_agents.append(new_agent_id)
-                                    
-                                    # Log the action
-                                    log_user_action(
-                                        st.session_state.username, 
-                                        "create_agent_for_new_case", 
-                                        {"agent_name": new_case_agent_name, "agent_id": new_agent_id}
-                                    )
-                                    
-                                    st.success(f"Created new agent: {new_case_agent_name}")
-                            except Exception as e:
-                                st.error(f"Error creating agent: {str(e)}")
-                                # Continue with case creation even if agent creation fails
-                        
-                        # Create the case
-                        new_case_id = create_new_case(new_case_title, case_agents)
-                        
-                        # Handle document uploads if any
-                        if new_case_files and has_permission("upload_documents"):
-                            # Create a documents directory for cases if it doesn't exist
-                            case_docs_dir = os.path.join(CASES_DIR, "documents")
-                            os.makedirs(case_docs_dir, exist_ok=True)
+                    # Display user message
+                    with st.chat_message("user"):
+                        st.markdown(case_prompt)
                             
-                            # Create case-specific directory
-                            case_specific_dir = os.path.join(case_docs_dir, new_case_id)
-                            os.makedirs(case_specific_dir, exist_ok=True)
-                            
-                            # Initialize documents list if not exists
-                            if "documents" not in st.session_state.cases[new_case_id]:
-                                st.session_state.cases[new_case_id]["documents"] = []
+                    # Log the message send action
+                    log_user_action(
+                        st.session_state.username, 
+                        "send_case_message", 
+                        {
+                            "case_id": st.session_state.active_case,
+                            "conversation_id": st.session_state.case_conversation,
+                            "conversation_title": active_conv["title"],
+                            "message": case_prompt[:50] + ("..." if len(case_prompt) > 50 else "")
+                        }
+                    )
                             
-                            # Process each file
-                            for uploaded_file in new_case_files:
-                                # Create unique filename (timestamp + original name)
-                                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                filename = f"{timestamp}_{uploaded_file.name}"
-                                file_path = os.path.join(case_specific_dir, filename)
+                    # Get agent response
+                    with st.chat_message("assistant"):
+                        with st.spinner("Thinking..."):
+                            try:
+                                response = st.session_state.client.send_message(
+                                    agent_id, 
+                                    case_prompt
+                                )
+                                MESSAGE_SYNC.record_sent(agent_id, st.session_state.case_conversation, response)
                                 
-                                # Save the file
-                                with open(file_path, 'wb') as f:
-                                    f.write(uploaded_file.getvalue())
+                                # Extract content and reasoning if available
+                                content = ""
+                                reasoning = ""
                                 
-                                # Add to case documents list
-                                st.session_state.cases[new_case_id]["documents"].append({
-                                    "id": str(uuid.uuid4()),
-                                    "name": uploaded_file.name,
-                                    "filename": filename,
-                                    "uploaded_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                    "uploaded_by": st.session_state.username,
-                                    "file_path": file_path,
-                                    "size": uploaded_file.size,
-                                    "type": uploaded_file.type,
+                                # Parse the Letta API response format
+                                if isinstance(response, dict) and "messages" in response:
+                                    for msg in response["messages"]:
+                                        if msg.get("message_type") == "reasoning_message":
+                                            reasoning = msg.get("reasoning", "")
+                                        elif msg.get("message_type") == "assistant_message":
+                                            content = msg.get("content", "")
+                                
+                                # Display response
+                                st.markdown(content)
+                                
+                                # Display reasoning in an expander if user has permission
+                                if reasoning and has_permission("view_reasoning"):
+                                    with st.expander("View Agent Reasoning"):
+                                        st.markdown(reasoning)
+                                
+                                # Add to conversation history
+                                active_conv['messages'].append({
+                                    "role": "assistant", 
+                                    "content": content,
+                                    "reasoning": reasoning,
+                                    "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                                 })
                                 
-                                # Log the document upload
-                                log_user_action(
-                                    st.session_state.username, 
-                                    "upload_document_during_case_creation", 
-                                    {
-                                        "case_id": new_case_id,
-                                        "filename": uploaded_file.name,
-                                        "file_size": uploaded_file.size
-                                    }
-                                )
-                            
-                            # Save the updated cases
-                            save_cases(st.session_state.username, st.session_state.cases)
-                        
-                        st.session_state.active_case = new_case_id
-                        st.session_state.view_mode = "case"
-                        st.success(f"Created new case: {new_case_title}")
-                        st.rerun()
-                    
-                    # List all cases
-                    if st.session_state.cases:
-                        st.write("Your cases:")
+                                # Save the updated cases
+                                save_cases(st.session_state.username, st.session_state.cases)
+                                
+                            except Exception as e:
+                                st.error(f"Error getting response: {str(e)}")
+    else:
+        st.info("No conversations in this case yet. Create a new conversation to get started.")
+
+@st.fragment
+@timed("render_case_agents")
+def render_case_agents(case_id):
+    """Agents tab of a case: create, list, remove and add agents"""
+    active_case = st.session_state.cases[case_id]
+    st.subheader("Case Agents")
+    
+    # Agent creation UI for case view
+    if has_permission("create_agents"):
+        with st.expander("Create New Agent for this Case"):
+            new_agent_name = st.text_input("Agent Name", key="new_agent_name_case")
+            new_agent_persona = st.text_area("Agent Persona", 
+                placeholder="Enter a description of the agent's persona, expertise, and personality.", 
+                key="new_agent_persona_case", 
+                height=150)
+            
+            if st.button("Create Agent", key="create_agent_case"):
+                try:
+                    with st.spinner("Creating new agent..."):
+                        # Take a pre-provisioned agent from the warm pool
+                        new_agent = AGENT_POOL.acquire(new_agent_name, new_agent_persona)
+                        AGENT_INDEX.invalidate()
+                        new_agent_id = new_agent.get('id')
                         
-                        # Sort cases by creation date (newest first)
-                        sorted_cases = sorted(
-                            st.session_state.cases.items(),
-                            key=lambda x: x[1].get('created_at', ''),
-                            reverse=True
+                        # Log the action
+                        log_user_action(
+                            st.session_state.username, 
+                            "create_case_agent", 
+                            {
+                                "agent_name": new_agent_name, 
+                                "agent_id": new_agent_id,
+                                "case_id": st.session_state.active_case,
+                                "case_title": active_case["title"]
+                            }
                         )
                         
-                        for case_id, case in sorted_cases:
-                            col1, col2 = st.columns([3, 1])
-                            
-                            with col1:
-                                # Add workflow indicator if case has a workflow
-                                case_title = case['title']
-                                if case.get('workflow'):
-                                    # Calculate workflow progress
-                                    workflow = case['workflow']
-                                    total_stages = len(workflow['stages'])
-                                    completed_stages = sum(1 for stage in workflow['stages'] if stage['status'] == 'completed')
-                                    progress_pct = int((completed_stages / total_stages) * 100) if total_stages > 0 else 0
-                                    current_stage = workflow['stages'][workflow['current_stage_index']]
-                                    
-                                    # Add emoji and progress to case title
-                                    status_emoji = {
-                                        "not_started": "⚪",
-                                        "in_progress": "🔵",
-                                        "completed": "✅"
-                                    }.get(current_stage['status'], "⚪")
-                                    
-                                    case_title = f"{case_title} {status_emoji} ({progress_pct}%)"
-                                
-                                if st.button(f"{case_title}", key=f"select_case_{case_id}"):
-                                    st.session_state.active_case = case_id
-                                    st.session_state.case_conversation = None  # Reset active conversation in the case
-                                    st.session_state.view_mode = "case"
-                                    st.rerun()
-                            
-                            with col2:
-                                if st.button("🗑️", key=f"delete_case_{case_id}"):
-                                    # Log the deletion
-                                    log_user_action(
-                                        st.session_state.username, 
-                                        "delete_case", 
-                                        {"case_id": case_id, "title": case["title"]}
-                                    )
-                                    
-                                    # Delete the case
-                                    del st.session_state.cases[case_id]
-                                    
-                                    # Save the updated cases
-                                    save_cases(st.session_state.username, st.session_state.cases)
-                                    
-                                    # If this is a legal advisor, also remove from shared cases if exists
-                                    if st.session_state.user_role == "legal_advisor":
-                                        shared_file_path = get_shared_case_file_path()
-                                        if os.path.exists(shared_file_path):
-                                            try:
-                                                # Load shared cases
-                                                with open(shared_file_path, 'r') as f:
-                                                    shared_cases = json.load(f)
-                                                
-                                                # Remove this case if it exists in shared cases
-                                                if case_id in shared_cases:
-                                                    del shared_cases[case_id]
-                                                
-                                                # Save the updated shared cases
-                                                with open(shared_file_path, 'w') as f:
-                                                    json.dump(shared_cases, f)
-                                            except Exception as e:
-                                                st.error(f"Error updating shared cases: {str(e)}")
-                                    
-                                    if st.session_state.active_case == case_id:
-                                        st.session_state.active_case = None
-                                        st.session_state.view_mode = "normal"
-                                    st.rerun()
-                    else:
-                        st.info("No cases yet. Create a new one!")
-                else:
-                    st.info("You don't have permission to manage cases.")
-
-            # Document Upload (shared between regular mode and case mode)
-            if has_permission("upload_documents"):
-                st.subheader("Upload Documents")
-                uploaded_files = st.file_uploader("Choose documents", type=["pdf", "txt", "docx"], accept_multiple_files=True)
-
-                if uploaded_files and (st.session_state.selected_agent or (st.session_state.view_mode == "case" and st.session_state.active_case)):
-                    # Get sources attached to the selected agent
-                    try:
-                        agent_id = st.session_state.selected_agent
-                        if st.session_state.view_mode == "case" and st.session_state.active_case:
-                            # If in case view and a case is active, get the case's first agent or the selected agent
-                            case_agents = st.session_state.cases[st.session_state.active_case].get("agents", [])
-                            if case_agents:
-                                agent_id = case_agents[0]  # Use the first agent in the case
+                        # Add the new agent to the case
+                        if "agents" not in active_case:
+                            active_case["agents"] = []
+                        active_case["agents"].append(new_agent_id)
                         
-                        agent_sources = st.session_state.client.get_agent_sources(agent_id)
+                        # Save the updated cases
+                        save_cases(st.session_state.username, st.session_state.cases)
                         
-                        if not agent_sources:
-                            st.warning("No sources are attached to this agent. Please attach sources through the Letta Server UI.")
-                        else:
-                            # Create a dropdown to select which source to upload to
-                            source_options = {source.get('name', f"Source {i}"): source['id'] for i, source in enumerate(agent_sources)}
-                            selected_source_name = st.selectbox("Select source to upload to:", list(source_options.keys()))
-                            selected_source_id = source_options[selected_source_name]
-                            
-                            if st.button("Upload Documents", key="upload_doc_btn"):
-                                # Create a temporary directory for all files
-                                temp_dir = tempfile.mkdtemp()
-                                
+                        st.success(f"Created new agent and added to case: {new_agent_name}")
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"Error creating agent: {str(e)}")
+    
+    # Display current agents in the case
+    case_agents = active_case.get("agents", [])
+    
+    if case_agents:
+        st.write("Current agents in this case:")
+        
+        try:
+            # Look up all case agents at once rather than listing every agent per case agent
+            case_agent_names = AGENT_INDEX.names(case_agents)
+        except Exception as e:
+            st.error(f"Error loading agent details: {str(e)}")
+            case_agent_names = {}
+        
+        for agent_id in case_agents:
+            if agent_id not in case_agent_names:
+                st.write(f"• Unknown Agent ({agent_id})")
+                continue
+            
+            agent_name = case_agent_names[agent_id] or f"Agent {agent_id}"
+            agent_col1, agent_col2 = st.columns([3, 1])
+            
+            with agent_col1:
+                st.write(f"• {agent_name}")
+            
+            with agent_col2:
+                if st.button("Remove", key=f"remove_agent_{agent_id}"):
+                    # Remove agent from case
+                    active_case["agents"].remove(agent_id)
+                    
+                    # Save the updated cases
+                    save_cases(st.session_state.username, st.session_state.cases)
+                    
+                    # Log the action
+                    log_user_action(
+                        st.session_state.username, 
+                        "remove_agent_from_case", 
+                        {
+                            "case_id": st.session_state.active_case,
+                            "agent_id": agent_id,
+                            "agent_name": agent_name
+                        }
+                    )
+                    
+                    st.success(f"Removed agent {agent_name} from the case")
+                    st.rerun()
+    else:
+        st.info("No agents have been added to this case yet.")
+    
+    # Add new agents to the case
+    st.divider()
+    st.subheader("Add Agents")
+    
+    try:
+        all_agents = AGENT_INDEX.all()
+        available_agents = [agent for agent in all_agents if agent['id'] not in case_agents]
+        
+        if available_agents:
+            agent_options = {f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})": agent['id'] for agent in available_agents}
+            selected_agent_name = st.selectbox("Select agent to add:", list(agent_options.keys()))
+            selected_agent_id = agent_options[selected_agent_name]
+            
+            if st.button("Add Agent to Case"):
+                # Add agent to case
+                if "agents" not in active_case:
+                    active_case["agents"] = []
+                
+                active_case["agents"].append(selected_agent_id)
+                
+                # Save the updated cases
+                save_cases(st.session_state.username, st.session_state.cases)
+                
+                # Log the action
+                log_user_action(
+                    st.session_state.username, 
+                    "add_agent_to_case", 
+                    {
+                        "case_id": st.session_state.active_case,
+                        "agent_id": selected_agent_id,
+                        "agent_name": selected_agent_name
+                    }
+                )
+                
+                st.success("Added agent to the case")
+                st.rerun()
+        else:
+            st.info("All available agents have already been added to this case.")
+    except Exception as e:
+        st.error(f"Error loading available agents: {str(e)}")
+
+@st.fragment
+@timed("render_case_details")
+def render_case_details(case_id):
+    """Details tab of a case: title, documents and the case summary"""
+    active_case = st.session_state.cases[case_id]
+    st.subheader("Case Details")
+    
+    # Display case ID
+    st.write(f"Case ID: {active_case['id']}")
+    
+    # Edit case title
+    new_title = st.text_input("Case Title", value=active_case['title'], key="edit_case_title")
+    
+    if new_title != active_case['title'] and st.button("Update Case Title"):
+        # Log the action
+        log_user_action(
+            st.session_state.username, 
+            "update_case_title", 
+            {
+                "case_id": st.session_state.active_case,
+                "old_title": active_case['title'],
+                "new_title": new_title
+            }
+        )
+        
+        # Update case title
+        active_case['title'] = new_title
+        
+        # Save the updated cases
+        save_cases(st.session_state.username, st.session_state.cases)
+        
+        st.success("Updated case title")
+        st.rerun()
+    
+    # Case documents section
+    st.divider()
+    st.subheader("Case Documents")
+    
+    # Initialize documents list if not exists
+    if "documents" not in active_case:
+        active_case["documents"] = []
+    
+    # Document upload section
+    case_uploaded_files = st.file_uploader(
+        "Upload documents to this case",
+        type=["pdf", "txt", "docx", "doc", "rtf", "png", "jpg", "jpeg"],
+        accept_multiple_files=True,
+        key="case_document_uploader"
+    )
+    
+    if case_uploaded_files and st.button("Attach Documents to Case"):
+        # Create a documents directory for cases if it doesn't exist
+        case_docs_dir = os.path.join(CASES_DIR, "documents")
+        os.makedirs(case_docs_dir, exist_ok=True)
+        
+        # Create case-specific directory
+        case_specific_dir = os.path.join(case_docs_dir, st.session_state.active_case)
+        os.makedirs(case_specific_dir, exist_ok=True)
+        
+        # Process each file
+        for uploaded_file in case_uploaded_files:
+            # Create unique filename (timestamp + original name)
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{timestamp}_{uploaded_file.name}"
+            file_path = os.path.join(case_specific_dir, filename)
+            
+            # Save the file
+            with open(file_path, 'wb') as f:
+                f.write(uploaded_file.getvalue())
+            
+            # Add to case documents list
+            active_case["documents"].append({
+                "id": str(uuid.uuid4()),
+                "name": uploaded_file.name,
+                "filename": filename,
+                "uploaded_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "uploaded_by": st.session_state.username,
+                "file_path": file_path,
+                "size": uploaded_file.size,
+                "type": uploaded_file.type,
+            })
+            
+            # Log the document upload
+            log_user_action(
+                st.session_state.username, 
+                "upload_case_document", 
+                {
+                    "case_id": st.session_state.active_case,
+                    "filename": uploaded_file.name,
+                    "file_size": uploaded_file.size
+                }
+            )
+        
+        # Save the updated cases
+        save_cases(st.session_state.username, st.session_state.cases)
+        st.success(f"Successfully attached {len(case_uploaded_files)} document(s) to the case")
+        st.rerun()
+    
+    # Display existing documents
+    if active_case["documents"]:
+        st.write("Attached documents:")
+        
+        for i, doc in enumerate(active_case["documents"]):
+            col1, col2, col3 = st.columns([3, 1, 1])
+            
+            with col1:
+                st.write(f"{i+1}. {doc['name']} ({doc['uploaded_at']})")
+            
+            with col2:
+                # Check if file exists before offering download
+                if os.path.exists(doc['file_path']):
+                    with open(doc['file_path'], "rb") as file:
+                        st.download_button(
+                            label="Download",
+                            data=file,
+                            file_name=doc['name'],
+                            mime=doc['type'],
+                            key=f"download_{doc['id']}"
+                        )
+                else:
+                    st.error("File not found")
+            
+            with col3:
+                if st.button("Delete", key=f"delete_doc_{doc['id']}"):
+                    # Try to delete the actual file
+                    if os.path.exists(doc['file_path']):
+                        os.remove(doc['file_path'])
+                    
+                    # Remove from documents list
+                    active_case["documents"].remove(doc)
+                    
+                    # Log the action
+                    log_user_action(
+                        st.session_state.username, 
+                        "delete_case_document", 
+                        {
+                            "case_id": st.session_state.active_case,
+                            "filename": doc['name']
+                        }
+                    )
+                    
+                    # Save the updated cases
+                    save_cases(st.session_state.username, st.session_state.cases)
+                    st.success(f"Deleted document: {doc['name']}")
+                    st.rerun()
+    else:
+        st.info("No documents attached to this case yet.")
+    
+    # Option to import documents to agent sources
+    if active_case["documents"] and has_permission("upload_documents"):
+        st.divider()
+        st.subheader("Import Documents to Agent")
+        
+        # Get the available agents for this case
+        available_agents = []
+        try:
+            # Try case-specific agents first
+            case_agents = active_case.get("agents", [])
+            if case_agents:
+                agents = AGENT_INDEX.all()
+                available_agents = [agent for agent in agents if agent['id'] in case_agents]
+            
+            # If no case agents, get all agents
+            if not available_agents:
+                available_agents = AGENT_INDEX.all()
+            
+            if available_agents:
+                # Select agent
+                agent_options = {f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})": agent['id'] for agent in available_agents}
+                selected_agent_name = st.selectbox("Select agent:", list(agent_options.keys()), key="import_agent_select")
+                selected_agent_id = agent_options[selected_agent_name]
+                
+                # Get sources for the selected agent
+                agent_sources = get_agent_sources(st.session_state.client, selected_agent_id)
+                
+                if agent_sources:
+                    # Create a dropdown to select which source to upload to
+                    source_options = {source.get('name', f"Source {i}"): source['id'] for i, source in enumerate(agent_sources)}
+                    selected_source_name = st.selectbox("Select source to upload to:", list(source_options.keys()), key="import_source_select")
+                    selected_source_id = source_options[selected_source_name]
+                    
+                    # Multi-select for documents
+                    st.write("Select documents to import:")
+                    selected_docs = []
+                    for i, doc in enumerate(active_case["documents"]):
+                        if st.checkbox(f"{doc['name']}", key=f"import_doc_{doc['id']}"):
+                            selected_docs.append(doc)
+                    
+                    if selected_docs and st.button("Import Selected Documents to Agent"):
+                        with st.spinner("Importing documents to agent..."):
+                            success_count = 0
+                            for doc in selected_docs:
                                 try:
-                                    # Process each file
-                                    for uploaded_file in uploaded_files:
-                                        st.write(f"Processing: {uploaded_file.name}")
-                                        
-                                        # Create a temporary file with the original filename
-                                        temp_path = os.path.join(temp_dir, uploaded_file.name)
-                                        
-                                        # Write the file content
-                                        with open(temp_path, 'wb') as f:
-                                            f.write(uploaded_file.getvalue())
-                                        
+                                    # Check if file exists
+                                    if os.path.exists(doc['file_path']):
                                         # Upload file to the selected source
-                                        st.session_state.client.upload_file_to_source(selected_source_id, temp_path)
-                                        
-                                        # Log the document upload
-                                        log_user_action(
-                                            st.session_state.username, 
-                                            "upload_document", 
-                                            {
-                                                "filename": uploaded_file.name, 
-                                                "source_id": selected_source_id,
-                                                "source_name": selected_source_name
-                                            }
+                                        upload_result = st.session_state.client.upload_file_to_source(
+                                            selected_source_id, 
+                                            doc['file_path']
                                         )
                                         
-                                        st.success(f"Successfully uploaded: {uploaded_file.name}")
-                                        
-                                        # Clean up the individual temp file
-                                        os.remove(temp_path)
-                                    
-                                    # Clean up the temp directory
-                                    os.rmdir(temp_dir)
-                                    
+                                        if upload_result:
+                                            success_count += 1
+                                            
+                                            # Log the action
+                                            log_user_action(
+                                                st.session_state.username,
+                                                "import_case_document_to_agent",
+                                                {
+                                                    "case_id": st.session_state.active_case,
+                                                    "filename": doc['name'],
+                                                    "agent_id": selected_agent_id,
+                                                    "source_id": selected_source_id
+                                                }
+                                            )
+                                    else:
+                                        st.error(f"File not found: {doc['name']}")
                                 except Exception as e:
-                                    st.error(f"Error processing documents: {str(e)}")
-                                    # Clean up temp directory in case of error
-                                    try:
-                                        for file in os.listdir(temp_dir):
-                                            os.remove(os.path.join(temp_dir, file))
-                                        os.rmdir(temp_dir)
-                                    except:
-                                        pass
-                    except Exception as e:
-                        st.error(f"Error retrieving agent sources: {str(e)}")
-
-        # Main chat interface
-        if has_permission("chat"):
-            # Switch between regular chat and case view modes
-            if st.session_state.view_mode == "normal":
-                # Check if there's an active conversation, otherwise show welcome message
-                if st.session_state.active_conversation and st.session_state.active_conversation in st.session_state.conversations:
-                    active_conv = st.session_state.conversations[st.session_state.active_conversation]
-                    
-                    # Show conversation title as header
-                    st.header(f"Conversation: {active_conv['title']}")
-                    
-                    # Display chat messages for the active conversation
-                    for message in active_conv['messages']:
-                        with st.chat_message(message["role"]):
-                            st.markdown(message["content"])
-                            # Only show reasoning expander if reasoning exists and user has permission
-                            if "reasoning" in message and message["reasoning"] and has_permission("view_reasoning"):
-                                with st.expander("View Agent Reasoning"):
-                                    st.markdown(message["reasoning"])
-
-                    # Chat input for active conversation
-                    prompt = st.chat_input("What would you like to know about international trade law?")
-                    
-                    if prompt:
-                        # Get the agent ID for this conversation
-                        agent_id = active_conv.get('agent_id', st.session_state.selected_agent)
-                        
-                        if not agent_id:
-                            st.error("No agent selected for this conversation.")
-                        else:
-                            # Add user message to conversation
-                            active_conv['messages'].append({"role": "user", "content": prompt})
+                                    st.error(f"Error importing {doc['name']}: {str(e)}")
                             
-                            # Display user message
-                            with st.chat_message("user"):
-                                st.markdown(prompt)
+                            if success_count > 0:
+                                st.success(f"Successfully imported {success_count} document(s) to the agent")
+                            else:
+                                st.error("No documents were successfully imported")
+                else:
+                    st.warning("No sources are attached to this agent. Please attach sources through the Letta Server UI.")
+            else:
+                st.error("No agents available.")
+        except Exception as e:
+            st.error(f"Error loading agents or sources: {str(e)}")
+    
+    # Case summary section
+    st.divider()
+    st.subheader("Case Summary")
+    
+    # Check if there are conversations in the case
+    case_conversations = active_case.get("conversations", {})
+    if not case_conversations:
+        st.info("No conversations in this case yet. Add conversations before generating a summary.")
+    else:
+        # Select agent for summarization
+        available_agents = []
+        try:
+            agents = AGENT_INDEX.all()
+            if agents:
+                agent_options = {f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})": agent['id'] for agent in agents}
+                selected_summary_agent_name = st.selectbox("Select agent for summarization:", list(agent_options.keys()), key="summary_agent_select")
+                selected_summary_agent_id = agent_options[selected_summary_agent_name]
+                
+                # Generate summary button
+                if st.button("Generate Case Summary"):
+                    with st.spinner("Generating case summary..."):
+                        try:
+                            # Compile all conversations into a single document
+                            conversation_text = f"# Case Summary Request: {active_case['title']}\n\n"
+                            
+                            for conv_id, conv in case_conversations.items():
+                                conversation_text += f"## Conversation: {conv.get('title', 'Untitled')}\n"
                                 
-                            # Log the message send action
+                                # Include messages from this conversation
+                                messages = conv.get('messages', [])
+                                if messages:
+                                    for i, msg in enumerate(messages):
+                                        role = msg.get('role', 'unknown').upper()
+                                        content = msg.get('content', 'No content')
+                                        conversation_text += f"{role}: {content}\n\n"
+                                else:
+                                    conversation_text += "No messages in this conversation.\n\n"
+                                
+                                conversation_text += "---\n\n"
+                            
+                            # Add the summary request instruction at the end
+                            conversation_text += "\nPlease provide a comprehensive summary of this legal case. Include key issues, arguments, legal principles discussed, and any conclusions or recommendations made throughout the conversations."
+                            
+                            # Send to the selected agent for summarization
+                            summary_response = st.session_state.client.send_message(
+                                selected_summary_agent_id,
+                                conversation_text
+                            )
+                            
+                            # Extract content from response
+                            summary_content = ""
+                            if isinstance(summary_response, dict) and "messages" in summary_response:
+                                for msg in summary_response["messages"]:
+                                    if msg.get("message_type") == "assistant_message":
+                                        summary_content = msg.get("content", "")
+                            
+                            # Store the summary in the case data
+                            if "summary" not in active_case:
+                                active_case["summary"] = {}
+                            
+                            active_case["summary"]["content"] = summary_content
+                            active_case["summary"]["generated_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            active_case["summary"]["generated_by"] = selected_summary_agent_id
+                            
+                            # Save the updated case
+                            save_cases(st.session_state.username, st.session_state.cases)
+                            
+                            # Log the action
                             log_user_action(
-                                st.session_state.username, 
-                                "send_message", 
+                                st.session_state.username,
+                                "generate_case_summary",
                                 {
-                                    "conversation_id": st.session_state.active_conversation,
-                                    "conversation_title": active_conv["title"],
-                                    "message": prompt[:50] + ("..." if len(prompt) > 50 else "")
+                                    "case_id": st.session_state.active_case,
+                                    "agent_id": selected_summary_agent_id
                                 }
                             )
-                                
-                            # Get agent response
-                            with st.chat_message("assistant"):
-                                with st.spinner("Thinking..."):
-                                    try:
-                                        response = st.session_state.client.send_message(
-                                            agent_id, 
-                                            prompt
-                                        )
-                                        
-                                        # Extract content and reasoning if available
-                                        content = ""
-                                        reasoning = ""
-                                        
-                                        # Parse the Letta API response format
-                                        if isinstance(response, dict) and "messages" in response:
-                                            for msg in response["messages"]:
-                                                if msg.get("message_type") == "reasoning_message":
-                                                    reasoning = msg.get("reasoning", "")
-                                                elif msg.get("message_type") == "assistant_message":
-                                                    content = msg.get("content", "")
-                                        
-                                        # Display response
-                                        st.markdown(content)
-                                        
-                                        # Display reasoning in an expander if user has permission
-                                        if reasoning and has_permission("view_reasoning"):
-                                            with st.expander("View Agent Reasoning"):
-                                                st.markdown(reasoning)
-                                        
-                                        # Add to conversation history
-                                        active_conv['messages'].append({
-                                            "role": "assistant", 
-                                            "content": content,
-                                            "reasoning": reasoning
-                                        })
-                                        
-                                        # Save the updated conversations
-                                        save_conversations(st.session_state.username, st.session_state.conversations)
-                                        
-                                    except Exception as e:
-                                        st.error(f"Error getting response: {str(e)}")
-                else:
-                    # Welcome message if no conversation is active
-                    st.header("Welcome to LegalSphere")
-                    st.write("Start a new conversation from the sidebar to begin chatting.")
+                            
+                            st.success("Case summary generated successfully!")
+                        except Exception as e:
+                            st.error(f"Error generating summary: {str(e)}")
+            else:
+                st.error("No agents available for generating a summary.")
+        except Exception as e:
+            st.error(f"Error loading agents: {str(e)}")
+        
+        # Display existing summary if available
+        if "summary" in active_case and "content" in active_case["summary"]:
+            with st.expander("View Case Summary", expanded=True):
+                st.markdown(active_case["summary"]["content"])
+                st.caption(f"Generated at: {active_case['summary'].get('generated_at', 'Unknown')}")
+                
+                # Download summary option
+                if st.button("Download Summary as Text"):
+                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                    summary_filename = f"{active_case['title']}_{timestamp}_summary.txt"
+                    summary_content = active_case["summary"]["content"]
                     
-                    if not st.session_state.selected_agent:
-                        st.warning("Please select an agent from the sidebar first.")
-                    else:
-                        # Offer a quick start button if an agent is selected
-                        if st.button("Start New Conversation", key="main_new_conv_btn"):
-                            new_conv_id = create_new_conversation("New Legal Consultation")
-                            st.session_state.active_conversation = new_conv_id
-                            st.rerun()
+                    # Create a download button for the text
+                    st.download_button(
+                        label="Download Summary",
+                        data=summary_content,
+                        file_name=summary_filename,
+                        mime="text/plain"
+                    )
+    
+    # Option to close/archive case (future enhancement)
+    st.divider()
+    if st.button("⬅️ Return to Case List"):
+        st.session_state.active_case = None
+        st.session_state.case_conversation = None
+        st.session_state.view_mode = "normal"
+        st.rerun()
+
+@st.fragment
+@timed("render_case_workflow")
+def render_case_workflow(case_id):
+    """Workflow tab of a case: template assignment, stage progress, notes and status"""
+    active_case = st.session_state.cases[case_id]
+    st.subheader("Case Workflow")
+    
+    # Check if the case already has a workflow
+    if active_case.get("workflow") is None:
+        # No workflow assigned yet, show workflow template selection
+        st.write("No workflow assigned to this case yet.")
+        
+        # Get available workflow templates
+        workflow_templates = get_workflow_templates()
+        if WORKFLOW_REGISTRY.errors and has_permission("view_logs"):
+            st.warning("Skipped invalid workflow templates: " + "; ".join(
+                f"{filename}: {error}" for filename, error in sorted(WORKFLOW_REGISTRY.errors.items())))
+        
+        if workflow_templates:
+            # Create select box for templates
+            template_options = {template["name"]: template_id for template_id, template in workflow_templates.items()}
+            selected_template_name = st.selectbox(
+                "Select a workflow template:",
+                list(template_options.keys())
+            )
+            selected_template_id = template_options[selected_template_name]
+            
+            # Display template description
+            st.info(workflow_templates[selected_template_id]["description"])
+            
+            # Show stages in the selected template
+            st.write("This workflow includes the following stages:")
+            for i, stage in enumerate(workflow_templates[selected_template_id]["stages"]):
+                automated_label = " 🤖" if stage.get("prompt") else ""
+                st.write(f"{i+1}. **{stage['name']}**{automated_label}: {stage['description']}")
+            
+            # Stages with an agent prompt can be run by the background scheduler
+            automate_workflow = False
+            if any(stage.get("prompt") for stage in workflow_templates[selected_template_id]["stages"]):
+                automate_workflow = st.checkbox(
+                    "Run 🤖 stages automatically with the case's agents",
+                    key="automate_workflow"
+                )
+            
+            # Button to assign the workflow
+            if st.button("Assign Workflow to Case"):
+                if assign_workflow_to_case(st.session_state.active_case, selected_template_id,
+                                           automated=automate_workflow):
+                    st.success(f"Assigned '{selected_template_name}' workflow to this case!")
+                    st.rerun()
+                else:
+                    st.error("Failed to assign workflow. Please try again.")
+        else:
+            st.error("No workflow templates available.")
+    else:
+        # Workflow is already assigned, show workflow progress
+        workflow = active_case["workflow"]
+        st.write(f"**Current Workflow:** {workflow['name']}")
+        st.write(workflow["description"])
+        st.write(f"Assigned on: {workflow['assigned_at']}")
+        
+        # Create progress meter
+        progress = get_workflow_progress(workflow)
+        
+        st.progress(progress["progress_pct"] / 100)
+        st.write(f"Progress: {progress['progress_pct']}% "
+                 f"({progress['completed_stages']}/{progress['total_stages']} stages completed)")
+        
+        # Show all stages with their status
+        st.subheader("Workflow Stages")
+        stage_runs = WORKFLOW_STORE.get_workflow_runs(st.session_state.active_case) if workflow.get("automated") else {}
+        
+        for i, stage in enumerate(workflow["stages"]):
+            # Create an expander for each stage
+            status_emoji = {
+                "not_started": "⚪",
+                "in_progress": "🔵",
+                "completed": "✅"
+            }.get(stage["status"], "⚪")
+            
+            with st.expander(
+                f"{status_emoji} Stage {i+1}: {stage['name']} - "
+                f"**{stage['status'].replace('_', ' ').title()}**",
+                expanded=(i == workflow["current_stage_index"])
+            ):
+                st.write(f"**Description:** {stage['description']}")
+                
+                # Automated run state, if the scheduler has picked this stage up
+                if i in stage_runs:
+                    run = stage_runs[i]
+                    run_text = f"🤖 Automated run: {run['status']}"
+                    if run["error"]:
+                        run_text += f" (attempt {run['attempts']}: {run['error']})"
+                    st.caption(run_text)
+                
+                # Show dates if available
+                if stage["start_date"]:
+                    st.write(f"**Started:** {stage['start_date']}")
+                if stage["completion_date"]:
+                    st.write(f"**Completed:** {stage['completion_date']}")
+                
+                # Stage notes, keyed by completion too so notes written by an automated run replace the old value
+                stage_notes = st.text_area(
+                    "Stage Notes",
+                    value=stage["notes"],
+                    key=f"notes_{st.session_state.active_case}_{i}_{stage['completion_date']}",
+                    height=100
+                )
+                
+                # Changes are applied in button callbacks, so this tab redraws with them without a full app rerun
+                if stage_notes != stage["notes"]:
+                    st.button("Save Notes", key=f"save_notes_{i}", on_click=update_workflow_stage_notes,
+                              args=(case_id, i, stage_notes))
+                
+                # Status controls - only show relevant status change buttons
+                status_col1, status_col2, status_col3 = st.columns(3)
+                
+                with status_col1:
+                    if stage["status"] != "not_started" and i > 0:
+                        st.button("⬅️ Mark Not Started", key=f"not_started_{i}", on_click=update_workflow_stage_status,
+                                  args=(case_id, i, "not_started"))
+                
+                with status_col2:
+                    if stage["status"] != "in_progress":
+                        st.button("🔄 Mark In Progress", key=f"in_progress_{i}", on_click=update_workflow_stage_status,
+                                  args=(case_id, i, "in_progress"))
+                
+                with status_col3:
+                    if stage["status"] != "completed":
+                        st.button("✅ Mark Completed", key=f"completed_{i}", on_click=update_workflow_stage_status,
+                                  args=(case_id, i, "completed"))
+
+# Login screen
+if not st.session_state.authenticated:
+    st.title("LegalSphere: Legal AI Assistant")
+    st.subheader("Login")
+    
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        username = st.text_input("Username")
+        password = st.text_input("Password", type="password")
+        login_button = st.button("Login")
+        
+        if login_button:
+            if authenticate(username, password):
+                st.success(f"Logged in as {username} with role: {st.session_state.user_role}")
+                st.rerun()
+            else:
+                st.error("Invalid username or password")
+                # Log failed login attempt
+                log_user_action(username, "failed_login", {"reason": "Invalid credentials"})
+    
+    with col2:
+        st.info("Demo Accounts:")
+        st.markdown("- Admin: admin1/admin123")
+        st.markdown("- Legal Advisor: advisor1/legal123")  
+        st.markdown("- Client: client1/client123")
+        st.markdown("- Guest: guest1/guest123")
+        
+        st.markdown("---")
+        st.markdown("**Role Permissions:**")
+        st.markdown("- **Admin**: All access + Audit Logs")
+        st.markdown("- **Legal Advisor**: Full system access")
+        st.markdown("- **Client**: View agents and chat")
+        st.markdown("- **Guest**: Chat only")
+
+else:
+    # Pick up changes other sessions and processes made to this user's stores
+    refresh_session_stores(st.session_state.username)
+    restore_open_items(st.session_state.username)
+    
+    # App header
+    st.title("LegalSphere: Legal AI Assistant")
+    st.subheader("International Trade Law & WTO Regulations")
+    
+    # User info and logout in top right
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        st.info(f"Logged in as: {st.session_state.user_role.upper()}")
+        
+        if st.button("Logout"):
+            # Log the logout action
+            log_user_action(st.session_state.username, "logout")
+            
+            # Save conversations before logout
+            if st.session_state.username:
+                save_conversations(st.session_state.username, st.session_state.conversations)
+                save_cases(st.session_state.username, st.session_state.cases)
+            
+            # Clear session state
+            st.session_state.authenticated = False
+            st.session_state.user_role = None
+            st.session_state.username = None
+            st.session_state.conversations = {}
+            st.session_state.active_conversation = None
+            st.session_state.cases = {}
+            st.session_state.active_case = None
+            st.session_state.case_conversation = None
+            st.session_state.view_mode = "normal"
+            st.session_state.show_logs = False
+            st.session_state.show_conversation_export = False
+            st.session_state.store_versions = {}
+            st.rerun()
+
+    # Admin-only section for logs
+    if has_permission("view_logs"):
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("Admin Tools")
+        
+        if st.sidebar.checkbox("Show Audit Logs", value=st.session_state.show_logs):
+            st.session_state.show_logs = True
+        else:
+            st.session_state.show_logs = False
+    
+    # If admin wants to see logs, show them instead of the main interface
+    if st.session_state.show_logs and has_permission("view_logs"):
+        st.header("System Audit Logs")
+        
+        # Add tabs for Audit Logs, Conversation Export, Performance and the case Portfolio
+        tab1, tab2, tab3, tab4 = st.tabs(["Audit Logs", "Conversation Export", "Performance", "Portfolio"])
+        
+        with tab1:
+            render_audit_logs()
+        
+        with tab2:
+            render_conversation_export()
+
+        with tab3:
+            render_performance()
+        
+        with tab4:
+            render_portfolio()
+
+    else:
+        # Regular app interface (when not viewing logs)
+        # Sidebar for agent selection, conversation management, and document upload
+        with st.sidebar:
+            st.header("Configuration")
             
-            # Case view mode
-            elif st.session_state.view_mode == "case" and st.session_state.active_case:
-                active_case = st.session_state.cases[st.session_state.active_case]
-                
-                # Show case details
-                st.header(f"Case: {active_case['title']}")
-                st.write(f"Created: {active_case['created_at']}")
-                
-                # Case management tabs
-                case_tabs = st.tabs(["Conversations", "Agents", "Details", "Workflow"])
-                
-                # Conversations tab - manage conversations within this case
-                with case_tabs[0]:
-                    # Top-level columns for case conversation management
-                    col1, col2 = st.columns([2, 1])
-                    
-                    with col1:
-                        st.subheader("Case Conversations")
-                    
-                    with col2:
-                        # Create new conversation in the case
-                        new_case_conv_title = st.text_input("New conversation title", key="new_case_conv_title")
-                    
-                    # Button to create a new conversation
-                    if st.button("New Case Conversation") and st.session_state.active_case:
-                        # Select an agent for this conversation
-                        agent_id = None
-                        case_agents = active_case.get("agents", [])
-                        
-                        # Use the first agent in the case's agent list if available, otherwise use the selected agent
-                        if case_agents:
-                            agent_id = case_agents[0]
-                        elif st.session_state.selected_agent:
-                            agent_id = st.session_state.selected_agent
-                        
-                        if agent_id:
-                            # Create conversation within the case
-                            conv_id = create_case_conversation(
-                                st.session_state.active_case, 
-                                new_case_conv_title or "New Discussion",
-                                agent_id
-                            )
-                            st.session_state.case_conversation = conv_id
-                            st.success("Created new case conversation")
-                            st.rerun()
-                        else:
-                            st.error("No agent available for this conversation. Please add agents to the case or select one.")
-                    
-                    # List all conversations in this case
-                    case_conversations = active_case.get("conversations", {})
-                    
-                    if case_conversations:
-                        # Sort conversations by creation date (newest first)
-                        sorted_case_convs = sorted(
-                            case_conversations.items(),
-                            key=lambda x: x[1].get('created_at', ''),
-                            reverse=True
-                        )
-                        
-                        # Show the conversations list
-                        for conv_id, conv in sorted_case_convs:
-                            conv_col1, conv_col2 = st.columns([3, 1])
-                            
-                            with conv_col1:
-                                if st.button(f"{conv['title']}", key=f"case_conv_{conv_id}"):
-                                    st.session_state.case_conversation = conv_id
-                                    st.rerun()
-                            
-                            with conv_col2:
-                                if st.button("🗑️", key=f"delete_case_conv_{conv_id}"):
-                                    # Log the deletion
-                                    log_user_action(
-                                        st.session_state.username, 
-                                        "delete_case_conversation", 
-                                        {
-                                            "case_id": st.session_state.active_case,
-                                            "conversation_id": conv_id, 
-                                            "title": conv["title"]
-                                        }
-                                    )
-                                    
-                                    # Delete the conversation from the case
-                                    del active_case["conversations"][conv_id]
-                                    
-                                    # Save the updated cases
-                                    save_cases(st.session_state.username, st.session_state.cases)
-                                    
-                                    if st.session_state.case_conversation == conv_id:
-                                        st.session_state.case_conversation = None
-                                    st.rerun()
-                        
-                        # Show active conversation if one is selected
-                        if st.session_state.case_conversation and st.session_state.case_conversation in case_conversations:
-                            active_conv = case_conversations[st.session_state.case_conversation]
-                            
-                            st.divider()
-                            
-                            # Show conversation title as header
-                            st.subheader(f"Conversation: {active_conv['title']}")
-                            
-                            # Display chat messages for the active conversation
-                            for message in active_conv['messages']:
-                                with st.chat_message(message["role"]):
-                                    st.markdown(message["content"])
-                                    # Only show reasoning expander if reasoning exists and user has permission
-                                    if "reasoning" in message and message["reasoning"] and has_permission("view_reasoning"):
-                                        with st.expander("View Agent Reasoning"):
-                                            st.markdown(message["reasoning"])
-
-                            # Chat input for active conversation
-                            case_prompt = st.chat_input("Type your message here...")
-                            
-                            if case_prompt:
-                                # Get the agent ID for this conversation
-                                agent_id = active_conv.get('agent_id')
-                                
-                                if not agent_id:
-                                    # If no agent specified for this conversation, try to use a case agent or the selected agent
-                                    case_agents = active_case.get("agents", [])
-                                    if case_agents:
-                                        agent_id = case_agents[0]
-                                    else:
-                                        agent_id = st.session_state.selected_agent
-                                
-                                if not agent_id:
-                                    st.error("No agent selected for this conversation.")
-                                else:
-                                    # Add user message to conversation
-                                    active_conv['messages'].append({"role": "user", "content": case_prompt})
-                                    
-                                    # Display user message
-                                    with st.chat_message("user"):
-                                        st.markdown(case_prompt)
-                                            
-                                    # Log the message send action
-                                    log_user_action(
-                                        st.session_state.username, 
-                                        "send_case_message", 
-                                        {
-                                            "case_id": st.session_state.active_case,
-                                            "conversation_id": st.session_state.case_conversation,
-                                            "conversation_title": active_conv["title"],
-                                            "message": case_prompt[:50] + ("..." if len(case_prompt) > 50 else "")
-                                        }
-                                    )
-                                            
-                                    # Get agent response
-                                    with st.chat_message("assistant"):
-                                        with st.spinner("Thinking..."):
-                                            try:
-                                                response = st.session_state.client.send_message(
-                                                    agent_id, 
-                                                    case_prompt
-                                                )
-                                                
-                                                # Extract content and reasoning if available
-                                                content = ""
-                                                reasoning = ""
-                                                
-                                                # Parse the Letta API response format
-                                                if isinstance(response, dict) and "messages" in response:
-                                                    for msg in response["messages"]:
-                                                        if msg.get("message_type") == "reasoning_message":
-                                                            reasoning = msg.get("reasoning", "")
-                                                        elif msg.get("message_type") == "assistant_message":
-                                                            content = msg.get("content", "")
-                                                
-                                                # Display response
-                                                st.markdown(content)
-                                                
-                                                # Display reasoning in an expander if user has permission
-                                                if reasoning and has_permission("view_reasoning"):
-                                                    with st.expander("View Agent Reasoning"):
-                                                        st.markdown(reasoning)
-                                                
-                                                # Add to conversation history
-                                                active_conv['messages'].append({
-                                                    "role": "assistant", 
-                                                    "content": content,
-                                                    "reasoning": reasoning
-                                                })
-                                                
-                                                # Save the updated cases
-                                                save_cases(st.session_state.username, st.session_state.cases)
-                                                
-                                            except Exception as e:
-                                                st.error(f"Error getting response: {str(e)}")
-                    else:
-                        st.info("No conversations in this case yet. Create a new conversation to get started.")
-                
-                # Agents tab - manage agents for this case
-                with case_tabs[1]:
-                    st.subheader("Case Agents")
+            # Tab-based sidebar for normal view and case management
+            sidebar_tabs = st.tabs(["Regular Chat", "Cases"])
+            
+            with sidebar_tabs[0]:
+                # Agent Selection
+                if has_permission("view_agents"):
+                    st.subheader("Select Agent")
                     
-                    # Agent creation UI for case view
+                    # Agent Creation UI
                     if has_permission("create_agents"):
-                        with st.expander("Create New Agent for this Case"):
-                            new_agent_name = st.text_input("Agent Name", key="new_agent_name_case")
+                        with st.expander("Create New Agent"):
+                            new_agent_name = st.text_input("Agent Name", key="new_agent_name_regular")
                             new_agent_persona = st.text_area("Agent Persona", 
                                 placeholder="Enter a description of the agent's persona, expertise, and personality.", 
-                                key="new_agent_persona_case", 
+                                key="new_agent_persona_regular", 
                                 height=150)
-                            
-                            if st.button("Create Agent", key="create_agent_case"):
+                            if st.button("Create Agent", key="create_agent_regular"):
                                 try:
                                     with st.spinner("Creating new agent..."):
-                                        # Create agent using the client
-                                        new_agent = st.session_state.client.create_agent(new_agent_name, new_agent_persona)
-                                        new_agent_id = new_agent.get('id')
+                                        # Take a pre-provisioned agent from the warm pool
+                                        new_agent = AGENT_POOL.acquire(new_agent_name, new_agent_persona)
+                                        AGENT_INDEX.invalidate()
                                         
                                         # Log the action
                                         log_user_action(
                                             st.session_state.username, 
-                                            "create_case_agent", 
-                                            {
-                                                "agent_name": new_agent_name, 
-                                                "agent_id": new_agent_id,
-                                                "case_id": st.session_state.active_case,
-                                                "case_title": active_case["title"]
-                                            }
+                                            "create_agent", 
+                                            {"agent_name": new_agent_name, "agent_id": new_agent.get('id')}
                                         )
                                         
-                                        # Add the new agent to the case
-                                        if "agents" not in active_case:
-                                            active_case["agents"] = []
-                                        active_case["agents"].append(new_agent_id)
-                                        
-                                        # Save the updated cases
-                                        save_cases(st.session_state.username, st.session_state.cases)
+                                        # Set as selected agent
+                                        st.session_state.selected_agent = new_agent.get('id')
                                         
-                                        st.success(f"Created new agent and added to case: {new_agent_name}")
+                                        st.success(f"Created new agent: {new_agent_name}")
                                         st.rerun()
                                 except Exception as e:
                                     st.error(f"Error creating agent: {str(e)}")
                     
-                    # Display current agents in the case
-                    case_agents = active_case.get("agents", [])
+                    # Agent Selection UI
+                    try:
+                        agents = AGENT_INDEX.all()
+                        if agents:
+                            agent_names = [f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})" for agent in agents]
+                            selected_agent_index = st.selectbox("Choose an agent:", range(len(agent_names)), format_func=lambda i: agent_names[i])
+                            st.session_state.selected_agent = agents[selected_agent_index]['id']
+                            
+                            # Show agent details and delete option
+                            col1, col2 = st.columns([3, 1])
+                            with col1:
+                                st.write(f"Selected: {agents[selected_agent_index].get('name', 'Unnamed Agent')}")
+                            with col2:
+                                if st.button("🗑️ Delete", key="delete_agent_btn"):
+                                    try:
+                                        with st.spinner("Deleting agent..."):
+                                            # Delete the agent
+                                            st.session_state.client.delete_agent(agents[selected_agent_index]['id'])
+                                            AGENT_INDEX.invalidate()
+                                            
+                                            # Log the action
+                                            log_user_action(
+                                                st.session_state.username, 
+                                                "delete_agent", 
+                                                {
+                                                    "agent_name": agents[selected_agent_index].get('name', 'Unnamed Agent'),
+                                                    "agent_id": agents[selected_agent_index]['id']
+                                                }
+                                            )
+                                            
+                                            # If this was the selected agent, clear the selection
+                                            if st.session_state.selected_agent == agents[selected_agent_index]['id']:
+                                                st.session_state.selected_agent = None
+                                            
+                                            st.success(f"Deleted agent: {agents[selected_agent_index].get('name', 'Unnamed Agent')}")
+                                            st.rerun()
+                                    except Exception as e:
+                                        st.error(f"Error deleting agent: {str(e)}")
+                        else:
+                            st.error("No agents found. Please create one.")
+                    except Exception as e:
+                        st.error(f"Error loading agents: {str(e)}")
+                        st.session_state.selected_agent = None
+                else:
+                    # For users without agent selection permission, auto-select first agent if available
+                    try:
+                        agents = AGENT_INDEX.all()
+                        if agents:
+                            st.session_state.selected_agent = agents[0]['id']
+                    except Exception:
+                        st.session_state.selected_agent = None
+
+                # Conversation Management
+                st.subheader("Conversations")
+                
+                # Create new conversation button
+                if st.session_state.selected_agent:
+                    new_conv_title = st.text_input("New conversation title (optional)")
+                    if st.button("Start New Conversation", key="sidebar_new_conv_btn"):
+                        new_conv_id = create_new_conversation(new_conv_title)
+                        st.session_state.active_conversation = new_conv_id
+                        st.session_state.view_mode = "normal"
+                        st.rerun()
+                
+                # List all conversations for selection
+                if st.session_state.conversations:
+                    st.write("Your conversations:")
                     
-                    if case_agents:
-                        st.write("Current agents in this case:")
+                    # Sort conversations by creation date (newest first)
+                    sorted_conversations = sorted(
+                        st.session_state.conversations.items(),
+                        key=lambda x: x[1].get('created_at', ''),
+                        reverse=True
+                    )
+                    
+                    for conv_id, conv in sorted_conversations:
+                        col1, col2 = st.columns([3, 1])
                         
-                        for agent_id in case_agents:
-                            try:
-                                # Try to get agent details
-                                agent_found = False
-                                agents = st.session_state.client.list_agents()
-                                for agent in agents:
-                                    if agent['id'] == agent_id:
-                                        agent_name = agent.get('name', f"Agent {agent_id}")
-                                        agent_col1, agent_col2 = st.columns([3, 1])
-                                        
-                                        with agent_col1:
-                                            st.write(f"• {agent_name}")
-                                        
-                                        with agent_col2:
-                                            if st.button("Remove", key=f"remove_agent_{agent_id}"):
-                                                # Remove agent from case
-                                                active_case["agents"].remove(agent_id)
-                                                
-                                                # Save the updated cases
-                                                save_cases(st.session_state.username, st.session_state.cases)
-                                                
-                                                # Log the action
-                                                log_user_action(
-                                                    st.session_state.username, 
-                                                    "remove_agent_from_case", 
-                                                    {
-                                                        "case_id": st.session_state.active_case,
-                                                        "agent_id": agent_id,
-                                                        "agent_name": agent_name
-                                                    }
-                                                )
-                                                
-                                                st.success(f"Removed agent {agent_name} from the case")
-                                                st.rerun()
-                                        
-                                        agent_found = True
-                                        break
+                        with col1:
+                            conv_label = f"🗄️ {conv['title']}" if is_archived(conv) else conv['title']
+                            if st.button(conv_label, key=f"select_{conv_id}"):
+                                st.session_state.active_conversation = conv_id
+                                st.session_state.view_mode = "normal"
+                                st.rerun()
+                        
+                        with col2:
+                            if st.button("🗑️", key=f"delete_{conv_id}"):
+                                # Log the deletion
+                                log_user_action(
+                                    st.session_state.username, 
+                                    "delete_conversation", 
+                                    {"conversation_id": conv_id, "title": conv["title"]}
+                                )
+                                
+                                # Delete the conversation
+                                del st.session_state.conversations[conv_id]
+                                ITEM_ARCHIVE.discard(CONVERSATIONS, st.session_state.username, conv_id)
                                 
-                                if not agent_found:
-                                    st.write(f"• Unknown Agent ({agent_id})")
+                                # Save the updated conversations
+                                save_conversations(st.session_state.username, st.session_state.conversations)
+                                
+                                if st.session_state.active_conversation == conv_id:
+                                    st.session_state.active_conversation = None
+                                st.rerun()
+                else:
+                    st.info("No conversations yet. Start a new one!")
+            
+            with sidebar_tabs[1]:
+                if has_permission("manage_cases"):
+                    st.subheader("Case Management")
+                    
+                    # Add a note for admins
+                    if st.session_state.user_role == "admin":
+                        st.info("As an admin, you can view and manage all cases, including those created by legal advisors.")
+                    
+                    # Create new case
+                    new_case_title = st.text_input("New case name", key="new_case_name")
+                    
+                    # Option to create a new agent specifically for this case
+                    create_new_case_agent = st.checkbox("Create new agent for this case", key="create_new_case_agent")
+                    new_case_agent_name = None
+                    new_case_agent_persona = None
+                    
+                    if create_new_case_agent and has_permission("create_agents"):
+                        new_case_agent_name = st.text_input("New agent name", key="new_case_agent_name")
+                        new_case_agent_persona = st.text_area("Agent Persona", 
+                            placeholder="Enter a description of the agent's persona, expertise, and personality.", 
+                            key="new_case_agent_persona", 
+                            height=150)
+                    
+                    # Agent selection for case (optional)
+                    case_agents = []
+                    if has_permission("view_agents"):
+                        try:
+                            agents = AGENT_INDEX.all()
+                            if agents:
+                                st.write("Preselect agents for this case (optional):")
+                                for agent in agents:
+                                    agent_name = agent.get('name', f"Agent {agent['id']}")
+                                    if st.checkbox(f"{agent_name}", key=f"case_agent_{agent['id']}"):
+                                        case_agents.append(agent['id'])
+                        except Exception as e:
+                            st.error(f"Error loading agents for case: {str(e)}")
+                    
+                    # Document upload for case creation
+                    if has_permission("upload_documents"):
+                        st.write("Upload initial documents for this case (optional):")
+                        new_case_files = st.file_uploader(
+                            "Choose documents",
+                            type=["pdf", "txt", "docx", "doc", "rtf", "png", "jpg", "jpeg"],
+                            accept_multiple_files=True,
+                            key="new_case_document_uploader"
+                        )
+                    else:
+                        new_case_files = []
+                    
+                    if st.button("Create New Case") and new_case_title:
+                        # First create a new agent if requested
+                        if create_new_case_agent and new_case_agent_name and has_permission("create_agents"):
+                            try:
+                                with st.spinner("Creating new agent for case..."):
+                                    # Take a pre-provisioned agent from the warm pool
+                                    new_agent = AGENT_POOL.acquire(new_case_agent_name, new_case_agent_persona)
+                                    AGENT_INDEX.invalidate()
+                                    new_agent_id = new_agent.get('id')
+                                    
+                                    # Add to the case agents
+                                    case_agents.append(new_agent_id)
+                                    
+                                    # Log the action
+                                    log_user_action(
+                                        st.session_state.username, 
+                                        "create_agent_for_new_case", 
+                                        {"agent_name": new_case_agent_name, "agent_id": new_agent_id}
+                                    )
                                     
+                                    st.success(f"Created new agent: {new_case_agent_name}")
                             except Exception as e:
-                                st.error(f"Error loading agent details: {str(e)}")
-                    else:
-                        st.info("No agents have been added to this case yet.")
-                    
-                    # Add new agents to the case
-                    st.divider()
-                    st.subheader("Add Agents")
-                    
-                    try:
-                        all_agents = st.session_state.client.list_agents()
-                        available_agents = [agent for agent in all_agents if agent['id'] not in case_agents]
+                                st.error(f"Error creating agent: {str(e)}")
+                                # Continue with case creation even if agent creation fails
                         
-                        if available_agents:
-                            agent_options = {f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})": agent['id'] for agent in available_agents}
-                            selected_agent_name = st.selectbox("Select agent to add:", list(agent_options.keys()))
-                            selected_agent_id = agent_options[selected_agent_name]
+                        # Create the case
+                        new_case_id = create_new_case(new_case_title, case_agents)
+                        
+                        # Handle document uploads if any
+                        if new_case_files and has_permission("upload_documents"):
+                            # Create a documents directory for cases if it doesn't exist
+                            case_docs_dir = os.path.join(CASES_DIR, "documents")
+                            os.makedirs(case_docs_dir, exist_ok=True)
                             
-                            if st.button("Add Agent to Case"):
-                                # Add agent to case
-                                if "agents" not in active_case:
-                                    active_case["agents"] = []
+                            # Create case-specific directory
+                            case_specific_dir = os.path.join(case_docs_dir, new_case_id)
+                            os.makedirs(case_specific_dir, exist_ok=True)
+                            
+                            # Initialize documents list if not exists
+                            if "documents" not in st.session_state.cases[new_case_id]:
+                                st.session_state.cases[new_case_id]["documents"] = []
+                            
+                            # Process each file
+                            for uploaded_file in new_case_files:
+                                # Create unique filename (timestamp + original name)
+                                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                                filename = f"{timestamp}_{uploaded_file.name}"
+                                file_path = os.path.join(case_specific_dir, filename)
                                 
-                                active_case["agents"].append(selected_agent_id)
+                                # Save the file
+                                with open(file_path, 'wb') as f:
+                                    f.write(uploaded_file.getvalue())
                                 
-                                # Save the updated cases
-                                save_cases(st.session_state.username, st.session_state.cases)
+                                # Add to case documents list
+                                st.session_state.cases[new_case_id]["documents"].append({
+                                    "id": str(uuid.uuid4()),
+                                    "name": uploaded_file.name,
+                                    "filename": filename,
+                                    "uploaded_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                    "uploaded_by": st.session_state.username,
+                                    "file_path": file_path,
+                                    "size": uploaded_file.size,
+                                    "type": uploaded_file.type,
+                                })
                                 
-                                # Log the action
+                                # Log the document upload
                                 log_user_action(
                                     st.session_state.username, 
-                                    "add_agent_to_case", 
+                                    "upload_document_during_case_creation", 
                                     {
-                                        "case_id": st.session_state.active_case,
-                                        "agent_id": selected_agent_id,
-                                        "agent_name": selected_agent_name
+                                        "case_id": new_case_id,
+                                        "filename": uploaded_file.name,
+                                        "file_size": uploaded_file.size
                                     }
                                 )
-                                
-                                st.success(f"Added agent to the case")
-                                st.rerun()
-                        else:
-                            st.info("All available agents have already been added to this case.")
-                    except Exception as e:
-                        st.error(f"Error loading available agents: {str(e)}")
-                
-                # Details tab - view and edit case details
-                with case_tabs[2]:
-                    st.subheader("Case Details")
-                    
-                    # Display case ID
-                    st.write(f"Case ID: {active_case['id']}")
-                    
-                    # Edit case title
-                    new_title = st.text_input("Case Title", value=active_case['title'], key="edit_case_title")
-                    
-                    if new_title != active_case['title'] and st.button("Update Case Title"):
-                        # Log the action
-                        log_user_action(
-                            st.session_state.username, 
-                            "update_case_title", 
-                            {
-                                "case_id": st.session_state.active_case,
-                                "old_title": active_case['title'],
-                                "new_title": new_title
-                            }
-                        )
-                        
-                        # Update case title
-                        active_case['title'] = new_title
-                        
-                        # Save the updated cases
-                        save_cases(st.session_state.username, st.session_state.cases)
-                        
-                        st.success("Updated case title")
-                        st.rerun()
-                    
-                    # Case documents section
-                    st.divider()
-                    st.subheader("Case Documents")
-                    
-                    # Initialize documents list if not exists
-                    if "documents" not in active_case:
-                        active_case["documents"] = []
-                    
-                    # Document upload section
-                    case_uploaded_files = st.file_uploader(
-                        "Upload documents to this case",
-                        type=["pdf", "txt", "docx", "doc", "rtf", "png", "jpg", "jpeg"],
-                        accept_multiple_files=True,
-                        key="case_document_uploader"
-                    )
-                    
-                    if case_uploaded_files and st.button("Attach Documents to Case"):
-                        # Create a documents directory for cases if it doesn't exist
-                        case_docs_dir = os.path.join(CASES_DIR, "documents")
-                        os.makedirs(case_docs_dir, exist_ok=True)
-                        
-                        # Create case-specific directory
-                        case_specific_dir = os.path.join(case_docs_dir, st.session_state.active_case)
-                        os.makedirs(case_specific_dir, exist_ok=True)
-                        
-                        # Process each file
-                        for uploaded_file in case_uploaded_files:
-                            # Create unique filename (timestamp + original name)
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                            filename = f"{timestamp}_{uploaded_file.name}"
-                            file_path = os.path.join(case_specific_dir, filename)
-                            
-                            # Save the file
-                            with open(file_path, 'wb') as f:
-                                f.write(uploaded_file.getvalue())
                             
-                            # Add to case documents list
-                            active_case["documents"].append({
-                                "id": str(uuid.uuid4()),
-                                "name": uploaded_file.name,
-                                "filename": filename,
-                                "uploaded_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "uploaded_by": st.session_state.username,
-                                "file_path": file_path,
-                                "size": uploaded_file.size,
-                                "type": uploaded_file.type,
-                            })
-                            
-                            # Log the document upload
-                            log_user_action(
-                                st.session_state.username, 
-                                "upload_case_document", 
-                                {
-                                    "case_id": st.session_state.active_case,
-                                    "filename": uploaded_file.name,
-                                    "file_size": uploaded_file.size
-                                }
-                            )
+                            # Save the updated cases
+                            save_cases(st.session_state.username, st.session_state.cases)
                         
-                        # Save the updated cases
-                        save_cases(st.session_state.username, st.session_state.cases)
-                        st.success(f"Successfully attached {len(case_uploaded_files)} document(s) to the case")
+                        st.session_state.active_case = new_case_id
+                        st.session_state.view_mode = "case"
+                        st.success(f"Created new case: {new_case_title}")
                         st.rerun()
                     
-                    # Display existing documents
-                    if active_case["documents"]:
-                        st.write("Attached documents:")
+                    # List all cases
+                    if st.session_state.cases:
+                        st.write("Your cases:")
+                        
+                        # Sort cases by creation date (newest first)
+                        sorted_cases = sorted(
+                            st.session_state.cases.items(),
+                            key=lambda x: x[1].get('created_at', ''),
+                            reverse=True
+                        )
                         
-                        for i, doc in enumerate(active_case["documents"]):
-                            col1, col2, col3 = st.columns([3, 1, 1])
+                        for case_id, case in sorted_cases:
+                            col1, col2 = st.columns([3, 1])
                             
                             with col1:
-                                st.write(f"{i+1}. {doc['name']} ({doc['uploaded_at']})")
-                            
-                            with col2:
-                                # Check if file exists before offering download
-                                if os.path.exists(doc['file_path']):
-                                    with open(doc['file_path'], "rb") as file:
-                                        st.download_button(
-                                            label="Download",
-                                            data=file,
-                                            file_name=doc['name'],
-                                            mime=doc['type'],
-                                            key=f"download_{doc['id']}"
-                                        )
-                                else:
-                                    st.error("File not found")
-                            
-                            with col3:
-                                if st.button("Delete", key=f"delete_doc_{doc['id']}"):
-                                    # Try to delete the actual file
-                                    if os.path.exists(doc['file_path']):
-                                        os.remove(doc['file_path'])
+                                # Add workflow indicator if case has a workflow
+                                case_title = f"🗄️ {case['title']}" if is_archived(case) else case['title']
+                                if case.get('workflow'):
+                                    # Workflow progress is maintained whenever the workflow changes
+                                    progress = get_workflow_progress(case['workflow'])
                                     
-                                    # Remove from documents list
-                                    active_case["documents"].remove(doc)
+                                    # Add emoji and progress to case title
+                                    status_emoji = {
+                                        "not_started": "⚪",
+                                        "in_progress": "🔵",
+                                        "completed": "✅"
+                                    }.get(progress['current_status'], "⚪")
                                     
-                                    # Log the action
+                                    case_title = f"{case_title} {status_emoji} ({progress['progress_pct']}%)"
+                                
+                                if st.button(f"{case_title}", key=f"select_case_{case_id}"):
+                                    st.session_state.active_case = case_id
+                                    st.session_state.case_conversation = None  # Reset active conversation in the case
+                                    st.session_state.view_mode = "case"
+                                    st.rerun()
+                            
+                            with col2:
+                                if st.button("🗑️", key=f"delete_case_{case_id}"):
+                                    # Log the deletion
                                     log_user_action(
                                         st.session_state.username, 
-                                        "delete_case_document", 
-                                        {
-                                            "case_id": st.session_state.active_case,
-                                            "filename": doc['name']
-                                        }
+                                        "delete_case", 
+                                        {"case_id": case_id, "title": case["title"]}
                                     )
                                     
+                                    # Delete the case
+                                    del st.session_state.cases[case_id]
+                                    ITEM_ARCHIVE.discard(CASES, case.get("creator") or st.session_state.username, case_id)
+                                    WORKFLOW_STORE.delete_workflow_progress([case_id])
+                                    
                                     # Save the updated cases
                                     save_cases(st.session_state.username, st.session_state.cases)
-                                    st.success(f"Deleted document: {doc['name']}")
-                                    st.rerun()
-                    else:
-                        st.info("No documents attached to this case yet.")
-                    
-                    # Option to import documents to agent sources
-                    if active_case["documents"] and has_permission("upload_documents"):
-                        st.divider()
-                        st.subheader("Import Documents to Agent")
-                        
-                        # Get the available agents for this case
-                        available_agents = []
-                        try:
-                            # Try case-specific agents first
-                            case_agents = active_case.get("agents", [])
-                            if case_agents:
-                                agents = st.session_state.client.list_agents()
-                                available_agents = [agent for agent in agents if agent['id'] in case_agents]
-                            
-                            # If no case agents, get all agents
-                            if not available_agents:
-                                available_agents = st.session_state.client.list_agents()
-                            
-                            if available_agents:
-                                # Select agent
-                                agent_options = {f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})": agent['id'] for agent in available_agents}
-                                selected_agent_name = st.selectbox("Select agent:", list(agent_options.keys()), key="import_agent_select")
-                                selected_agent_id = agent_options[selected_agent_name]
-                                
-                                # Get sources for the selected agent
-                                agent_sources = st.session_state.client.get_agent_sources(selected_agent_id)
-                                
-                                if agent_sources:
-                                    # Create a dropdown to select which source to upload to
-                                    source_options = {source.get('name', f"Source {i}"): source['id'] for i, source in enumerate(agent_sources)}
-                                    selected_source_name = st.selectbox("Select source to upload to:", list(source_options.keys()), key="import_source_select")
-                                    selected_source_id = source_options[selected_source_name]
                                     
-                                    # Multi-select for documents
-                                    st.write("Select documents to import:")
-                                    selected_docs = []
-                                    for i, doc in enumerate(active_case["documents"]):
-                                        if st.checkbox(f"{doc['name']}", key=f"import_doc_{doc['id']}"):
-                                            selected_docs.append(doc)
+                                    # If this is a legal advisor, also remove from shared cases if exists
+                                    if st.session_state.user_role == "legal_advisor":
+                                        shared_file_path = get_shared_case_file_path()
+                                        if os.path.exists(shared_file_path):
+                                            try:
+                                                # Remove this case if it exists in shared cases
+                                                update_json(shared_file_path,
+                                                            lambda shared_cases: shared_cases.pop(case_id, None) is not None,
+                                                            after_write=publish_case_changes(deletes=[case_id]))
+                                            except Exception as e:
+                                                st.error(f"Error updating shared cases: {str(e)}")
                                     
-                                    if selected_docs and st.button("Import Selected Documents to Agent"):
-                                        with st.spinner("Importing documents to agent..."):
-                                            success_count = 0
-                                            for doc in selected_docs:
-                                                try:
-                                                    # Check if file exists
-                                                    if os.path.exists(doc['file_path']):
-                                                        # Upload file to the selected source
-                                                        upload_result = st.session_state.client.upload_file_to_source(
-                                                            selected_source_id, 
-                                                            doc['file_path']
-                                                        )
-                                                        
-                                                        if upload_result:
-                                                            success_count += 1
-                                                            
-                                                            # Log the action
-                                                            log_user_action(
-                                                                st.session_state.username,
-                                                                "import_case_document_to_agent",
-                                                                {
-                                                                    "case_id": st.session_state.active_case,
-                                                                    "filename": doc['name'],
-                                                                    "agent_id": selected_agent_id,
-                                                                    "source_id": selected_source_id
-                                                                }
-                                                            )
-                                                    else:
-                                                        st.error(f"File not found: {doc['name']}")
-                                                except Exception as e:
-                                                    st.error(f"Error importing {doc['name']}: {str(e)}")
-                                            
-                                            if success_count > 0:
-                                                st.success(f"Successfully imported {success_count} document(s) to the agent")
-                                            else:
-                                                st.error("No documents were successfully imported")
-                                else:
-                                    st.warning("No sources are attached to this agent. Please attach sources through the Letta Server UI.")
-                            else:
-                                st.error("No agents available.")
-                        except Exception as e:
-                            st.error(f"Error loading agents or sources: {str(e)}")
-                    
-                    # Case summary section
-                    st.divider()
-                    st.subheader("Case Summary")
-                    
-                    # Check if there are conversations in the case
-                    case_conversations = active_case.get("conversations", {})
-                    if not case_conversations:
-                        st.info("No conversations in this case yet. Add conversations before generating a summary.")
+                                    if st.session_state.active_case == case_id:
+                                        st.session_state.active_case = None
+                                        st.session_state.view_mode = "normal"
+                                    st.rerun()
                     else:
-                        # Select agent for summarization
-                        available_agents = []
-                        try:
-                            agents = st.session_state.client.list_agents()
-                            if agents:
-                                agent_options = {f"{agent.get('name', 'Unnamed Agent')} ({agent['id']})": agent['id'] for agent in agents}
-                                selected_summary_agent_name = st.selectbox("Select agent for summarization:", list(agent_options.keys()), key="summary_agent_select")
-                                selected_summary_agent_id = agent_options[selected_summary_agent_name]
-                                
-                                # Generate summary button
-                                if st.button("Generate Case Summary"):
-                                    with st.spinner("Generating case summary..."):
-                                        try:
-                                            # Compile all conversations into a single document
-                                            conversation_text = f"# Case Summary Request: {active_case['title']}\n\n"
-                                            
-                                            for conv_id, conv in case_conversations.items():
-                                                conversation_text += f"## Conversation: {conv.get('title', 'Untitled')}\n"
-                                                
-                                                # Include messages from this conversation
-                                                messages = conv.get('messages', [])
-                                                if messages:
-                                                    for i, msg in enumerate(messages):
-                                                        role = msg.get('role', 'unknown').upper()
-                                                        content = msg.get('content', 'No content')
-                                                        conversation_text += f"{role}: {content}\n\n"
-                                                else:
-                                                    conversation_text += "No messages in this conversation.\n\n"
-                                                
-                                                conversation_text += "---\n\n"
-                                            
-                                            # Add the summary request instruction at the end
-                                            conversation_text += "\nPlease provide a comprehensive summary of this legal case. Include key issues, arguments, legal principles discussed, and any conclusions or recommendations made throughout the conversations."
-                                            
-                                            # Send to the selected agent for summarization
-                                            summary_response = st.session_state.client.send_message(
-                                                selected_summary_agent_id,
-                                                conversation_text
-                                            )
-                                            
-                                            # Extract content from response
-                                            summary_content = ""
-                                            if isinstance(summary_response, dict) and "messages" in summary_response:
-                                                for msg in summary_response["messages"]:
-                                                    if msg.get("message_type") == "assistant_message":
-                                                        summary_content = msg.get("content", "")
-                                            
-                                            # Store the summary in the case data
-                                            if "summary" not in active_case:
-                                                active_case["summary"] = {}
-                                            
-                                            active_case["summary"]["content"] = summary_content
-                                            active_case["summary"]["generated_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                            active_case["summary"]["generated_by"] = selected_summary_agent_id
-                                            
-                                            # Save the updated case
-                                            save_cases(st.session_state.username, st.session_state.cases)
-                                            
-                                            # Log the action
-                                            log_user_action(
-                                                st.session_state.username,
-                                                "generate_case_summary",
-                                                {
-                                                    "case_id": st.session_state.active_case,
-                                                    "agent_id": selected_summary_agent_id
-                                                }
-                                            )
-                                            
-                                            st.success("Case summary generated successfully!")
-                                        except Exception as e:
-                                            st.error(f"Error generating summary: {str(e)}")
-                            else:
-                                st.error("No agents available for generating a summary.")
-                        except Exception as e:
-                            st.error(f"Error loading agents: {str(e)}")
-                        
-                        # Display existing summary if available
-                        if "summary" in active_case and "content" in active_case["summary"]:
-                            with st.expander("View Case Summary", expanded=True):
-                                st.markdown(active_case["summary"]["content"])
-                                st.caption(f"Generated at: {active_case['summary'].get('generated_at', 'Unknown')}")
-                                
-                                # Download summary option
-                                if st.button("Download Summary as Text"):
-                                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    summary_filename = f"{active_case['title']}_{timestamp}_summary.txt"
-                                    summary_content = active_case["summary"]["content"]
-                                    
-                                    # Create a download button for the text
-                                    st.download_button(
-                                        label="Download Summary",
-                                        data=summary_content,
-                                        file_name=summary_filename,
-                                        mime="text/plain"
-                                    )
-                    
-                    # Option to close/archive case (future enhancement)
-                    st.divider()
-                    if st.button("⬅️ Return to Case List"):
-                        st.session_state.active_case = None
-                        st.session_state.case_conversation = None
-                        st.session_state.view_mode = "normal"
-                        st.rerun()
+                        st.info("No cases yet. Create a new one!")
+                else:
+                    st.info("You don't have permission to manage cases.")
+
+            # Document Upload (shared between regular mode and case mode)
+            if has_permission("upload_documents"):
+                render_document_upload()
+
+        # Main chat interface
+        if has_permission("chat"):
+            # Switch between regular chat and case view modes
+            if st.session_state.view_mode == "normal":
+                render_conversation_pane()
+            
+            # Case view mode
+            elif st.session_state.view_mode == "case" and st.session_state.active_case:
+                active_case = st.session_state.cases[st.session_state.active_case]
+                
+                # Show case details
+                st.header(f"Case: {active_case['title']}")
+                st.write(f"Created: {active_case['created_at']}")
+                
+                # Case management tabs
+                case_tabs = st.tabs(["Conversations", "Agents", "Details", "Workflow"])
+                
+                # Conversations tab - manage conversations within this case
+                with case_tabs[0]:
+                    render_case_conversations(st.session_state.active_case)
+                
+                # Agents tab - manage agents for this case
+                with case_tabs[1]:
+                    render_case_agents(st.session_state.active_case)
+                
+                # Details tab - view and edit case details
+                with case_tabs[2]:
+                    render_case_details(st.session_state.active_case)
                         
                 # Workflow tab - manage case workflow
                 with case_tabs[3]:
-                    st.subheader("Case Workflow")
-                    
-                    # Check if the case already has a workflow
-                    if active_case.get("workflow") is None:
-                        # No workflow assigned yet, show workflow template selection
-                        st.write("No workflow assigned to this case yet.")
-                        
-                        # Get available workflow templates
-                        workflow_templates = get_workflow_templates()
-                        
-                        if workflow_templates:
-                            # Create select box for templates
-                            template_options = {template["name"]: template_id for template_id, template in workflow_templates.items()}
-                            selected_template_name = st.selectbox(
-                                "Select a workflow template:",
-                                list(template_options.keys())
-                            )
-                            selected_template_id = template_options[selected_template_name]
-                            
-                            # Display template description
-                            st.info(workflow_templates[selected_template_id]["description"])
-                            
-                            # Show stages in the selected template
-                            st.write("This workflow includes the following stages:")
-                            for i, stage in enumerate(workflow_templates[selected_template_id]["stages"]):
-                                st.write(f"{i+1}. **{stage['name']}**: {stage['description']}")
-                            
-                            # Button to assign the workflow
-                            if st.button("Assign Workflow to Case"):
-                                if assign_workflow_to_case(st.session_state.active_case, selected_template_id):
-                                    st.success(f"Assigned '{selected_template_name}' workflow to this case!")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to assign workflow. Please try again.")
-                        else:
-                            st.error("No workflow templates available.")
-                    else:
-                        # Workflow is already assigned, show workflow progress
-                        workflow = active_case["workflow"]
-                        st.write(f"**Current Workflow:** {workflow['name']}")
-                        st.write(workflow["description"])
-                        st.write(f"Assigned on: {workflow['assigned_at']}")
-                        
-                        # Create progress meter
-                        total_stages = len(workflow["stages"])
-                        completed_stages = sum(1 for stage in workflow["stages"] if stage["status"] == "completed")
-                        progress_percentage = int((completed_stages / total_stages) * 100) if total_stages > 0 else 0
-                        
-                        st.progress(progress_percentage / 100)
-                        st.write(f"Progress: {progress_percentage}% ({completed_stages}/{total_stages} stages completed)")
-                        
-                        # Show all stages with their status
-                        st.subheader("Workflow Stages")
-                        
-                        for i, stage in enumerate(workflow["stages"]):
-                            # Create an expander for each stage
-                            status_color = {
-                                "not_started": "gray",
-                                "in_progress": "blue",
-                                "completed": "green"
-                            }.get(stage["status"], "gray")
-                            
-                            status_emoji = {
-                                "not_started": "⚪",
-                                "in_progress": "🔵",
-                                "completed": "✅"
-                            }.get(stage["status"], "⚪")
-                            
-                            with st.expander(
-                                f"{status_emoji} Stage {i+1}: {stage['name']} - "
-                                f"**{stage['status'].replace('_', ' ').title()}**",
-                                expanded=(i == workflow["current_stage_index"])
-                            ):
-                                st.write(f"**Description:** {stage['description']}")
-                                
-                                # Show dates if available
-                                if stage["start_date"]:
-                                    st.write(f"**Started:** {stage['start_date']}")
-                                if stage["completion_date"]:
-                                    st.write(f"**Completed:** {stage['completion_date']}")
-                                
-                                # Stage notes
-                                stage_notes = st.text_area(
-                                    "Stage Notes",
-                                    value=stage["notes"],
-                                    key=f"notes_{i}",
-                                    height=100
-                                )
-                                
-                                if stage_notes != stage["notes"] and st.button("Save Notes", key=f"save_notes_{i}"):
-                                    if update_workflow_stage_notes(st.session_state.active_case, i, stage_notes):
-                                        st.success("Notes saved!")
-                                        st.rerun()
-                                
-                                # Status controls - only show relevant status change buttons
-                                status_col1, status_col2, status_col3 = st.columns(3)
-                                
-                                with status_col1:
-                                    if stage["status"] != "not_started" and i > 0:
-                                        if st.button("⬅️ Mark Not Started", key=f"not_started_{i}"):
-                                            if update_workflow_stage_status(st.session_state.active_case, i, "not_started"):
-                                                st.success(f"Updated stage status to Not Started")
-                                                st.rerun()
-                                
-                                with status_col2:
-                                    if stage["status"] != "in_progress":
-                                        if st.button("🔄 Mark In Progress", key=f"in_progress_{i}"):
-                                            if update_workflow_stage_status(st.session_state.active_case, i, "in_progress"):
-                                                st.success(f"Updated stage status to In Progress")
-                                                st.rerun()
-                                
-                                with status_col3:
-                                    if stage["status"] != "completed":
-                                        if st.button("✅ Mark Completed", key=f"completed_{i}"):
-                                            if update_workflow_stage_status(st.session_state.active_case, i, "completed"):
-                                                st.success(f"Updated stage status to Completed")
-                                                st.rerun()
+                    render_case_workflow(st.session_state.active_case)
             
             # Invalid state
             elif st.session_state.view_mode == "case" and not st.session_state.active_case:
@@ -2246,4 +3293,8 @@ else:
 
         # Footer
         st.markdown("---")
-        st.caption("LegalSphere - WTO and International Trade Law Assistant")
\ No newline at end of file
+        st.caption("LegalSphere - WTO and International Trade Law Assistant")
+
+# Finish timing this run and periodically publish metrics for Prometheus' textfile collector
+end_rerun(st.session_state)
+write_prometheus_textfile()
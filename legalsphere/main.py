@@ -4,76 +4,170 @@ import os
 import tempfile
 from typing import Dict, List, Optional
 import requests
-import json
 import time
-from langfuse.decorators import langfuse_context, observe
+from concurrent.futures import ThreadPoolExecutor
+from metrics import record_http_call
+from tracing import traced
+from provisioning import AgentProvisioner, is_pool_agent_name, load_config
+from resilience import DEFAULT_DEADLINE, DeadlineExceeded, get_breaker, resilient_request
+from singleflight import SingleFlight
 
+# Agent replies involve LLM calls and uploads are embedded server-side, so both get longer deadlines
+MESSAGE_DEADLINE = float(os.environ.get("LEGALSPHERE_LETTA_MESSAGE_TIMEOUT", "180"))
 
-langfuse_context.configure(
-# TODO: don't hardcode this
-  secret_key="sk-lf-6e835f07-2629-4f3d-a31a-8d1802dc19f3", 
-  public_key="pk-lf-2fe2b3cc-a75d-4744-9bc7-d50d1ac0f1c6",
-  host="https://us.cloud.langfuse.com"
-)
+# Concurrent identical GETs from all sessions in this process share one HTTP call
+_GET_FLIGHTS = SingleFlight("letta_get")
+
+# Paged agent listing: dropdowns and lookups only need these fields
+AGENT_PAGE_SIZE = int(os.environ.get("LEGALSPHERE_AGENT_PAGE_SIZE", "100"))
+AGENT_SUMMARY_FIELDS = ["id", "name"]
+_LOOKUP_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="letta-lookup")
+
+# Attached to every successful send_message trace
+ANSWER_SCORE = {
+    "name": "feedback-on-trace-from-nested-span",
+    "value": 1,
+    "comment": "This answer is legally sound"
+}
 
 class LettaClient:
     def __init__(self, base_url: str = None):
         self.base_url = base_url or os.environ.get("LETTA_API_URL", "http://localhost:8283")
+        self._provisioner = None
+
+    def _request(self, method: str, path: str, deadline: float = DEFAULT_DEADLINE,
+                 idempotent: Optional[bool] = None, **kwargs):
+        """Send a request to the Letta server with a deadline, retries and the circuit breaker,
+        recording each attempt's count and latency. Identical concurrent GETs share one request."""
+        url = f"{self.base_url}{path}"
+
+        def send():
+            return resilient_request(self._send, method, url, get_breaker(self.base_url),
+                                     deadline=deadline, idempotent=idempotent, **kwargs)
+
+        if method != "GET" or kwargs.get("stream"):
+            return send()
+        try:
+            # Followers only read the shared response; each caller parses its own copy with .json()
+            return _GET_FLIGHTS.do((url, repr(sorted(kwargs.items()))), send, timeout=deadline)
+        except TimeoutError:
+            raise DeadlineExceeded(f"GET {url} did not complete within {deadline:.0f}s")
+
+    def _send(self, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = requests.request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            record_http_call(method, status, time.perf_counter() - started)
         
     # Source Management functions
-    @observe()
+    @traced()
     def list_sources(self):
-        response = requests.get(f"{self.base_url}/v1/sources/")
+        response = self._request("GET", "/v1/sources/")
         response.raise_for_status()
         return response.json()
     
-    @observe()
+    @traced()
     def get_agent_sources(self, agent_id: str):
         """Get all sources attached to an agent"""
-        response = requests.get(f"{self.base_url}/v1/agents/{agent_id}/sources")
+        response = self._request("GET", f"/v1/agents/{agent_id}/sources")
         response.raise_for_status()
         return response.json()
 
-    @observe()
+    @traced()
     def upload_file_to_source(self, source_id: str, file_path: str):
         """Upload a file to an existing source"""
         filename = os.path.basename(file_path)
         with open(file_path, 'rb') as f:
             files = {'file': (filename, f)}
             # Note: source_id is included in the URL path, not as a form field
-            response = requests.post(
-                f"{self.base_url}/v1/sources/{source_id}/upload", 
-                files=files
+            response = self._request(
+                "POST",
+                f"/v1/sources/{source_id}/upload", 
+                files=files,
+                deadline=MESSAGE_DEADLINE
             )
         response.raise_for_status()
         return response.json()
     
-    @observe()
+    @traced()
     def attach_source_to_agent(self, agent_id: str, source_id: str):
-        response = requests.patch(
-            f"{self.base_url}/v1/agents/{agent_id}/sources/attach/{source_id}"
+        response = self._request(
+            "PATCH",
+            f"/v1/agents/{agent_id}/sources/attach/{source_id}"
         )
         response.raise_for_status()
         return response.json()
     
     # Agent functions
-    @observe()
-    def list_agents(self):
-        max_retries = 5
-        retry_delay = 2  # seconds
-
-        for attempt in range(max_retries):
+    @traced()
+    def list_agents(self, include_pooled: bool = False):
+        """List agents, leaving out unassigned agents held in the warm pool"""
+        response = self._request("GET", "/v1/agents/")
+        response.raise_for_status()
+        agents = response.json()
+        if include_pooled:
+            return agents
+        return [agent for agent in agents if not is_pool_agent_name(agent.get('name'))]
+    
+    @traced()
+    def list_agents_page(self, limit: int = AGENT_PAGE_SIZE, after: Optional[str] = None,
+                         fields: Optional[List[str]] = None):
+        """One page of agents after the agent id `after`, reduced to `fields` if given"""
+        params = {"limit": limit}
+        if after:
+            params["after"] = after
+        response = self._request("GET", "/v1/agents/", params=params)
+        response.raise_for_status()
+        agents = response.json()
+        if fields:
+            return [{field: agent.get(field) for field in fields} for agent in agents]
+        return agents
+    
+    def iter_agents(self, fields: Optional[List[str]] = AGENT_SUMMARY_FIELDS, page_size: int = AGENT_PAGE_SIZE,
+                    include_pooled: bool = False):
+        """Iterate over all agents one page at a time, leaving out pooled agents unless asked"""
+        if fields:
+            fields = list(dict.fromkeys(["id", "name", *fields]))  # Needed for paging and pool filtering
+        after = None
+        while True:
+            page = self.list_agents_page(page_size, after, fields=fields)
+            for agent in page:
+                if include_pooled or not is_pool_agent_name(agent.get('name')):
+                    yield agent
+            if len(page) < page_size:
+                return
+            after = page[-1]['id']
+    
+    def list_agent_summaries(self) -> List[dict]:
+        """Id and name of every agent, for dropdowns and name lookups"""
+        return list(self.iter_agents())
+    
+    @traced()
+    def get_agent(self, agent_id: str):
+        response = self._request("GET", f"/v1/agents/{agent_id}")
+        response.raise_for_status()
+        return response.json()
+    
+    @traced()
+    def get_agents(self, agent_ids: List[str]) -> Dict[str, dict]:
+        """Fetch several agents concurrently; ids that no longer exist are left out"""
+        def fetch(agent_id):
             try:
-                response = requests.get(f"{self.base_url}/v1/agents/")
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.ConnectionError:
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                else:
-                    raise
+                return self.get_agent(agent_id)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    return None
+                raise
+        
+        unique_ids = list(dict.fromkeys(agent_ids))
+        agents = list(_LOOKUP_EXECUTOR.map(fetch, unique_ids))
+        return {agent_id: agent for agent_id, agent in zip(unique_ids, agents) if agent is not None}
                     
-    @observe()
+    @traced(score=ANSWER_SCORE)
     def send_message(self, agent_id: str, message: str, stream: bool = False):
         payload = {
             "messages": [
@@ -86,76 +180,91 @@ class LettaClient:
         }
         
         try:
-            response = requests.post(
-                f"{self.base_url}/v1/agents/{agent_id}/messages",
-                json=payload
+            response = self._request(
+                "POST",
+                f"/v1/agents/{agent_id}/messages",
+                json=payload,
+                deadline=MESSAGE_DEADLINE
             )
             response.raise_for_status()
-            langfuse_context.score_current_trace(
-            name="feedback-on-trace-from-nested-span",
-            value=1,
-            comment="This answer is legally sound",
-            )
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Error sending message: {str(e)}")
             print(f"Response content: {e.response.content if hasattr(e, 'response') else 'No response content'}")
             raise
             
-    @observe()
-    def get_agent_messages(self, agent_id: str):
-        response = requests.get(f"{self.base_url}/v1/agents/{agent_id}/messages")
+    @traced()
+    def get_agent_messages(self, agent_id: str, after: Optional[str] = None, limit: Optional[int] = None,
+                           order: Optional[str] = None):
+        """Messages of an agent, optionally only those after the message id `after`"""
+        params = {key: value for key, value in {"after": after, "limit": limit, "order": order}.items()
+                  if value is not None}
+        response = self._request("GET", f"/v1/agents/{agent_id}/messages", params=params)
         response.raise_for_status()
         return response.json()
     
     # create agent
-    @observe()
+    @traced()
     def create_agent(self, name: str, block_value: str):
-        #load agent_config.json  
-        with open('config/agent_config.json', 'r') as f:
-            agent_config = json.load(f)
-        agent_config['name'] = name
-        response = requests.post(f"{self.base_url}/v1/agents/", json=agent_config)
-        response.raise_for_status()
-        agent_id = response.json()['id']
-        block_response = self._create_block(block_value)
-        block_id = block_response['id']
-        self._attach_block_to_agent(agent_id, block_id)
-        tool_id = "tool-191775ea-c529-40c0-80b7-68cd3ed346eb"
-        self.attach_tool(agent_id,tool_id)
+        """Create an agent with a persona block and the default tool attached"""
+        return self.provisioner.create_agent(name, block_value)
+    
+    @traced()
+    def create_agents(self, specs: List[dict]):
+        """Create several agents ({"name", "persona"} specs) concurrently, rolling back on failure"""
+        return self.provisioner.create_agents(specs)
+    
+    @property
+    def provisioner(self) -> AgentProvisioner:
+        if self._provisioner is None:
+            self._provisioner = AgentProvisioner(self)
+        return self._provisioner
+    
+    @traced()
+    def create_agent_record(self, agent_config: dict):
+        response = self._request("POST", "/v1/agents/", json=agent_config)
+        response.raise_for_status()
+        return response.json()
+    
+    @traced()
+    def create_block(self, block_config: dict):
+        response = self._request("POST", "/v1/blocks", json=block_config)
+        response.raise_for_status()
+        return response.json()
+    
+    @traced()
+    def delete_block(self, block_id: str):
+        response = self._request("DELETE", f"/v1/blocks/{block_id}")
+        response.raise_for_status()
         return response.json()
     
-    @observe()
-    def _create_block(self, block_value: str):
-        with open('config/block_config.json', 'r') as f:
-            block_config = json.load(f)
-        block_config['value'] = block_value
-        response = requests.post(f"{self.base_url}/v1/blocks", json=block_config)
+    @traced()
+    def attach_block_to_agent(self, agent_id: str, block_id: str):
+        response = self._request("PATCH", f"/v1/agents/{agent_id}/core-memory/blocks/attach/{block_id}")
         response.raise_for_status()
         return response.json()
     
-    @observe()
-    def _attach_block_to_agent(self, agent_id: str, block_id: str):
-        response = requests.patch(f"{self.base_url}/v1/agents/{agent_id}/core-memory/blocks/attach/{block_id}")
+    @traced()
+    def update_agent(self, agent_id: str, fields: dict):
+        response = self._request("PATCH", f"/v1/agents/{agent_id}", json=fields, idempotent=True)
         response.raise_for_status()
         return response.json()
     
-    @observe()
+    @traced()
     def delete_agent(self, agent_id: str):
-        response = requests.delete(f"{self.base_url}/v1/agents/{agent_id}")
+        response = self._request("DELETE", f"/v1/agents/{agent_id}")
         response.raise_for_status()
         return response.json()
     
-    @observe()
+    @traced()
     def attach_tool(self, agent_id: str, tool_id: str):
-        response = requests.patch(f"{self.base_url}/v1/agents/{agent_id}/tools/attach/{tool_id}")
+        response = self._request("PATCH", f"/v1/agents/{agent_id}/tools/attach/{tool_id}")
         response.raise_for_status()
         return response.json()
     
-    @observe()
+    @traced()
     def create_tool(self):
-        with open('config/tool_config.json', 'r') as f:
-            tool_config = json.load(f)
-        response = requests.post(f"{self.base_url}/v1/tools/", json=tool_config)
+        tool_config = load_config("tool_config.json")
+        response = self._request("POST", "/v1/tools/", json=tool_config)
         response.raise_for_status()
         return response.json()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import time
+import sqlite3
+from typing import Any, Dict, Iterable, Optional
+
+from state_store import StateStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_cursors (
+    agent_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    last_message_id TEXT,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (agent_id, conversation_id)
+);
+CREATE TABLE IF NOT EXISTS message_owners (
+    agent_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    PRIMARY KEY (agent_id, message_id)
+);
+"""
+
+
+class MessageStore:
+    """Letta message sync cursors per conversation, and which conversation each synced message belongs to"""
+
+    def __init__(self, state_store: StateStore):
+        self.state_store = state_store
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.state_store.connection()
+
+    def get_message_cursor(self, agent_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """{"last_message_id", "synced_at"} for a conversation, or None if it was never synced"""
+        row = self._connection().execute(
+            "SELECT last_message_id, synced_at FROM message_cursors WHERE agent_id = ? AND conversation_id = ?",
+            (agent_id, conversation_id)
+        ).fetchone()
+        return {"last_message_id": row[0], "synced_at": row[1]} if row else None
+
+    def set_message_cursor(self, agent_id: str, conversation_id: str, last_message_id: Optional[str]):
+        self._connection().execute(
+            "INSERT INTO message_cursors (agent_id, conversation_id, last_message_id, synced_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(agent_id, conversation_id) DO UPDATE SET "
+            "last_message_id = excluded.last_message_id, synced_at = excluded.synced_at",
+            (agent_id, conversation_id, last_message_id, time.time())
+        )
+
+    def claim_messages(self, agent_id: str, conversation_id: str, message_ids: Iterable[str]) -> bool:
+        """Assign Letta messages to a conversation, unless any of them already belongs to one"""
+        message_ids = list(dict.fromkeys(message_ids))
+        if not message_ids:
+            return False
+        placeholders = ",".join("?" for _ in message_ids)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            owned = conn.execute(
+                f"SELECT 1 FROM message_owners WHERE agent_id = ? AND message_id IN ({placeholders}) LIMIT 1",
+                [agent_id, *message_ids]
+            ).fetchone()
+            if not owned:
+                conn.executemany(
+                    "INSERT INTO message_owners (agent_id, message_id, conversation_id) VALUES (?, ?, ?)",
+                    [(agent_id, message_id, conversation_id) for message_id in message_ids]
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return not owned
@@ -0,0 +1,131 @@
+import os
+import time
+import datetime
+from typing import List, Optional
+
+import requests
+
+from message_store import MessageStore
+from metrics import REGISTRY, timed
+
+MESSAGE_SYNC_INTERVAL = float(os.environ.get("LEGALSPHERE_MESSAGE_SYNC_SECONDS", "10"))
+MESSAGE_SYNC_PAGE_SIZE = int(os.environ.get("LEGALSPHERE_MESSAGE_SYNC_PAGE_SIZE", "50"))
+
+
+def _text(content) -> str:
+    # Letta sends user content either as a string or as a list of content parts
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _timestamp(date: Optional[str]) -> str:
+    try:
+        moment = datetime.datetime.fromisoformat(date.replace("Z", "+00:00")).astimezone()
+    except (AttributeError, ValueError):
+        moment = datetime.datetime.now()
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def split_turns(messages: List[dict]) -> List[List[dict]]:
+    """Group Letta messages into turns, each starting at a user message"""
+    turns = []
+    for message in messages:
+        if message.get("message_type") == "user_message" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def to_local_messages(turn: List[dict]) -> List[dict]:
+    """Convert one Letta turn into LegalSphere messages, with reasoning kept in its own field"""
+    local, reasoning = [], []
+    for message in turn:
+        message_type = message.get("message_type")
+        if message_type == "user_message":
+            local.append({"role": "user", "content": _text(message.get("content")),
+                          "timestamp": _timestamp(message.get("date")), "letta_id": message.get("id")})
+        elif message_type == "reasoning_message":
+            reasoning.append(message.get("reasoning", ""))
+        elif message_type == "assistant_message":
+            local.append({"role": "assistant", "content": _text(message.get("content")),
+                          "reasoning": "\n\n".join(reasoning), "timestamp": _timestamp(message.get("date")),
+                          "letta_id": message.get("id")})
+            reasoning = []
+    return local
+
+
+class MessageSync:
+    """Pulls messages an agent produced outside LegalSphere into local conversations.
+
+    Each (agent, conversation) pair has a cursor in the state store: the id of
+    the last Letta message it has seen. A sync fetches only the messages after
+    the cursor, page by page. A conversation's first sync just places the
+    cursor at the agent's newest message, so existing history is never
+    downloaded. Turns sent from the UI are recorded as owned by their
+    conversation, and every other turn is claimed by the first conversation
+    that syncs it, so a turn lands in exactly one conversation even when
+    several conversations share an agent.
+    """
+
+    def __init__(self, client, state_store, interval: float = MESSAGE_SYNC_INTERVAL,
+                 page_size: int = MESSAGE_SYNC_PAGE_SIZE):
+        self.client = client
+        self.message_store = MessageStore(state_store)
+        self.interval = interval
+        self.page_size = page_size
+
+    @timed("message_sync")
+    def sync(self, agent_id: str, conversation_id: str, messages: List[dict], force: bool = False) -> int:
+        """Append new messages from the agent to `messages` and return how many were added.
+
+        Does nothing if this conversation was synced less than `interval` seconds ago, unless forced,
+        or if the agent no longer exists.
+        """
+        try:
+            return self._sync(agent_id, conversation_id, messages, force)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return 0
+            raise
+
+    def _sync(self, agent_id: str, conversation_id: str, messages: List[dict], force: bool) -> int:
+        cursor = self.message_store.get_message_cursor(agent_id, conversation_id)
+        if cursor is None:
+            latest = self.client.get_agent_messages(agent_id, limit=1, order="desc")
+            self.message_store.set_message_cursor(agent_id, conversation_id, latest[-1]["id"] if latest else None)
+            return 0
+        if not force and time.time() - cursor["synced_at"] < self.interval:
+            return 0
+
+        fetched, after = [], cursor["last_message_id"]
+        while True:
+            page = self.client.get_agent_messages(agent_id, after=after, limit=self.page_size, order="asc")
+            fetched.extend(page)
+            if len(page) < self.page_size:
+                break
+            after = page[-1]["id"]
+
+        turns = split_turns(fetched)
+        if turns and not any(message.get("message_type") == "assistant_message" for message in turns[-1]):
+            # The agent is still answering; leave the turn for the next sync so a UI send can claim it first
+            turns.pop()
+
+        added = 0
+        last_message_id = cursor["last_message_id"]
+        for turn in turns:
+            if self.message_store.claim_messages(agent_id, conversation_id, [message["id"] for message in turn]):
+                new_messages = to_local_messages(turn)
+                messages.extend(new_messages)
+                added += len(new_messages)
+            last_message_id = turn[-1]["id"]
+        self.message_store.set_message_cursor(agent_id, conversation_id, last_message_id)
+
+        REGISTRY.increment("messages_synced_total", added)
+        return added
+
+    def record_sent(self, agent_id: str, conversation_id: str, response: dict):
+        """Mark the messages of a reply sent from the UI as belonging to this conversation"""
+        message_ids = [message["id"] for message in (response or {}).get("messages", []) if message.get("id")]
+        if message_ids:
+            self.message_store.claim_messages(agent_id, conversation_id, message_ids)
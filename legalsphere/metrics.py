@@ -0,0 +1,214 @@
+import os
+import math
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+HISTOGRAM_WINDOW = 2048  # most recent samples kept per operation for percentiles
+PROMETHEUS_WRITE_INTERVAL = float(os.environ.get("LEGALSPHERE_METRICS_INTERVAL", "15"))
+DEFAULT_METRICS_DIR = os.environ.get("LEGALSPHERE_METRICS_DIR", "metrics")
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> LabelSet:
+    return tuple(sorted((labels or {}).items()))
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(len(sorted_values) - 1, max(0, rank - 1))]
+
+
+class Histogram:
+    """Running count/sum/max plus a sliding window of samples for p50/p95/p99"""
+
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+        }
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters, safe to update from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, labels: Optional[Dict[str, str]] = None):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def histograms(self) -> Dict[Tuple[str, LabelSet], Dict[str, float]]:
+        with self._lock:
+            return {key: histogram.snapshot() for key, histogram in self._histograms.items()}
+
+    def counters(self) -> Dict[Tuple[str, LabelSet], float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+# Timing helpers. All operations share one `operation_seconds` histogram, labelled by operation.
+@contextmanager
+def timer(operation: str, **labels):
+    """Record the duration (seconds) of the enclosed block under `operation`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe("operation_seconds", time.perf_counter() - started, {"operation": operation, **labels})
+
+
+def timed(operation: str, **labels):
+    """Decorator recording each call's duration (seconds) under `operation`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(operation, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_bytes(operation: str, store: str, num_bytes: int):
+    """Record the bytes read or written by one storage call (the summary's _sum is the running total)"""
+    REGISTRY.observe("storage_bytes", num_bytes, {"operation": operation, "store": store})
+
+
+# Per-rerun accounting. Streamlit runs each script execution on one thread, so the
+# current rerun is tracked thread-locally and HTTP calls made on that thread count towards it.
+_current = threading.local()
+RERUN_STATE_KEY = "_metrics_rerun"
+
+
+def record_http_call(method: str, status: str, duration: float):
+    """Record one outgoing HTTP call and attribute it to the current rerun"""
+    REGISTRY.increment("http_requests_total", 1, {"method": method, "status": status})
+    REGISTRY.observe("http_request_seconds", duration, {"method": method})
+    rerun = getattr(_current, "rerun", None)
+    if rerun is not None:
+        rerun["http_calls"] += 1
+
+
+def _finish_rerun(rerun: dict, finished: float):
+    REGISTRY.observe("rerun_seconds", finished - rerun["started"])
+    REGISTRY.observe("rerun_http_calls", rerun["http_calls"])
+
+
+def begin_rerun(session: MutableMapping):
+    """Start timing a script run. A run cut short by st.rerun() is closed when the next one begins"""
+    now = time.perf_counter()
+    pending = session.get(RERUN_STATE_KEY)
+    if pending:
+        _finish_rerun(pending, now)
+    rerun = {"started": now, "http_calls": 0}
+    session[RERUN_STATE_KEY] = rerun
+    _current.rerun = rerun
+
+
+def end_rerun(session: MutableMapping):
+    """Finish timing the current script run"""
+    rerun = session.get(RERUN_STATE_KEY)
+    if rerun:
+        session[RERUN_STATE_KEY] = None
+        _finish_rerun(rerun, time.perf_counter())
+    _current.rerun = None
+
+
+# Prometheus text exposition
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelSet, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in pairs) + "}"
+
+
+def render_prometheus(prefix: str = "legalsphere") -> str:
+    """All metrics in the Prometheus text format: histograms as summaries, counters as counters"""
+    lines = []
+    seen_types = set()
+    for (name, labels), stats in sorted(REGISTRY.histograms().items()):
+        metric = f"{prefix}_{name}"
+        if metric not in seen_types:
+            lines.append(f"# TYPE {metric} summary")
+            seen_types.add(metric)
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+            lines.append(f"{metric}{_format_labels(labels, (('quantile', quantile),))} {stats[key]:.6g}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {stats['sum']:.6g}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {stats['count']}")
+    for (name, labels), value in sorted(REGISTRY.counters().items()):
+        metric = f"{prefix}_{name}"
+        if metric not in seen_types:
+            lines.append(f"# TYPE {metric} counter")
+            seen_types.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value:.6g}")
+    return "\n".join(lines) + "\n"
+
+
+_last_textfile_write = 0.0
+_textfile_lock = threading.Lock()
+
+
+def write_prometheus_textfile(directory: str = DEFAULT_METRICS_DIR, force: bool = False) -> Optional[str]:
+    """Write this process's metrics for a node_exporter textfile collector, at most every
+    PROMETHEUS_WRITE_INTERVAL seconds. Each process writes its own file."""
+    global _last_textfile_write
+    with _textfile_lock:
+        now = time.monotonic()
+        if not force and now - _last_textfile_write < PROMETHEUS_WRITE_INTERVAL:
+            return None
+        _last_textfile_write = now
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"legalsphere_{os.getpid()}.prom")
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(temp_path, path)
+    return path
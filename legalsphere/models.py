@@ -0,0 +1,68 @@
+import sys
+from typing import Dict
+
+# Fields whose values repeat across a store: roles, agent ids and names, statuses, and the
+# stage names and descriptions copied from workflow templates into every case
+CONVERSATION_FIELDS = ("title", "agent_id", "mode")
+CASE_FIELDS = ("creator",)
+DOCUMENT_FIELDS = ("uploaded_by", "type")
+WORKFLOW_FIELDS = ("name", "description", "template_id")
+STAGE_FIELDS = ("name", "description", "status", "prompt")
+
+
+def _intern_fields(item, fields):
+    for field in fields:
+        value = item.get(field)
+        if type(value) is str:
+            item[field] = sys.intern(value)
+
+
+def intern_conversation(conversation: dict) -> dict:
+    """Share one copy of a conversation's repeated strings with every other loaded item, in place"""
+    _intern_fields(conversation, CONVERSATION_FIELDS)
+    intern = sys.intern
+    # Message fields checked inline: this runs for every message of every history loaded
+    for message in conversation.get("messages") or ():
+        role = message.get("role")
+        if type(role) is str:
+            message["role"] = intern(role)
+        if "agent_id" in message:
+            agent_id = message["agent_id"]
+            if type(agent_id) is str:
+                message["agent_id"] = intern(agent_id)
+            agent_name = message.get("agent_name")
+            if type(agent_name) is str:
+                message["agent_name"] = intern(agent_name)
+    return conversation
+
+
+def intern_case(case: dict) -> dict:
+    """Share one copy of a case's repeated strings with every other loaded item, in place"""
+    _intern_fields(case, CASE_FIELDS)
+    agents = case.get("agents")
+    if agents:
+        case["agents"] = [sys.intern(agent) if type(agent) is str else agent for agent in agents]
+    for conversation in (case.get("conversations") or {}).values():
+        intern_conversation(conversation)
+    for document in case.get("documents") or ():
+        _intern_fields(document, DOCUMENT_FIELDS)
+    workflow = case.get("workflow")
+    if workflow:
+        _intern_fields(workflow, WORKFLOW_FIELDS)
+        for stage in workflow.get("stages") or ():
+            _intern_fields(stage, STAGE_FIELDS)
+    return case
+
+
+def intern_conversations(conversations: Dict[str, dict]) -> Dict[str, dict]:
+    """A loaded conversation store with its repeated strings interned (see intern_conversation)"""
+    for conversation in conversations.values():
+        intern_conversation(conversation)
+    return conversations
+
+
+def intern_cases(cases: Dict[str, dict]) -> Dict[str, dict]:
+    """A loaded case store with its repeated strings interned (see intern_case)"""
+    for case in cases.values():
+        intern_case(case)
+    return cases
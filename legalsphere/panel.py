@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metrics import REGISTRY, timed, timer
+
+PANEL_WORKERS = int(os.environ.get("LEGALSPHERE_PANEL_WORKERS", "16"))
+
+AGGREGATION_PROMPT = """Several specialists on this case were asked the same question.
+
+# Question
+{prompt}
+
+# Answers
+{answers}
+
+Combine these answers into one response for the user. Say where the specialists agree, set out any
+disagreements and which view is better supported, and end with a clear recommendation."""
+
+# Shared by all sessions, so a burst of panel questions cannot start unbounded threads
+_executor = ThreadPoolExecutor(max_workers=PANEL_WORKERS, thread_name_prefix="panel")
+
+
+def extract_reply(response) -> Dict[str, str]:
+    """Content and reasoning of a Letta send_message response"""
+    content, reasoning = "", ""
+    if isinstance(response, dict) and "messages" in response:
+        for msg in response["messages"]:
+            if msg.get("message_type") == "reasoning_message":
+                reasoning = msg.get("reasoning", "")
+            elif msg.get("message_type") == "assistant_message":
+                content = msg.get("content", "")
+    return {"content": content, "reasoning": reasoning}
+
+
+class PanelConsultation:
+    """Asks several agents the same question at once.
+
+    Every agent is sent the prompt concurrently and answers are yielded in the
+    order they arrive, so the whole panel takes about as long as its slowest
+    agent. An optional aggregation pass asks one agent to combine the answers.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _ask_one(self, agent_id: str, prompt: str) -> dict:
+        response = self.client.send_message(agent_id, prompt)
+        return {**extract_reply(response), "response": response}
+
+    def ask(self, agent_ids: List[str], prompt: str) -> Iterator[Tuple[str, Optional[dict], Optional[Exception]]]:
+        """Yield (agent_id, reply, error) for each agent as soon as its answer arrives"""
+        with timer("panel_consultation"):
+            futures = {_executor.submit(self._ask_one, agent_id, prompt): agent_id for agent_id in agent_ids}
+            for future in as_completed(futures):
+                agent_id = futures[future]
+                error = future.exception()
+                REGISTRY.increment("panel_answers_total", 1, {"result": "error" if error else "ok"})
+                yield agent_id, (None if error else future.result()), error
+
+    def ask_all(self, agent_ids: List[str], prompt: str) -> Dict[str, Tuple[Optional[dict], Optional[Exception]]]:
+        """Wait for the whole panel; {agent_id: (reply, error)}"""
+        return {agent_id: (reply, error) for agent_id, reply, error in self.ask(agent_ids, prompt)}
+
+    @timed("panel_aggregation")
+    def aggregate(self, agent_id: str, prompt: str, answers: Dict[str, str]) -> dict:
+        """Ask `agent_id` to combine the panel's answers, given as {agent name: answer}"""
+        text = "\n\n".join(f"## {name}\n{answer}" for name, answer in answers.items())
+        return self._ask_one(agent_id, AGGREGATION_PROMPT.format(prompt=prompt, answers=text))
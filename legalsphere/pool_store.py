@@ -0,0 +1,79 @@
+import time
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+from state_store import StateStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agent_pool (
+    agent_id TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_agent_pool_template ON agent_pool (template, created_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class PoolStore:
+    """Pre-provisioned agents available to every process, and the leases that keep one process refilling them"""
+
+    def __init__(self, state_store: StateStore):
+        self.state_store = state_store
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.state_store.connection()
+
+    def add_pool_agents(self, template: str, agent_ids: Iterable[str]):
+        """Make pre-provisioned agents available to every process"""
+        now = time.time()
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO agent_pool (agent_id, template, created_at) VALUES (?, ?, ?)",
+            [(agent_id, template, now) for agent_id in agent_ids]
+        )
+
+    def claim_pool_agent(self, template: str) -> Optional[str]:
+        """Atomically take the oldest pooled agent of a template, or None if the pool is empty"""
+        row = self._connection().execute(
+            "DELETE FROM agent_pool WHERE agent_id = ("
+            "SELECT agent_id FROM agent_pool WHERE template = ? ORDER BY created_at LIMIT 1"
+            ") RETURNING agent_id",
+            (template,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def claim_surplus_pool_agents(self, template: str, keep: int, idle_before: float) -> List[str]:
+        """Take the pooled agents beyond the newest `keep` that have been idle since before `idle_before`"""
+        rows = self._connection().execute(
+            "DELETE FROM agent_pool WHERE agent_id IN ("
+            "SELECT agent_id FROM agent_pool WHERE template = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?"
+            ") AND created_at < ? RETURNING agent_id",
+            (template, keep, idle_before)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    # Cross-process leases
+    def acquire_lease(self, name: str, holder: str, seconds: float) -> bool:
+        """Take or extend the named lease for `seconds`; False if another holder's lease has not expired"""
+        now = time.time()
+        row = self._connection().execute(
+            "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at < ? RETURNING name",
+            (name, holder, now + seconds, now)
+        ).fetchone()
+        return row is not None
+
+    def release_lease(self, name: str, holder: str):
+        self._connection().execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def get_pool_counts(self) -> Dict[str, int]:
+        """Number of pooled agents per template"""
+        return dict(self._connection().execute(
+            "SELECT template, COUNT(*) FROM agent_pool GROUP BY template"
+        ).fetchall())
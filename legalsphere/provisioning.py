@@ -0,0 +1,163 @@
+import os
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY, timed
+from storage import decode_json
+
+CONFIG_DIR = "config"
+DEFAULT_TOOL_ID = "tool-191775ea-c529-40c0-80b7-68cd3ed346eb"  # Google search tool attached to every new agent
+PROVISION_WORKERS = int(os.environ.get("LEGALSPHERE_PROVISION_WORKERS", "16"))
+POOL_AGENT_PREFIX = "legalsphere-pool-"  # Name of agents waiting unassigned in the warm pool (see agent_pool.py)
+
+
+class ProvisioningError(Exception):
+    """Raised when agent provisioning failed; everything created for the batch has been rolled back"""
+
+    def __init__(self, message: str, failures: List[str]):
+        super().__init__(message)
+        self.failures = failures
+
+
+def is_pool_agent_name(name: Optional[str]) -> bool:
+    return bool(name) and name.startswith(POOL_AGENT_PREFIX)
+
+
+# Parsed config files, reloaded only when the file changes on disk
+_config_cache: Dict[str, tuple] = {}
+_config_lock = threading.Lock()
+
+
+def load_config(filename: str) -> dict:
+    """Return a private copy of a parsed JSON file from the config directory"""
+    path = os.path.join(CONFIG_DIR, filename)
+    mtime = os.stat(path).st_mtime_ns
+    with _config_lock:
+        cached = _config_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = _config_cache[path] = (mtime, decode_json(f.read()))
+    return copy.deepcopy(cached[1])
+
+
+# Shared by all sessions, so a burst of provisioning cannot start unbounded threads
+_executor = ThreadPoolExecutor(max_workers=PROVISION_WORKERS, thread_name_prefix="provision")
+
+
+def _run_all(calls):
+    """Run (function, args) pairs concurrently and return (results, errors) in call order"""
+    futures = [_executor.submit(function, *args) for function, args in calls]
+    wait(futures)
+    results, errors = [], []
+    for future in futures:
+        error = future.exception()
+        results.append(None if error else future.result())
+        errors.append(error)
+    return results, errors
+
+
+class AgentProvisioner:
+    """Creates agents with their persona block and default tool attached.
+
+    The agent and its block are created concurrently, then the block and tool
+    are attached concurrently, and every agent of a batch goes through these two
+    steps together: a batch costs two round-trips of latency however many agents
+    it holds. If any step fails, the agents and blocks already created for the
+    batch are deleted before ProvisioningError is raised.
+    """
+
+    def __init__(self, client, tool_id: str = DEFAULT_TOOL_ID):
+        self.client = client
+        self.tool_id = tool_id
+
+    def _create_agent_record(self, name: str, config_file: str = "agent_config.json") -> dict:
+        agent_config = load_config(config_file)
+        agent_config['name'] = name
+        return self.client.create_agent_record(agent_config)
+
+    def _create_block(self, block_value: str) -> dict:
+        block_config = load_config("block_config.json")
+        block_config['value'] = block_value or ""
+        return self.client.create_block(block_config)
+
+    @timed("provision_agents")
+    def create_agents(self, specs: List[dict]) -> List[dict]:
+        """Create one agent per {"name", "persona"[, "config"]} spec, all or nothing"""
+        if not specs:
+            return []
+
+        # Step 1: every agent and its persona block
+        calls = []
+        for spec in specs:
+            calls.append((self._create_agent_record, (spec["name"], spec.get("config", "agent_config.json"))))
+            calls.append((self._create_block, (spec.get("persona", ""),)))
+        results, errors = _run_all(calls)
+        agents, blocks = results[0::2], results[1::2]
+        self._check(specs, errors, agents, blocks, "create")
+
+        # Step 2: attach each block and the default tool
+        calls = []
+        for agent, block in zip(agents, blocks):
+            calls.append((self.client.attach_block_to_agent, (agent['id'], block['id'])))
+            calls.append((self.client.attach_tool, (agent['id'], self.tool_id)))
+        _, errors = _run_all(calls)
+        self._check(specs, errors, agents, blocks, "attach")
+
+        REGISTRY.increment("agents_provisioned_total", len(agents))
+        return agents
+
+    def create_agents_from_template(self, name_template: str, persona_template: str,
+                                    values: List[Dict[str, str]]) -> List[dict]:
+        """Create a team of agents from one persona template, e.g. one agent per specialism"""
+        return self.create_agents([
+            {"name": name_template.format(**item), "persona": persona_template.format(**item)}
+            for item in values
+        ])
+
+    def create_agent(self, name: str, block_value: str, config_file: str = "agent_config.json") -> dict:
+        return self.create_agents([{"name": name, "persona": block_value, "config": config_file}])[0]
+
+    @timed("provision_pool_agents")
+    def create_pool_agents(self, names: List[str], config_file: str = "agent_config.json") -> List[dict]:
+        """Create agents with the default tool but no persona block, to be assigned later"""
+        specs = [{"name": name} for name in names]
+        agents, errors = _run_all([(self._create_agent_record, (name, config_file)) for name in names])
+        self._check(specs, errors, agents, [], "create", calls_per_agent=1)
+        _, errors = _run_all([(self.client.attach_tool, (agent['id'], self.tool_id)) for agent in agents])
+        self._check(specs, errors, agents, [], "attach", calls_per_agent=1)
+        return agents
+
+    @timed("assign_pool_agent")
+    def assign_agent(self, agent_id: str, name: str, block_value: str) -> dict:
+        """Rename a pre-provisioned agent and attach its persona block, deleting the block on failure"""
+        specs = [{"name": name}]
+        (agent, block), errors = _run_all([
+            (self.client.update_agent, (agent_id, {"name": name})),
+            (self._create_block, (block_value,))
+        ])
+        self._check(specs, errors, [], [block], "assign")
+        _, errors = _run_all([(self.client.attach_block_to_agent, (agent_id, block['id']))])
+        self._check(specs, errors, [], [block], "assign")
+        return agent
+
+    def _check(self, specs, errors, agents, blocks, step, calls_per_agent=2):
+        failures = [
+            f"{specs[index // calls_per_agent]['name']}: {error}"
+            for index, error in enumerate(errors) if error is not None
+        ]
+        if failures:
+            self.rollback(agents, blocks)
+            REGISTRY.increment("agent_provisioning_failures_total", 1, {"step": step})
+            raise ProvisioningError(f"Failed to provision {len(failures)} of {len(specs)} agents: "
+                                    f"{'; '.join(failures)}", failures)
+
+    def rollback(self, agents: List[Optional[dict]], blocks: List[Optional[dict]]):
+        """Delete whatever was created for a failed batch, best effort"""
+        calls = [(self.client.delete_agent, (agent['id'],)) for agent in agents if agent]
+        calls += [(self.client.delete_block, (block['id'],)) for block in blocks if block]
+        _, errors = _run_all(calls)
+        for error in errors:
+            if error is not None:
+                print(f"Error rolling back agent provisioning: {str(error)}")
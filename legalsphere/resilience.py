@@ -0,0 +1,191 @@
+import os
+import time
+import random
+import threading
+import email.utils
+from typing import Dict, Optional
+
+import requests
+
+from metrics import REGISTRY
+
+DEFAULT_DEADLINE = float(os.environ.get("LEGALSPHERE_LETTA_TIMEOUT", "30"))  # seconds for a whole call, retries included
+CONNECT_TIMEOUT = float(os.environ.get("LEGALSPHERE_LETTA_CONNECT_TIMEOUT", "5"))
+MAX_ATTEMPTS = int(os.environ.get("LEGALSPHERE_LETTA_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = 0.25  # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_MAX = 8.0
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LEGALSPHERE_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("LEGALSPHERE_BREAKER_RESET_SECONDS", "30"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_AFTER_STATUSES = {429, 503}  # The server asks us to come back later; safe to retry any method
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without contacting the server while its circuit breaker is open"""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when a call and its retries did not finish within the call's deadline"""
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated server failures, then lets one probe through.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected for `reset_seconds`. The first call after that is a probe: its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None  # Start of the current outage
+        self._retry_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._probing or time.monotonic() >= self._retry_at else "open"
+
+    def seconds_until_retry(self) -> float:
+        with self._lock:
+            return max(0.0, self._retry_at - time.monotonic()) if self._opened_at is not None else 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() < self._retry_at:
+                REGISTRY.increment("circuit_rejections_total", 1, {"circuit": self.name})
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                REGISTRY.observe("circuit_open_seconds", time.monotonic() - self._opened_at, {"circuit": self.name})
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    self._opened_at = time.monotonic()
+                    REGISTRY.increment("circuit_opened_total", 1, {"circuit": self.name})
+                self._retry_at = time.monotonic() + self.reset_seconds
+                self._probing = False
+
+
+# One breaker per Letta server, shared by every session's client in the process
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (0-based)"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _rewind_files(kwargs):
+    # Uploaded file objects were consumed by the failed attempt
+    for _, file_info in (kwargs.get("files") or {}).items():
+        handle = file_info[1] if isinstance(file_info, tuple) else file_info
+        if hasattr(handle, "seek"):
+            handle.seek(0)
+
+
+def resilient_request(send, method: str, url: str, breaker: CircuitBreaker,
+                      deadline: float = DEFAULT_DEADLINE, idempotent: Optional[bool] = None,
+                      max_attempts: int = MAX_ATTEMPTS, **kwargs) -> requests.Response:
+    """Send a request with a deadline, retries and the server's circuit breaker.
+
+    `send(method, url, **kwargs)` performs one attempt. Idempotent calls are
+    retried with jittered exponential backoff on connection errors, timeouts and
+    502/503/504; any call is retried on 429/503 when the server sends
+    Retry-After. No attempt or wait runs past the deadline. Responses are
+    returned as-is (callers still raise_for_status).
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        # Checked before allow(), which may hand this call the half-open probe
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{method} {url} did not complete within {deadline:.0f}s")
+        if not breaker.allow():
+            raise CircuitOpenError(f"Letta server unavailable (circuit open, retrying in "
+                                   f"{breaker.seconds_until_retry():.0f}s)")
+
+        response, error, retry_after = None, None, None
+        try:
+            response = send(method, url, timeout=(min(CONNECT_TIMEOUT, remaining), remaining), **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure()
+            error = e
+        except BaseException:
+            # Any other error still settles the attempt, so a probe never leaves the circuit stuck half-open
+            breaker.record_failure()
+            raise
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if response.status_code not in RETRYABLE_STATUSES:
+                return response
+            if response.status_code in RETRY_AFTER_STATUSES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+        attempt += 1
+        retryable = idempotent or retry_after is not None
+        if not retryable or attempt >= max_attempts:
+            break
+        delay = retry_after if retry_after is not None else backoff_delay(attempt - 1)
+        if time.monotonic() + delay >= expires:
+            break
+        REGISTRY.increment("http_retries_total", 1, {
+            "method": method, "reason": type(error).__name__ if error else str(response.status_code)
+        })
+        time.sleep(delay)
+        _rewind_files(kwargs)
+
+    if error is not None:
+        raise error
+    return response
@@ -0,0 +1,157 @@
+import math
+import datetime
+import sqlite3
+from typing import Any, Dict, Iterable, List, Tuple
+
+from state_store import StateStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_transitions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_id TEXT NOT NULL,
+    workflow_name TEXT NOT NULL,
+    stage_name TEXT NOT NULL,
+    from_status TEXT,
+    to_status TEXT NOT NULL,
+    actor TEXT,
+    owner TEXT,
+    occurred_at REAL NOT NULL,
+    seconds_in_stage REAL
+);
+CREATE INDEX IF NOT EXISTS idx_stage_transitions_occurred_at ON stage_transitions (occurred_at);
+CREATE INDEX IF NOT EXISTS idx_stage_transitions_case_id ON stage_transitions (case_id);
+CREATE TABLE IF NOT EXISTS stage_duration_rollups (
+    workflow_name TEXT NOT NULL,
+    stage_name TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    completions INTEGER NOT NULL,
+    total_seconds REAL NOT NULL,
+    PRIMARY KEY (workflow_name, stage_name, bucket)
+);
+CREATE TABLE IF NOT EXISTS advisor_throughput (
+    owner TEXT NOT NULL,
+    day TEXT NOT NULL,
+    completions INTEGER NOT NULL,
+    total_seconds REAL NOT NULL,
+    PRIMARY KEY (owner, day)
+);
+"""
+
+STAGE_TRANSITION_COLUMNS = ("case_id", "workflow_name", "stage_name", "from_status", "to_status", "actor", "owner",
+                            "occurred_at", "seconds_in_stage")
+DURATION_BUCKETS_PER_DOUBLING = 4  # Stage duration histogram resolution: bucket bounds grow by 2 ** (1/4), ~19%
+
+
+def duration_bucket(seconds: float) -> int:
+    """Histogram bucket of a stage duration; bucket b holds durations up to 2 ** ((b + 1) / 4) seconds"""
+    return math.floor(math.log2(max(seconds, 1.0)) * DURATION_BUCKETS_PER_DOUBLING)
+
+
+def bucket_upper_bound(bucket: int) -> float:
+    return 2 ** ((bucket + 1) / DURATION_BUCKETS_PER_DOUBLING)
+
+
+class StageAnalytics:
+    """Workflow stage transitions, with duration and advisor throughput rollups maintained as they are recorded"""
+
+    def __init__(self, state_store: StateStore):
+        self.state_store = state_store
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.state_store.connection()
+
+    def _insert_stage_transitions(self, conn: sqlite3.Connection, transitions: List[Dict[str, Any]]):
+        columns = ", ".join(STAGE_TRANSITION_COLUMNS)
+        placeholders = ", ".join("?" for _ in STAGE_TRANSITION_COLUMNS)
+        conn.executemany(
+            f"INSERT INTO stage_transitions ({columns}) VALUES ({placeholders})",
+            [tuple(transition.get(column) for column in STAGE_TRANSITION_COLUMNS) for transition in transitions]
+        )
+        # Completed stages with a known duration feed the rollups, so reading them never scans the events
+        completions = [transition for transition in transitions
+                       if transition["to_status"] == "completed" and transition.get("seconds_in_stage") is not None]
+        conn.executemany(
+            "INSERT INTO stage_duration_rollups (workflow_name, stage_name, bucket, completions, total_seconds) "
+            "VALUES (?, ?, ?, 1, ?) ON CONFLICT(workflow_name, stage_name, bucket) DO UPDATE SET "
+            "completions = completions + 1, total_seconds = total_seconds + excluded.total_seconds",
+            [(transition["workflow_name"], transition["stage_name"], duration_bucket(transition["seconds_in_stage"]),
+              transition["seconds_in_stage"]) for transition in completions]
+        )
+        conn.executemany(
+            "INSERT INTO advisor_throughput (owner, day, completions, total_seconds) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(owner, day) DO UPDATE SET "
+            "completions = completions + 1, total_seconds = total_seconds + excluded.total_seconds",
+            [(transition.get("owner") or "", datetime.date.fromtimestamp(transition["occurred_at"]).isoformat(),
+              transition["seconds_in_stage"]) for transition in completions]
+        )
+
+    def record_stage_transitions(self, transitions: Iterable[Dict[str, Any]]):
+        """Append stage status changes and fold completed stages into the duration and throughput rollups"""
+        transitions = list(transitions)
+        if not transitions:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert_stage_transitions(conn, transitions)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def import_stage_transitions(self, transitions: Iterable[Dict[str, Any]]) -> int:
+        """One-time backfill of stage transitions, skipped once any transitions exist"""
+        transitions = list(transitions)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM stage_transitions LIMIT 1").fetchone():
+                conn.execute("COMMIT")
+                return 0
+            self._insert_stage_transitions(conn, transitions)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(transitions)
+
+    def get_stage_duration_stats(self) -> List[Dict[str, Any]]:
+        """Completions, mean and p90 time per workflow stage; p90 is the upper bound of its histogram bucket"""
+        rows = self._connection().execute(
+            "SELECT workflow_name, stage_name, bucket, completions, total_seconds FROM stage_duration_rollups "
+            "ORDER BY workflow_name, stage_name, bucket"
+        ).fetchall()
+        histograms: Dict[Tuple[str, str], List[Tuple[int, int, float]]] = {}
+        for workflow, stage, bucket, completions, total_seconds in rows:
+            histograms.setdefault((workflow, stage), []).append((bucket, completions, total_seconds))
+        stats = []
+        for (workflow, stage), buckets in histograms.items():
+            completions = sum(count for _, count, _ in buckets)
+            total_seconds = sum(seconds for _, _, seconds in buckets)
+            rank, seen, p90_bucket = math.ceil(0.9 * completions), 0, buckets[-1][0]
+            for bucket, count, _ in buckets:
+                seen += count
+                if seen >= rank:
+                    p90_bucket = bucket
+                    break
+            stats.append({"workflow": workflow, "stage": stage, "completions": completions,
+                          "mean_seconds": total_seconds / completions, "p90_seconds": bucket_upper_bound(p90_bucket)})
+        return stats
+
+    def get_advisor_throughput(self, since: float) -> List[Dict[str, Any]]:
+        """Stages completed per case owner since `since`, with their mean time in stage, busiest first"""
+        rows = self._connection().execute(
+            "SELECT owner, SUM(completions), SUM(total_seconds) / SUM(completions) FROM advisor_throughput "
+            "WHERE day >= ? GROUP BY owner ORDER BY SUM(completions) DESC, owner",
+            (datetime.date.fromtimestamp(since).isoformat(),)
+        ).fetchall()
+        return [{"owner": owner, "completions": completions, "mean_seconds": mean_seconds}
+                for owner, completions, mean_seconds in rows]
+
+    def get_daily_stage_completions(self, since: float) -> Dict[str, int]:
+        """Stages completed per day ("YYYY-MM-DD") since `since`"""
+        return dict(self._connection().execute(
+            "SELECT day, SUM(completions) FROM advisor_throughput WHERE day >= ? GROUP BY day ORDER BY day",
+            (datetime.date.fromtimestamp(since).isoformat(),)
+        ).fetchall())
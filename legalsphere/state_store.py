@@ -0,0 +1,211 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from storage import decode_json, encode_json
+
+DEFAULT_STATE_DB = os.environ.get("LEGALSPHERE_STATE_DB", os.path.join("state", "legalsphere.db"))
+
+
+def json_text(value: Any) -> str:
+    # JSON columns are TEXT, so store the encoded bytes as a string
+    return encode_json(value).decode("utf-8")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS audit_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    username TEXT,
+    role TEXT,
+    action TEXT,
+    details TEXT,
+    ip_address TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_events_timestamp ON audit_events (timestamp);
+CREATE INDEX IF NOT EXISTS idx_audit_events_action ON audit_events (action);
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+"""
+
+
+class StateStore:
+    """Shared SQLite state for every LegalSphere process on a host.
+
+    Holds change-version counters for the JSON stores (so each process can tell
+    which files changed since it last loaded them), the audit event log and a
+    TTL cache that all processes can read. Subsystems keep their own tables in
+    the same database through connection() (see case_feed, pool_store,
+    message_store, workflow_store and stage_analytics).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_STATE_DB, busy_timeout: float = 10.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread, since Streamlit runs each session's script in its own thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Change-version counters
+    def bump_version(self, name: str) -> int:
+        """Increment and return the change version of a store"""
+        conn = self.connection()
+        row = conn.execute(
+            "INSERT INTO versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1 RETURNING version",
+            (name,)
+        ).fetchone()
+        return row[0]
+
+    def get_versions(self, names: Iterable[str]) -> Dict[str, int]:
+        """Current change version of each store, 0 for stores never written through the store layer"""
+        names = list(names)
+        if not names:
+            return {}
+        placeholders = ",".join("?" for _ in names)
+        rows = self.connection().execute(
+            f"SELECT name, version FROM versions WHERE name IN ({placeholders})", names
+        ).fetchall()
+        versions = {name: 0 for name in names}
+        versions.update(dict(rows))
+        return versions
+
+    # Audit events
+    def append_audit_event(self, entry: Dict[str, Any]):
+        """Append one audit log entry"""
+        conn = self.connection()
+        conn.execute(
+            "INSERT INTO audit_events (timestamp, username, role, action, details, ip_address) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (entry["timestamp"], entry.get("username"), entry.get("role"), entry.get("action"),
+             json_text(entry.get("details", {})), entry.get("ip_address"))
+        )
+        self.bump_version("audit_events")
+
+    def append_audit_events(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Append many audit log entries in one transaction and return how many were written"""
+        rows = [
+            (entry["timestamp"], entry.get("username"), entry.get("role"), entry.get("action"),
+             json_text(entry.get("details", {})), entry.get("ip_address"))
+            for entry in entries
+        ]
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO audit_events (timestamp, username, role, action, details, ip_address) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.bump_version("audit_events")
+        return len(rows)
+
+    def get_audit_events(self, username_contains: Optional[str] = None, action: Optional[str] = None,
+                         date_prefix: Optional[str] = None, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Audit log entries in insertion order, with their ids, filtered in SQL rather than in Python"""
+        clauses, params = [], []
+        if username_contains:
+            clauses.append("username LIKE ?")
+            params.append(f"%{username_contains}%")
+        if action:
+            clauses.append("action = ?")
+            params.append(action)
+        if date_prefix:
+            clauses.append("timestamp LIKE ?")
+            params.append(f"{date_prefix}%")
+        if since:
+            clauses.append("timestamp > ?")
+            params.append(since)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connection().execute(
+            "SELECT id, timestamp, username, role, action, details, ip_address FROM audit_events"
+            f"{where} ORDER BY id", params
+        ).fetchall()
+        return [
+            {
+                "id": entry_id,
+                "timestamp": timestamp,
+                "username": username,
+                "role": role,
+                "action": action,
+                "details": decode_json(details) if details else {},
+                "ip_address": ip_address
+            }
+            for entry_id, timestamp, username, role, action, details, ip_address in rows
+        ]
+
+    def import_audit_log(self, log_path: str) -> int:
+        """One-time migration of a legacy JSON audit log, skipped once any events exist"""
+        if not os.path.exists(log_path):
+            return 0
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM audit_events LIMIT 1").fetchone():
+                conn.execute("COMMIT")
+                return 0
+            with open(log_path, 'rb') as f:
+                entries = decode_json(f.read())
+            conn.executemany(
+                "INSERT INTO audit_events (timestamp, username, role, action, details, ip_address) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (entry.get("timestamp", ""), entry.get("username"), entry.get("role"), entry.get("action"),
+                     json_text(entry.get("details", {})), entry.get("ip_address"))
+                    for entry in entries
+                ]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.bump_version("audit_events")
+        return len(entries)
+
+    # Shared cache
+    def cache_get(self, key: str) -> Any:
+        """Cached value for `key`, or None if missing or expired"""
+        row = self.connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return decode_json(row[0])
+
+    def cache_set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON-serializable value for all processes, expiring after `ttl` seconds if given"""
+        expires_at = time.time() + ttl if ttl is not None else None
+        self.connection().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, json_text(value), expires_at)
+        )
+
+    def cache_delete(self, key: str):
+        self.connection().execute("DELETE FROM cache WHERE key = ?", (key,))
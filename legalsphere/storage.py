@@ -0,0 +1,274 @@
+import os
+import gzip
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from metrics import record_bytes, timer
+
+try:
+    import fcntl
+except ImportError:  # Advisory locks are unavailable on Windows; writes stay atomic but unserialized
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # The stdlib codec writes the same JSON, only slower
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Without msgpack every store is written as JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # Compressed files fall back to gzip, and snapshots are disabled
+    zstandard = None
+
+DEFAULT_LOCK_TIMEOUT = float(os.environ.get("LEGALSPHERE_LOCK_TIMEOUT", "10"))
+LOCK_POLL_INTERVAL = 0.01  # seconds between non-blocking lock attempts
+# Stores whose msgpack encoding reaches this size are written as zstd-compressed msgpack snapshots; 0 disables
+SNAPSHOT_MIN_KB = int(os.environ.get("LEGALSPHERE_SNAPSHOT_MIN_KB", "0"))
+SNAPSHOT_LEVEL = 3
+SNAPSHOT_MAGIC = b"\x28\xb5\x2f\xfd"  # zstd frame header; JSON never starts with these bytes
+GZIP_MAGIC = b"\x1f\x8b"
+COMPRESSED_STORE_LABEL = "archive"  # Compressed files are one per item, so they share one metrics label
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a store's lock could not be acquired within the timeout"""
+
+
+# Lock-wait metrics per store path, shared by all threads in the process
+_lock_metrics: Dict[str, Dict[str, float]] = {}
+_lock_metrics_guard = threading.Lock()
+
+
+def _record_lock_wait(path: str, waited: float, timed_out: bool = False):
+    with _lock_metrics_guard:
+        stats = _lock_metrics.setdefault(path, {
+            "acquisitions": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0
+        })
+        if timed_out:
+            stats["timeouts"] += 1
+        else:
+            stats["acquisitions"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+
+def get_lock_metrics() -> Dict[str, Dict[str, float]]:
+    """Snapshot of lock acquisitions, timeouts and wait times (seconds) per store path"""
+    with _lock_metrics_guard:
+        return {path: dict(stats) for path, stats in _lock_metrics.items()}
+
+
+# Shared change-version counters, bumped on every write (see state_store.StateStore)
+_version_tracker = None
+
+
+def set_version_tracker(tracker):
+    """Register an object with a `bump_version(name)` method to be called after every store write"""
+    global _version_tracker
+    _version_tracker = tracker
+
+
+def _bump_version(path: str) -> Optional[int]:
+    if _version_tracker is None:
+        return None
+    return _version_tracker.bump_version(path)
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = DEFAULT_LOCK_TIMEOUT):
+    """Hold an exclusive advisory lock on `path` across processes.
+
+    The lock is taken on a `<path>.lock` sidecar so that it survives the data
+    file being atomically replaced. Each store has its own lock, so writers to
+    different files never wait on each other.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    lock_path = f"{path}.lock"
+    started = time.monotonic()
+    with open(lock_path, 'a') as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                waited = time.monotonic() - started
+                if waited >= timeout:
+                    _record_lock_wait(path, waited, timed_out=True)
+                    raise LockTimeout(f"Timed out after {waited:.1f}s waiting for lock on {path}")
+                time.sleep(LOCK_POLL_INTERVAL)
+        _record_lock_wait(path, time.monotonic() - started)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def store_label(path: str) -> str:
+    """Low-cardinality metrics label for a store: its directory (user_data, cases, ...)"""
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+
+# Serialization shared by every store
+def encode_json(data: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """UTF-8 JSON for `data`, compact unless `indent`"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, ensure_ascii=False, sort_keys=sort_keys,
+                      indent=2 if indent else None, separators=None if indent else (",", ":")).encode("utf-8")
+
+
+def decode_json(content) -> Any:
+    """Parse JSON from bytes or str"""
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+def encode_store(data: Any) -> bytes:
+    """Contents of a store file: compact JSON, or a compressed msgpack snapshot for large stores"""
+    if SNAPSHOT_MIN_KB and msgpack is not None and zstandard is not None:
+        packed = msgpack.packb(data)
+        if len(packed) >= SNAPSHOT_MIN_KB * 1024:
+            return zstandard.ZstdCompressor(level=SNAPSHOT_LEVEL).compress(packed)
+    return encode_json(data)
+
+
+def decode_store(content: bytes) -> Any:
+    """Parse a store file written by encode_store, whichever format it is in"""
+    if content[:4] == SNAPSHOT_MAGIC:
+        if msgpack is None or zstandard is None:
+            raise ValueError("Store is a msgpack snapshot but msgpack and zstandard are not installed")
+        return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(content), strict_map_key=False)
+    return decode_json(content)
+
+
+def compress_json(data: Any) -> bytes:
+    """Compact JSON compressed with zstd when installed, gzip otherwise"""
+    encoded = encode_json(data)
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=SNAPSHOT_LEVEL).compress(encoded)
+    return gzip.compress(encoded, compresslevel=6)
+
+
+def decompress_json(content: bytes) -> Any:
+    """Parse JSON written by compress_json, whichever compression it used"""
+    if content[:2] == GZIP_MAGIC:
+        return decode_json(gzip.decompress(content))
+    if zstandard is None:
+        raise ValueError("File is zstd-compressed but zstandard is not installed")
+    return decode_json(zstandard.ZstdDecompressor().decompress(content))
+
+
+def _atomic_write_json(path: str, data: Any, indent: bool = False):
+    # Indented files are meant to be read and edited by people, so they are never snapshots
+    _atomic_write(path, encode_json(data, indent=True) if indent else encode_store(data))
+
+
+def _atomic_write(path: str, encoded: bytes, label: Optional[str] = None):
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        # mkstemp creates files readable only by the owner; keep the permissions of the file being replaced
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        record_bytes("write", label or store_label(path), len(encoded))
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """Read a JSON store, returning `default` if it does not exist.
+
+    Writers always replace the file atomically, so readers see either the old
+    or the new version and never need to take the lock.
+    """
+    if not os.path.exists(path):
+        return default
+    with timer("storage_read", store=store_label(path)):
+        with open(path, 'rb') as f:
+            content = f.read()
+        record_bytes("read", store_label(path), len(content))
+        return decode_store(content)
+
+
+def write_compressed_json(path: str, data: Any) -> int:
+    """Write a compressed JSON file atomically (see compress_json) and return its size in bytes"""
+    encoded = compress_json(data)
+    with timer("storage_write", store=COMPRESSED_STORE_LABEL):
+        _atomic_write(path, encoded, COMPRESSED_STORE_LABEL)
+    return len(encoded)
+
+
+def read_compressed_json(path: str, default: Any = None) -> Any:
+    """Read a file written by write_compressed_json, returning `default` if it does not exist"""
+    if not os.path.exists(path):
+        return default
+    with timer("storage_read", store=COMPRESSED_STORE_LABEL):
+        with open(path, 'rb') as f:
+            content = f.read()
+        record_bytes("read", COMPRESSED_STORE_LABEL, len(content))
+        return decompress_json(content)
+
+
+def write_json(path: str, data: Any, timeout: float = DEFAULT_LOCK_TIMEOUT, indent: bool = False,
+               merge: Optional[Callable[[Any, Any], Any]] = None) -> Optional[int]:
+    """Replace a JSON store atomically while holding its lock. Returns the store's new change version.
+
+    With `merge`, `merge(current, data)` is written instead of `data`, where `current` is the
+    store's contents under the lock (None if it does not exist).
+    """
+    with timer("storage_write", store=store_label(path)), file_lock(path, timeout):
+        if merge is not None:
+            data = merge(read_json(path), data)
+        _atomic_write_json(path, data, indent)
+        return _bump_version(path)
+
+
+def update_json(path: str, mutate: Callable[[Any], Any], default_factory: Callable[[], Any] = dict,
+                timeout: float = DEFAULT_LOCK_TIMEOUT, indent: bool = False,
+                after_write: Optional[Callable[[Any], Any]] = None) -> Any:
+    """Read-modify-write a JSON store under its lock.
+
+    `mutate` receives the current contents (or `default_factory()` if the file
+    does not exist) and modifies them in place. If it returns False the store
+    is left as it was; any other return value is ignored. `after_write`, if
+    given, is called with the contents once they are written, still under the
+    lock. The stored contents are returned.
+    """
+    with timer("storage_update", store=store_label(path)), file_lock(path, timeout):
+        data = read_json(path)
+        if data is None:
+            data = default_factory()
+        if mutate(data) is False:
+            return data
+        _atomic_write_json(path, data, indent)
+        _bump_version(path)
+        if after_write is not None:
+            after_write(data)
+        return data
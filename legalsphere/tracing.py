@@ -0,0 +1,213 @@
+import os
+import uuid
+import queue
+import atexit
+import random
+import datetime
+import threading
+import functools
+from typing import Dict, Optional
+
+from metrics import REGISTRY
+
+
+class TracingConfig:
+    """Environment-driven tracing settings.
+
+    LEGALSPHERE_TRACING             "off" disables tracing entirely (default "on")
+    LANGFUSE_SECRET_KEY, LANGFUSE_PUBLIC_KEY
+                                    Langfuse project keys; tracing is off unless both are set
+    LEGALSPHERE_TRACE_SAMPLE_RATE   default sampling rate for traced methods (default 1.0)
+    LEGALSPHERE_TRACE_SAMPLE_RATES  per-method overrides, e.g. "list_agents=0.05,send_message=1"
+    LEGALSPHERE_TRACE_QUEUE_SIZE    events buffered for the background sender before dropping
+    """
+
+    def __init__(self, environ=os.environ):
+        self.default_rate = float(environ.get("LEGALSPHERE_TRACE_SAMPLE_RATE", "1.0"))
+        self.rates: Dict[str, float] = {}
+        for item in environ.get("LEGALSPHERE_TRACE_SAMPLE_RATES", "").split(","):
+            if "=" in item:
+                name, rate = item.split("=", 1)
+                self.rates[name.strip()] = float(rate)
+        self.queue_size = int(environ.get("LEGALSPHERE_TRACE_QUEUE_SIZE", "1000"))
+        self.batch_size = int(environ.get("LEGALSPHERE_TRACE_BATCH_SIZE", "50"))
+        self.flush_interval = float(environ.get("LEGALSPHERE_TRACE_FLUSH_INTERVAL", "5"))
+        self.secret_key = environ.get("LANGFUSE_SECRET_KEY", "")
+        self.public_key = environ.get("LANGFUSE_PUBLIC_KEY", "")
+        self.host = environ.get("LANGFUSE_HOST", "https://us.cloud.langfuse.com")
+        # Without project keys there is nowhere to send traces, so the decorator becomes a pass-through
+        self.enabled = (
+            environ.get("LEGALSPHERE_TRACING", "on").lower() not in ("off", "0", "false", "no")
+            and bool(self.secret_key and self.public_key)
+        )
+
+    def sample_rate(self, name: str) -> float:
+        return self.rates.get(name, self.default_rate) if self.enabled else 0.0
+
+
+class LangfuseExporter:
+    """Ships finished observations to Langfuse from a background thread.
+
+    The request path only does a non-blocking put on a bounded queue; when the
+    queue is full the event is dropped and counted instead of waiting.
+    """
+
+    def __init__(self, config: TracingConfig):
+        self.config = config
+        self.queue = queue.Queue(maxsize=config.queue_size)
+        self._client = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, event: dict):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(event)
+            REGISTRY.increment("trace_events_total", 1, {"outcome": "queued"})
+        except queue.Full:
+            REGISTRY.increment("trace_events_total", 1, {"outcome": "dropped"})
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="langfuse-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _langfuse(self):
+        if self._client is None:
+            # Imported here so processes with tracing disabled never load the SDK
+            from langfuse import Langfuse
+            self._client = Langfuse(
+                secret_key=self.config.secret_key,
+                public_key=self.config.public_key,
+                host=self.config.host
+            )
+        return self._client
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.config.flush_interval))
+                while len(batch) < self.config.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._send(batch)
+
+    def _send(self, batch):
+        try:
+            client = self._langfuse()
+            for event in batch:
+                self._send_event(client, event)
+            client.flush()
+            REGISTRY.increment("trace_events_total", len(batch), {"outcome": "sent"})
+        except Exception as e:
+            REGISTRY.increment("trace_events_total", len(batch), {"outcome": "failed"})
+            print(f"Error sending traces to Langfuse: {str(e)}")
+
+    def _send_event(self, client, event: dict):
+        if event["parent_id"] is None:
+            client.trace(
+                id=event["trace_id"],
+                name=event["name"],
+                input=event["input"],
+                output=event["output"],
+                timestamp=event["start_time"]
+            )
+        client.span(
+            id=event["id"],
+            trace_id=event["trace_id"],
+            parent_observation_id=event["parent_id"],
+            name=event["name"],
+            start_time=event["start_time"],
+            end_time=event["end_time"],
+            input=event["input"],
+            output=event["output"],
+            level="ERROR" if event["error"] else "DEFAULT",
+            status_message=event["error"]
+        )
+        if event["score"]:
+            client.score(trace_id=event["trace_id"], **event["score"])
+
+    def flush(self, timeout: float = 5.0):
+        """Send whatever is queued, waiting at most `timeout` seconds (used at exit)"""
+        batch = []
+        try:
+            while True:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if batch:
+            sender = threading.Thread(target=self._send, args=(batch,), daemon=True)
+            sender.start()
+            sender.join(timeout)
+
+
+CONFIG = TracingConfig()
+EXPORTER = LangfuseExporter(CONFIG)
+
+# Observation stack of the current thread, so nested traced calls become child spans
+_active = threading.local()
+
+
+def traced(name: Optional[str] = None, score: Optional[dict] = None):
+    """Trace a method to Langfuse, sampled per method and exported off the request path.
+
+    Nested traced calls inherit their root's sampling decision and become child
+    spans. `score` is attached to the trace when the call succeeds.
+    """
+    def decorator(func):
+        observation_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = getattr(_active, "stack", None)
+            if stack is None:
+                stack = _active.stack = []
+
+            if stack:
+                parent = stack[-1]
+                if parent is None:  # Inside an unsampled trace
+                    return func(*args, **kwargs)
+                trace_id, parent_id = parent["trace_id"], parent["id"]
+            else:
+                rate = CONFIG.sample_rate(observation_name)
+                if rate <= 0 or (rate < 1 and random.random() >= rate):
+                    stack.append(None)
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        stack.pop()
+                trace_id, parent_id = str(uuid.uuid4()), None
+
+            event = {
+                "id": str(uuid.uuid4()),
+                "trace_id": trace_id,
+                "parent_id": parent_id,
+                "name": observation_name,
+                "input": {"args": args[1:], "kwargs": kwargs},  # args[0] is the client instance
+                "output": None,
+                "error": None,
+                "score": None,
+                "start_time": datetime.datetime.now(datetime.timezone.utc)
+            }
+            stack.append(event)
+            try:
+                result = func(*args, **kwargs)
+                event["output"] = result
+                event["score"] = score
+                return result
+            except Exception as e:
+                event["error"] = str(e)
+                raise
+            finally:
+                stack.pop()
+                event["end_time"] = datetime.datetime.now(datetime.timezone.utc)
+                EXPORTER.submit(event)
+        return wrapper
+    return decorator
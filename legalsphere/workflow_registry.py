@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+from metrics import REGISTRY
+from storage import decode_json
+
+TEMPLATE_CHECK_INTERVAL = float(os.environ.get("LEGALSPHERE_WORKFLOW_CHECK_SECONDS", "2"))
+
+
+class WorkflowTemplateError(ValueError):
+    """Raised when a workflow template does not match the template schema"""
+
+
+def validate_template(template) -> dict:
+    """Check a workflow template's schema and return it unchanged"""
+    if not isinstance(template, dict):
+        raise WorkflowTemplateError("template must be a JSON object")
+    for field in ("name", "description"):
+        if not isinstance(template.get(field), str) or not template[field].strip():
+            raise WorkflowTemplateError(f"'{field}' must be a non-empty string")
+    stages = template.get("stages")
+    if not isinstance(stages, list) or not stages:
+        raise WorkflowTemplateError("'stages' must be a non-empty list")
+    stage_ids = set()
+    for index, stage in enumerate(stages):
+        if not isinstance(stage, dict):
+            raise WorkflowTemplateError(f"stage {index} must be a JSON object")
+        for field in ("id", "name", "description"):
+            if not isinstance(stage.get(field), str):
+                raise WorkflowTemplateError(f"stage {index}: '{field}' must be a string")
+        if stage["id"] in stage_ids:
+            raise WorkflowTemplateError(f"stage {index}: duplicate stage id '{stage['id']}'")
+        stage_ids.add(stage["id"])
+        if stage.get("prompt") is not None and not isinstance(stage["prompt"], str):
+            raise WorkflowTemplateError(f"stage {index}: 'prompt' must be a string")
+        due_days = stage.get("due_days")
+        if due_days is not None and (isinstance(due_days, bool) or not isinstance(due_days, (int, float))
+                                     or due_days <= 0):
+            raise WorkflowTemplateError(f"stage {index}: 'due_days' must be a positive number")
+    return template
+
+
+class WorkflowTemplateRegistry:
+    """Built-in and custom workflow templates, loaded once and reloaded per file.
+
+    Custom templates are the JSON files in `directory`, with the file name
+    (without .json) as the template id; they override built-in templates of the
+    same id. At most every `check_interval` seconds the directory is listed and
+    only files whose mtime or size changed are parsed and validated again.
+    Invalid files are skipped and reported in `errors`.
+    """
+
+    def __init__(self, directory: str, defaults: Optional[Dict[str, dict]] = None,
+                 check_interval: float = TEMPLATE_CHECK_INTERVAL):
+        self.directory = directory
+        self.defaults = {template_id: validate_template(template) for template_id, template in (defaults or {}).items()}
+        self.check_interval = check_interval
+        self.errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._files: Dict[str, tuple] = {}  # filename -> (mtime_ns, size, template or None)
+        self._templates: Dict[str, dict] = dict(self.defaults)
+        self._checked_at = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        seen, changed = set(), False
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.name.endswith(".json") and entry.is_file()]
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            seen.add(entry.name)
+            stat = entry.stat()
+            cached = self._files.get(entry.name)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            template = None
+            try:
+                with open(entry.path, 'rb') as f:
+                    template = validate_template(decode_json(f.read()))
+                self.errors.pop(entry.name, None)
+            except (OSError, ValueError) as e:
+                self.errors[entry.name] = str(e)
+                print(f"Error loading workflow template {entry.name}: {str(e)}")
+            self._files[entry.name] = (stat.st_mtime_ns, stat.st_size, template)
+            REGISTRY.increment("workflow_template_loads_total", 1, {"result": "ok" if template else "invalid"})
+            changed = True
+        for filename in set(self._files) - seen:
+            del self._files[filename]
+            self.errors.pop(filename, None)
+            changed = True
+
+        if changed:
+            templates = dict(self.defaults)
+            for filename, (_, _, template) in sorted(self._files.items()):
+                if template is not None:
+                    templates[os.path.splitext(filename)[0]] = template
+            self._templates = templates
+
+    def all(self) -> Dict[str, dict]:
+        """Every valid template by id"""
+        with self._lock:
+            self._refresh()
+            return dict(self._templates)
+
+    def get(self, template_id: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            return self._templates.get(template_id)
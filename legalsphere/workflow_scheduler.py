@@ -0,0 +1,324 @@
+import os
+import time
+import uuid
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from message_store import MessageStore
+from metrics import REGISTRY, timed
+from panel import PanelConsultation, extract_reply
+from stage_analytics import StageAnalytics
+from workflow_store import WorkflowStore
+
+WORKFLOW_CONCURRENCY = int(os.environ.get("LEGALSPHERE_WORKFLOW_CONCURRENCY", "4"))  # Stage runs at once, all processes
+WORKFLOW_POLL_SECONDS = float(os.environ.get("LEGALSPHERE_WORKFLOW_POLL_SECONDS", "30"))
+# "start-end" hours in local time when automated stages may run, e.g. "22-6" for overnight; empty for any time
+WORKFLOW_RUN_HOURS = os.environ.get("LEGALSPHERE_WORKFLOW_RUN_HOURS", "")
+WORKFLOW_MAX_ATTEMPTS = 3
+WORKFLOW_RETRY_SECONDS = 300  # Doubled after each failed attempt
+STAGE_RUN_LEASE_SECONDS = 1800  # A run still marked running after this long is assumed lost and run again
+DOCUMENT_EXCERPT_CHARS = 4000
+TEXT_DOCUMENT_EXTENSIONS = (".txt", ".md", ".csv", ".json")
+
+STAGE_PROMPT = """You are carrying out the "{stage_name}" stage of the "{workflow_name}" workflow for the case "{case_title}".
+Stage goal: {stage_description}
+
+{instructions}
+
+# Case documents
+{documents}
+
+# Notes from earlier stages
+{previous_notes}
+
+Write the output of this stage. It will be saved as the stage notes."""
+
+
+def set_stage_status(workflow: dict, stage_index: int, new_status: str, timestamp: str) -> List[Tuple[int, str, str]]:
+    """Change a stage's status, advancing to the next stage when it is completed.
+
+    Returns (stage index, old status, new status) for the stage and, if it advanced, the next stage.
+    """
+    stage = workflow["stages"][stage_index]
+    old_status = stage["status"]
+    stage["status"] = new_status
+    changes = [(stage_index, old_status, new_status)]
+
+    # Set appropriate dates
+    if new_status == "in_progress" and not stage["start_date"]:
+        stage["start_date"] = timestamp
+    elif new_status == "completed" and not stage["completion_date"]:
+        stage["completion_date"] = timestamp
+
+    # If this stage is completed, move to the next stage
+    if new_status == "completed" and stage_index < len(workflow["stages"]) - 1:
+        workflow["current_stage_index"] = stage_index + 1
+        # Set the next stage to in_progress
+        next_stage = workflow["stages"][stage_index + 1]
+        changes.append((stage_index + 1, next_stage["status"], "in_progress"))
+        next_stage["status"] = "in_progress"
+        next_stage["start_date"] = timestamp
+    return changes
+
+
+def _epoch(timestamp: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def stage_transitions(case_id: str, case: dict, changes: List[Tuple[int, str, str]], actor: Optional[str],
+                      timestamp: str) -> List[dict]:
+    """Stage transition events, with epoch times, for the status changes made by set_stage_status.
+
+    Only a stage's first completion (the one that set its completion_date) carries a duration, so a
+    stage reopened and completed again is counted once in the duration and throughput rollups.
+    """
+    workflow = case["workflow"]
+    occurred_at = _epoch(timestamp) or time.time()
+    transitions = []
+    for stage_index, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        stage = workflow["stages"][stage_index]
+        started_at = _epoch(stage.get("start_date"))
+        transitions.append({
+            "case_id": case_id,
+            "workflow_name": workflow["name"],
+            "stage_name": stage["name"],
+            "from_status": old_status,
+            "to_status": new_status,
+            "actor": actor,
+            "owner": case.get("creator"),
+            "occurred_at": occurred_at,
+            "seconds_in_stage": max(0.0, occurred_at - started_at)
+            if new_status == "completed" and started_at is not None and stage.get("completion_date") == timestamp
+            else None
+        })
+    return transitions
+
+
+def parse_run_hours(spec: str) -> Optional[tuple]:
+    if not spec.strip():
+        return None
+    start, end = spec.split("-", 1)
+    return int(start) % 24, int(end) % 24
+
+
+def in_run_window(hours: Optional[tuple], now: Optional[datetime.datetime] = None) -> bool:
+    if hours is None:
+        return True
+    hour = (now or datetime.datetime.now()).hour
+    start, end = hours
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+
+def _document_text(document: dict) -> str:
+    path = document.get("file_path")
+    if not path or not path.lower().endswith(TEXT_DOCUMENT_EXTENSIONS):
+        return ""
+    try:
+        with open(path, 'r', errors="replace") as f:
+            return f.read(DOCUMENT_EXCERPT_CHARS)
+    except OSError:
+        return ""
+
+
+def build_stage_prompt(case: dict, stage_index: int) -> str:
+    """The message sent to the case's agents to carry out an automated stage"""
+    workflow = case["workflow"]
+    stage = workflow["stages"][stage_index]
+    documents = []
+    for document in case.get("documents", []):
+        entry = f"- {document.get('name', document.get('filename', 'Document'))}"
+        excerpt = _document_text(document)
+        if excerpt:
+            entry += f"\n{excerpt}"
+        documents.append(entry)
+    previous_notes = [
+        f"## {earlier['name']}\n{earlier['notes']}"
+        for earlier in workflow["stages"][:stage_index] if earlier.get("notes")
+    ]
+    return STAGE_PROMPT.format(
+        stage_name=stage["name"],
+        workflow_name=workflow["name"],
+        case_title=case.get("title", ""),
+        stage_description=stage.get("description", ""),
+        instructions=stage["prompt"],
+        documents="\n\n".join(documents) or "No documents.",
+        previous_notes="\n\n".join(previous_notes) or "None."
+    )
+
+
+class WorkflowScheduler:
+    """Runs automated workflow stages with the case's agents in the background.
+
+    A stage runs automatically when its workflow was assigned in automated mode
+    and the stage template declares a `prompt`. Runs are queued in the state
+    store and claimed there, so each runs once across processes, and at most
+    `concurrency` run at the same time overall. The prompt goes to every case
+    agent concurrently (one agent's answer is used as-is, several answers are
+    combined by the first agent); the result becomes the stage notes and the
+    workflow advances, queueing the next stage if it is automated too. Failed
+    runs are retried with backoff. `load_case(owner, case_id)` and
+    `update_case(owner, case_id, mutate)` read and change stored cases.
+    """
+
+    def __init__(self, client, state_store, load_case: Callable, update_case: Callable,
+                 concurrency: int = WORKFLOW_CONCURRENCY, poll_interval: float = WORKFLOW_POLL_SECONDS,
+                 run_hours: str = WORKFLOW_RUN_HOURS):
+        self.client = client
+        self.state_store = state_store
+        self.workflow_store = WorkflowStore(state_store)
+        self.message_store = MessageStore(state_store)
+        self.stage_analytics = StageAnalytics(state_store)
+        self.load_case = load_case
+        self.update_case = update_case
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.run_hours = parse_run_hours(run_hours)
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="workflow-stage")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="workflow-scheduler", daemon=True)
+            self._thread.start()
+
+    def request_run(self):
+        self._wake.set()
+
+    def schedule_current_stage(self, case_id: str, case: dict) -> bool:
+        """Queue the case's current stage if its workflow is automated and the stage has a prompt"""
+        workflow = case.get("workflow")
+        if not workflow or not workflow.get("automated") or not workflow["stages"]:
+            return False
+        stage_index = workflow["current_stage_index"]
+        stage = workflow["stages"][stage_index]
+        if stage["status"] == "completed" or not stage.get("prompt"):
+            return False
+        self.workflow_store.enqueue_workflow_run(case_id, stage_index, case.get("creator"))
+        self.request_run()
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"Error scheduling workflow stages: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def dispatch(self) -> int:
+        """Claim queued stage runs up to the concurrency limit and start them"""
+        if not in_run_window(self.run_hours):
+            return 0
+        with self._lock:
+            free = self.concurrency - self._in_flight
+        if free <= 0:
+            return 0
+        runs = self.workflow_store.claim_workflow_runs(self.worker_id, free, self.concurrency, STAGE_RUN_LEASE_SECONDS)
+        with self._lock:
+            self._in_flight += len(runs)
+        for run in runs:
+            self._executor.submit(self._execute, run)
+        return len(runs)
+
+    def _execute(self, run: dict):
+        try:
+            status = self.run_stage(run)
+            self.workflow_store.finish_workflow_run(run["case_id"], run["stage_index"], status)
+        except Exception as e:
+            attempts = run["attempts"] + 1
+            retry_at = time.time() + WORKFLOW_RETRY_SECONDS * 2 ** (attempts - 1)
+            final = attempts >= WORKFLOW_MAX_ATTEMPTS
+            print(f"Error running workflow stage {run['stage_index']} of case {run['case_id']}: {str(e)}")
+            self.workflow_store.finish_workflow_run(run["case_id"], run["stage_index"], "failed" if final else "pending",
+                                                 error=str(e), retry_at=None if final else retry_at)
+            REGISTRY.increment("workflow_stage_runs_total", 1, {"result": "failed" if final else "retry"})
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self.request_run()
+
+    def claim_stage_messages(self, agent_id: str, case_id: str, stage_index: int, response):
+        """Claim a stage run's Letta messages for the scheduler, so message sync never copies them into a chat"""
+        message_ids = [message["id"] for message in (response or {}).get("messages", []) if message.get("id")]
+        if message_ids:
+            self.message_store.claim_messages(agent_id, f"workflow-stage:{case_id}:{stage_index}", message_ids)
+
+    @timed("workflow_stage_run")
+    def run_stage(self, run: dict) -> str:
+        """Run one claimed stage and return its final run status"""
+        case_id, stage_index = run["case_id"], run["stage_index"]
+        case = self.load_case(run["owner"], case_id)
+        workflow = (case or {}).get("workflow")
+        if (not workflow or workflow["current_stage_index"] != stage_index
+                or workflow["stages"][stage_index]["status"] == "completed"):
+            # Case deleted or stage finished by hand since the run was queued
+            REGISTRY.increment("workflow_stage_runs_total", 1, {"result": "cancelled"})
+            return "cancelled"
+        agent_ids = case.get("agents", [])
+        if not agent_ids:
+            raise RuntimeError("The case has no agents to run the stage")
+
+        prompt = build_stage_prompt(case, stage_index)
+        panel = PanelConsultation(self.client)
+        if len(agent_ids) == 1:
+            response = self.client.send_message(agent_ids[0], prompt)
+            self.claim_stage_messages(agent_ids[0], case_id, stage_index, response)
+            output = extract_reply(response)["content"]
+        else:
+            replies = {agent_id: reply for agent_id, (reply, error) in panel.ask_all(agent_ids, prompt).items()
+                       if reply is not None}
+            for agent_id, reply in replies.items():
+                self.claim_stage_messages(agent_id, case_id, stage_index, reply["response"])
+            if not replies:
+                raise RuntimeError("No case agent answered")
+            agents = self.client.get_agents(list(replies))
+            aggregated = panel.aggregate(agent_ids[0], prompt, {
+                agents.get(agent_id, {}).get("name") or f"Agent {agent_id}": reply["content"]
+                for agent_id, reply in replies.items()
+            })
+            self.claim_stage_messages(agent_ids[0], case_id, stage_index, aggregated["response"])
+            output = aggregated["content"]
+
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        changes = []
+        def complete_stage(stored_case):
+            stored_workflow = stored_case.get("workflow")
+            if (not stored_workflow or stored_workflow["current_stage_index"] != stage_index
+                    or stored_workflow["stages"][stage_index]["status"] == "completed"):
+                return False
+            stored_workflow["stages"][stage_index]["notes"] = output
+            changes[:] = set_stage_status(stored_workflow, stage_index, "completed", timestamp)
+            return True
+
+        updated = self.update_case(run["owner"], case_id, complete_stage)
+        if updated is None:
+            REGISTRY.increment("workflow_stage_runs_total", 1, {"result": "cancelled"})
+            return "cancelled"
+
+        self.state_store.append_audit_event({
+            "timestamp": timestamp,
+            "username": "workflow-scheduler",
+            "role": "system",
+            "action": "run_workflow_stage",
+            "details": {"case_id": case_id, "stage_name": workflow["stages"][stage_index]["name"],
+                        "agents": agent_ids},
+            "ip_address": "127.0.0.1"
+        })
+        self.stage_analytics.record_stage_transitions(
+            stage_transitions(case_id, updated, changes, "workflow-scheduler", timestamp)
+        )
+        REGISTRY.increment("workflow_stage_runs_total", 1, {"result": "done"})
+        self.schedule_current_stage(case_id, updated)
+        return "done"
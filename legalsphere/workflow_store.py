@@ -0,0 +1,198 @@
+import time
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+from state_store import StateStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflow_progress (
+    case_id TEXT PRIMARY KEY,
+    title TEXT,
+    owner TEXT,
+    workflow_name TEXT,
+    current_stage TEXT,
+    current_status TEXT,
+    completed_stages INTEGER NOT NULL,
+    total_stages INTEGER NOT NULL,
+    stage_started_at REAL,
+    stage_due_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_workflow_progress_stage ON workflow_progress (workflow_name, current_stage);
+CREATE TABLE IF NOT EXISTS workflow_runs (
+    case_id TEXT NOT NULL,
+    stage_index INTEGER NOT NULL,
+    owner TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    error TEXT,
+    PRIMARY KEY (case_id, stage_index)
+);
+CREATE INDEX IF NOT EXISTS idx_workflow_runs_status ON workflow_runs (status, not_before);
+"""
+
+WORKFLOW_PROGRESS_COLUMNS = ("title", "owner", "workflow_name", "current_stage", "current_status",
+                             "completed_stages", "total_stages", "stage_started_at", "stage_due_at")
+
+
+class WorkflowStore:
+    """Per-case workflow progress for the portfolio dashboard, and the queue of automated stage runs"""
+
+    def __init__(self, state_store: StateStore):
+        self.state_store = state_store
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.state_store.connection()
+
+    # Workflow progress aggregates
+    def _workflow_progress_rows(self, progress: Dict[str, Dict[str, Any]]):
+        now = time.time()
+        return [
+            (case_id, *(row.get(column) for column in WORKFLOW_PROGRESS_COLUMNS), now)
+            for case_id, row in progress.items()
+        ]
+
+    def upsert_workflow_progress(self, case_id: str, row: Dict[str, Any]):
+        """Publish the workflow progress of one case, replacing its previous row"""
+        columns = ", ".join(WORKFLOW_PROGRESS_COLUMNS)
+        placeholders = ", ".join("?" for _ in WORKFLOW_PROGRESS_COLUMNS)
+        self._connection().execute(
+            f"INSERT OR REPLACE INTO workflow_progress (case_id, {columns}, updated_at) "
+            f"VALUES (?, {placeholders}, ?)",
+            self._workflow_progress_rows({case_id: row})[0]
+        )
+
+    def delete_workflow_progress(self, case_ids: Iterable[str]):
+        self._connection().executemany(
+            "DELETE FROM workflow_progress WHERE case_id = ?", [(case_id,) for case_id in case_ids]
+        )
+
+    def import_workflow_progress(self, progress: Dict[str, Dict[str, Any]]) -> int:
+        """One-time backfill of {case_id: row}, skipped once any progress rows exist"""
+        columns = ", ".join(WORKFLOW_PROGRESS_COLUMNS)
+        placeholders = ", ".join("?" for _ in WORKFLOW_PROGRESS_COLUMNS)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM workflow_progress LIMIT 1").fetchone():
+                conn.execute("COMMIT")
+                return 0
+            conn.executemany(
+                f"INSERT OR REPLACE INTO workflow_progress (case_id, {columns}, updated_at) "
+                f"VALUES (?, {placeholders}, ?)",
+                self._workflow_progress_rows(progress)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(progress)
+
+    def get_portfolio_totals(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Number of cases with a workflow, with every stage completed, and with an overdue stage"""
+        now = time.time() if now is None else now
+        cases, completed, overdue = self._connection().execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(current_status = 'completed'), 0), "
+            "COALESCE(SUM(current_status != 'completed' AND stage_due_at < ?), 0) "
+            "FROM workflow_progress",
+            (now,)
+        ).fetchone()
+        return {"cases": cases, "completed": completed, "overdue": overdue}
+
+    def get_stage_summary(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Cases per workflow and current stage, with their mean time in that stage and how many are overdue"""
+        now = time.time() if now is None else now
+        rows = self._connection().execute(
+            "SELECT workflow_name, "
+            "CASE WHEN current_status = 'completed' THEN 'Completed' ELSE current_stage END AS stage, "
+            "COUNT(*), AVG(CASE WHEN current_status != 'completed' THEN ? - stage_started_at END), "
+            "SUM(current_status != 'completed' AND stage_due_at < ?) "
+            "FROM workflow_progress GROUP BY workflow_name, stage ORDER BY workflow_name, stage",
+            (now, now)
+        ).fetchall()
+        return [
+            {"workflow": workflow, "stage": stage, "cases": cases,
+             "mean_seconds_in_stage": mean_seconds, "overdue": overdue or 0}
+            for workflow, stage, cases, mean_seconds, overdue in rows
+        ]
+
+    def get_overdue_stages(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Cases whose current stage is past its due time, most overdue first"""
+        now = time.time() if now is None else now
+        rows = self._connection().execute(
+            "SELECT case_id, title, owner, workflow_name, current_stage, stage_started_at, stage_due_at "
+            "FROM workflow_progress WHERE current_status != 'completed' AND stage_due_at < ? "
+            "ORDER BY stage_due_at",
+            (now,)
+        ).fetchall()
+        return [
+            {"case_id": case_id, "title": title, "owner": owner, "workflow": workflow, "stage": stage,
+             "stage_started_at": started_at, "stage_due_at": due_at}
+            for case_id, title, owner, workflow, stage, started_at, due_at in rows
+        ]
+
+    # Automated workflow stage runs
+    def enqueue_workflow_run(self, case_id: str, stage_index: int, owner: Optional[str]):
+        """Queue a stage run, or requeue it if it already ran or failed (a running stage is left alone)"""
+        self._connection().execute(
+            "INSERT INTO workflow_runs (case_id, stage_index, owner, status, attempts, not_before) "
+            "VALUES (?, ?, ?, 'pending', 0, ?) "
+            "ON CONFLICT(case_id, stage_index) DO UPDATE SET status = 'pending', attempts = 0, "
+            "not_before = excluded.not_before, owner = excluded.owner, error = NULL "
+            "WHERE workflow_runs.status != 'running'",
+            (case_id, stage_index, owner, time.time())
+        )
+
+    def claim_workflow_runs(self, worker: str, limit: int, max_running: int,
+                            lease_seconds: float) -> List[Dict[str, Any]]:
+        """Atomically take up to `limit` due runs while keeping at most `max_running` running overall.
+
+        Runs claimed longer than `lease_seconds` ago are considered abandoned and can be claimed again.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE workflow_runs SET status = 'pending' WHERE status = 'running' AND claimed_at < ?",
+                (now - lease_seconds,)
+            )
+            running = conn.execute("SELECT COUNT(*) FROM workflow_runs WHERE status = 'running'").fetchone()[0]
+            rows = conn.execute(
+                "UPDATE workflow_runs SET status = 'running', claimed_by = ?, claimed_at = ? "
+                "WHERE rowid IN (SELECT rowid FROM workflow_runs WHERE status = 'pending' AND not_before <= ? "
+                "ORDER BY not_before LIMIT ?) RETURNING case_id, stage_index, owner, attempts",
+                (worker, now, now, max(0, min(limit, max_running - running)))
+            ).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            {"case_id": case_id, "stage_index": stage_index, "owner": owner, "attempts": attempts}
+            for case_id, stage_index, owner, attempts in rows
+        ]
+
+    def finish_workflow_run(self, case_id: str, stage_index: int, status: str, error: Optional[str] = None,
+                            retry_at: Optional[float] = None):
+        """Record a run's outcome; status "pending" with `retry_at` schedules another attempt"""
+        self._connection().execute(
+            "UPDATE workflow_runs SET status = ?, error = ?, attempts = attempts + ?, "
+            "not_before = COALESCE(?, not_before), claimed_by = NULL WHERE case_id = ? AND stage_index = ?",
+            (status, error, 1 if error else 0, retry_at, case_id, stage_index)
+        )
+
+    def get_workflow_runs(self, case_id: str) -> Dict[int, Dict[str, Any]]:
+        """Stage index -> {"status", "attempts", "error"} of a case's automated runs"""
+        rows = self._connection().execute(
+            "SELECT stage_index, status, attempts, error FROM workflow_runs WHERE case_id = ?", (case_id,)
+        ).fetchall()
+        return {
+            stage_index: {"status": status, "attempts": attempts, "error": error}
+            for stage_index, status, attempts, error in rows
+        }